@@ -0,0 +1,296 @@
+"""
+Import benchmark on a fixed corpus of synthetic files
+
+Times the phases of an import separately for every format and size, saves the
+results as JSON and compares them against a stored baseline.
+
+Outside of Blender, from the folder containing the package:
+    python -m io_scene_igz.benchmark --output results.json --baseline baseline.json
+
+--profile adds a per-metatype breakdown of the graph phase, --memory the
+traced memory of every phase.
+
+Inside Blender the build phase is timed too, e.g. for the installed extension:
+    blender -b --python-expr "from bl_ext.user_default.io_scene_igz import benchmark; benchmark.main()" -- --output results.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+import numpy
+
+from . import constants
+from . import formats
+from . import game_formats
+from . import igz_writer
+from . import profiling
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+phases = ("probe", "header", "fixups", "graph", "decode", "build")
+
+# (model count, meshes per model, vertices per mesh, bones)
+corpusSizes = {
+    "small": (1, 4, 500, 8),
+    "medium": (4, 16, 2000, 32),
+    "large": (16, 16, 4000, 64),
+}
+
+# (version, platform, endianness) of each format in the corpus
+corpusFormats = {
+    "ssa": (0x05, 1, "LE"),
+    "sg": (0x06, 1, "LE"),
+    "ssf": (0x07, 1, "LE"),
+    "stt": (0x08, 1, "LE"),
+    "ssc": (0x09, 1, "LE"),
+    "ssc-be": (0x09, 6, "BE"),
+    "ssc-64": (0x09, 8, "LE"),
+}
+
+# Phases faster than this in the baseline are too noisy to flag
+noiseFloor = 0.001
+
+
+def buildCorpus(sizes: List[str], formats: List[str]) -> Dict[str, bytes]:
+    """Synthetic files for every format and size, the same bytes on every run"""
+    corpus = {}
+    for size in sizes:
+        modelCount, meshCount, vertexCount, boneCount = corpusSizes[size]
+        models = igz_writer.makeModels(
+            modelCount, meshCount, vertexCount, boneCount)
+        for name in formats:
+            version, platformId, endianness = corpusFormats[name]
+            corpus[f"{name}-{size}"] = igz_writer.writeIgz(
+                models, version, platformId, endianness)
+    return corpus
+
+
+def loadCorpus(filepaths: List[str]) -> Dict[str, bytes]:
+    corpus = {}
+    for filepath in filepaths:
+        with open(filepath, 'rb') as file:
+            corpus[os.path.basename(filepath)] = file.read()
+    return corpus
+
+
+def timeCall(function: Callable, *args: Any) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def buildModels(parser: Any) -> None:
+    """Build every decoded model into a scratch collection and remove it again"""
+    collection = bpy.data.collections.new("benchmark")
+    bpy.context.scene.collection.children.link(collection)
+    meshCache = formats.getMeshCache(parser.options)
+    try:
+        for index in parser.getModelRange():
+            model = parser.models[index]
+            if len(model.meshes) > 0:
+                model.build(parser, index, collection, meshCache)
+    finally:
+        # Deduplicated objects share their data, remove each datablock once
+        datablocks = {obj.data for obj in collection.objects if obj.data is not None}
+        for obj in list(collection.objects):
+            bpy.data.objects.remove(obj)
+        for data in datablocks:
+            if isinstance(data, bpy.types.Mesh):
+                bpy.data.meshes.remove(data)
+            elif isinstance(data, bpy.types.Armature):
+                bpy.data.armatures.remove(data)
+        bpy.data.collections.remove(collection)
+
+
+def runOnce(data: bytes, options: constants.ImportOptions) -> Dict[str, Optional[float]]:
+    """Time each phase of one import of data"""
+    timings = {}
+    timings["probe"] = timeCall(game_formats.createParser, data, options)
+    parser = game_formats.createParser(data, options)
+
+    # Time the fixups from inside loadHeader, the rest of it is the header
+    fixupTime = [0.0]
+    processFixupSections = parser.processFixupSections
+
+    def timedFixups(*args: Any) -> None:
+        fixupTime[0] += timeCall(processFixupSections, *args)
+
+    parser.processFixupSections = timedFixups
+    headerTime = timeCall(parser.loadHeader)
+    timings["header"] = headerTime - fixupTime[0]
+    timings["fixups"] = fixupTime[0]
+
+    timings["graph"] = timeCall(parser.loadFile)
+
+    def decodeModels() -> None:
+        for index in parser.getModelRange():
+            parser.models[index].decodeMeshes(parser)
+
+    timings["decode"] = timeCall(decodeModels)
+    timings["build"] = timeCall(buildModels, parser) if bpy is not None else None
+
+    vertexCount = 0
+    for model in parser.models:
+        for mesh in model.meshes:
+            vertexCount += len(mesh.vertices)
+    timings["vertices"] = vertexCount
+    return timings
+
+
+def runBenchmark(corpus: Dict[str, bytes], repeat: int, options: constants.ImportOptions) -> Dict[str, Any]:
+    """Best of repeat runs per case and phase, the minimum is the least noisy"""
+    results = {}
+    with open(os.devnull, "w") as devnull:
+        for name, data in corpus.items():
+            runs = []
+            for i in range(repeat):
+                # The parser logs every object it reads
+                with contextlib.redirect_stdout(devnull):
+                    runs.append(runOnce(data, options))
+            result = {"bytes": len(data), "vertices": runs[0]["vertices"]}
+            for phase in phases:
+                values = [run[phase] for run in runs if run[phase] is not None]
+                result[phase] = min(values) if len(values) > 0 else None
+            result["total"] = sum(result[phase] or 0.0 for phase in phases)
+            results[name] = result
+            print(f"{name}: {result['total'] * 1000:.1f} ms")
+    return results
+
+
+def profileCorpus(corpus: Dict[str, bytes], options: constants.ImportOptions) -> profiling.MetatypeProfiler:
+    """Parse every case once more with per-metatype counters, kept out of the timed runs"""
+    profiler = profiling.MetatypeProfiler()
+    with open(os.devnull, "w") as devnull:
+        for data in corpus.values():
+            parser = game_formats.createParser(data, options)
+            profiler.enable(parser)
+            with contextlib.redirect_stdout(devnull):
+                parser.loadFile()
+    return profiler
+
+
+def measureMemory(data: bytes, options: constants.ImportOptions) -> profiling.MemoryReport:
+    """Traced memory of each phase of one import of data"""
+    report = profiling.MemoryReport()
+    report.start()
+    try:
+        parser = game_formats.createParser(data, options)
+        parser.loadHeader()
+        report.phase("header", parser)
+        parser.loadFile()
+        report.phase("graph", parser)
+        for index in parser.getModelRange():
+            parser.models[index].decodeMeshes(parser)
+        report.phase("decode", parser)
+        report.recordMeshes(parser)
+        if bpy is not None:
+            buildModels(parser)
+            report.phase("build", parser)
+    finally:
+        report.stop()
+    return report
+
+
+def getEnvironment() -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "blender": bpy.app.version_string if bpy is not None else None,
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def compareResults(results: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print the change against the baseline and return the regressions"""
+    regressions = []
+    print(f"{'case':<20}{'phase':<10}{'baseline ms':>14}{'current ms':>14}{'change':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for phase in phases + ("total",):
+            old = baseline[name].get(phase)
+            new = result.get(phase)
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old > 0 else 0.0
+            flag = ""
+            if old >= noiseFloor and change > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{name} {phase}")
+            print(f"{name:<20}{phase:<10}{old * 1000:>14.2f}{new * 1000:>14.2f}{change:>+10.1%}{flag}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    if argv is None:
+        # Blender passes its own arguments before "--"
+        argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["small", "medium"],
+                        choices=list(corpusSizes))
+    parser.add_argument("--formats", nargs="+", default=list(corpusFormats),
+                        choices=list(corpusFormats))
+    parser.add_argument("--files", nargs="+", default=[],
+                        help="benchmark these files instead of the synthetic corpus")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--attributes", default="FULL", choices=list(constants.attributePresets),
+                        help="attribute preset to decode")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against this results file")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slowdown relative to the baseline that counts as a regression")
+    parser.add_argument("--memory", action="store_true",
+                        help="print the memory of each phase and the bytes per vertex of each mesh")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="print the time per metatype and write its folded stacks to this file")
+    args = parser.parse_args(argv)
+
+    if len(args.files) > 0:
+        corpus = loadCorpus(args.files)
+    else:
+        corpus = buildCorpus(args.sizes, args.formats)
+
+    options = constants.ImportOptions(
+        attributes=constants.attributePresets[args.attributes])
+    results = runBenchmark(corpus, args.repeat, options)
+
+    if args.profile:
+        profiler = profileCorpus(corpus, options)
+        print(profiler.formatTable())
+        profiler.writeFoldedStacks(args.profile)
+
+    if args.memory:
+        with open(os.devnull, "w") as devnull:
+            for name, data in corpus.items():
+                with contextlib.redirect_stdout(devnull):
+                    report = measureMemory(data, options)
+                print(name)
+                print(report.formatReport())
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"environment": getEnvironment(), "results": results},
+                      file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compareResults(results, baseline, args.threshold)
+        if len(regressions) > 0:
+            print(f"{len(regressions)} regressions over {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
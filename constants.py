@@ -1,14 +1,55 @@
+from dataclasses import dataclass
 from enum import Enum
-from typing import List
-
-dBuildMeshes = True      # Whether to build the meshes or just parse the file
-dBuildBones = True       # Whether to build the bones
-dBuildFaces = True       # Whether to build the index buffer
-dAllowWii = True         # Whether to allow Wii models
-# Offset of the first object to process, -1 means just loop through every object
-dFirstObjectOffset = -1
-# The highest number of models to extract before the user is prompted
-dModelThreshold = 50
+from typing import List, Optional
+
+
+# Mesh attributes decoded by each import preset, attributes outside the set
+# are never read from the vertex streams
+attributePresets = {
+    "FULL": frozenset(("vertices", "faces", "normals", "uvs", "colors", "weights", "boneIndices")),
+    "NO_SKINNING": frozenset(("vertices", "faces", "normals", "uvs", "colors")),
+    "POSITIONS_ONLY": frozenset(("vertices", "faces")),
+}
+
+
+@dataclass(frozen=True)
+class ImportOptions:
+    """Settings of one import, passed to the parser and builders"""
+    buildMeshes: bool = True      # Whether to build the meshes or just parse the file
+    buildBones: bool = True       # Whether to build the bones
+    buildFaces: bool = True       # Whether to build the index buffer
+    allowWii: bool = True         # Whether to allow Wii models
+    # Offset of the first object to process, -1 means just loop through every object
+    firstObjectOffset: int = -1
+    # The highest number of models to extract before the user is prompted
+    modelThreshold: int = 50
+    # Mesh attributes to decode, see attributePresets
+    attributes: frozenset = attributePresets["FULL"]
+    # Whether meshes with identical file data share one Blender mesh
+    dedupMeshes: bool = True
+    # Whether that extends to the meshes of earlier imports in the session
+    sessionMeshes: bool = False
+    # Whether repeated models are built once and placed as collection instances
+    instanceModels: bool = False
+    # Whether the meshes of a model are joined into one with a material slot per draw call
+    mergeMeshes: bool = False
+    # Placeholders built instead of the meshes, NONE, BOUNDS or POINTS
+    proxyMode: str = "NONE"
+    # The most points of a POINTS placeholder
+    proxyPointLimit: int = 2048
+    # Indices of the models to decode and build, None for the first modelThreshold
+    modelIndices: Optional[frozenset] = None
+
+    def getDecodedAttributes(self) -> frozenset:
+        """Requested attributes minus the ones the other settings rule out"""
+        attributes = self.attributes
+        if not self.buildBones:
+            attributes = attributes - {"weights", "boneIndices"}
+        if not self.buildFaces:
+            attributes = attributes - {"faces"}
+        if self.proxyMode != "NONE":
+            attributes = attributes & {"vertices"}
+        return attributes
 
 
 class Endianness(str, Enum):
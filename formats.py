@@ -2,14 +2,17 @@
 Classes for handling the various data formats in Skylanders files
 """
 
+import collections
+import copy
+import hashlib
 import struct
-import bpy
-import bmesh
-from mathutils import Matrix, Vector
+import threading
 from typing import Any
+import numpy
 
 from . import utils
 from . import constants
+from . import shared_arrays
 
 # ------------------------------------------------------------------------------
 # Unpack functions for various vertex formats
@@ -364,18 +367,16 @@ def unpack_UBYTE4_X4(data: bytes, element: Any, endarg: str) -> list[float]:
 
 def unpack_HALF2(data: bytes, element: Any, endarg: str) -> list[float]:
     endian = endarg.value if hasattr(endarg, 'value') else endarg
-    bs = utils.NoeBitStream(
-        data, constants.Endianness.BIG if endian == '>' else constants.Endianness.LITTLE)
-    bs.seek(element._offset)
-    return [float(bs.readHalfFloat()), float(bs.readHalfFloat()), 0.0, 1.0]
+    halves = struct.unpack(
+        f"{endian}ee", data[element._offset:element._offset + 4])
+    return [halves[0], halves[1], 0.0, 1.0]
 
 
 def unpack_HALF4(data: bytes, element: Any, endarg: str) -> list[float]:
     endian = endarg.value if hasattr(endarg, 'value') else endarg
-    bs = utils.NoeBitStream(
-        data, constants.Endianness.BIG if endian == '>' else constants.Endianness.LITTLE)
-    bs.seek(element._offset)
-    return [float(bs.readHalfFloat()), float(bs.readHalfFloat()), float(bs.readHalfFloat()), float(bs.readHalfFloat())]
+    halves = struct.unpack(
+        f"{endian}eeee", data[element._offset:element._offset + 8])
+    return [halves[0], halves[1], halves[2], halves[3]]
 
 
 def unpack_UNUSED(data: bytes, element: Any, endarg: str) -> list[float]:
@@ -484,9 +485,7 @@ def edgeUnpack_F32(data: bytes, offset: int) -> bytes:
 
 
 def edgeUnpack_F16(data: bytes, offset: int) -> bytes:
-    bs = utils.NoeBitStream(data, constants.Endianness.BIG)
-    bs.seek(offset)
-    return struct.pack('>f', float(bs.readHalfFloat()))
+    return struct.pack('>f', struct.unpack('>e', data[offset:offset + 2])[0])
 
 
 def edgeUnpack_U8N(data: bytes, offset: int) -> bytes:
@@ -580,6 +579,141 @@ sscvertexUnpackFunctions = [
     unpack_UNDEFINED_0  # unpack_MAX
 ]
 
+
+# Vertex types that are plain numbers, (dtype, count, normaliser, component
+# order), read straight from the vertex streams by structured dtypes like the
+# packed types further down
+vertexFieldTypes = {
+    0x00: ("f4", 1, None, None),                # FLOAT1
+    0x01: ("f4", 2, None, None),                # FLOAT2
+    0x02: ("f4", 3, None, None),                # FLOAT3
+    0x03: ("f4", 4, None, None),                # FLOAT4
+    0x04: ("u1", 4, 0xFF, None),                # UBYTE4N_COLOR
+    0x05: ("u1", 4, 0xFF, (1, 2, 3, 0)),        # UBYTE4N_COLOR_ARGB
+    0x06: ("u1", 4, 0xFF, None),                # UBYTE4N_COLOR_RGBA
+    0x0B: ("i4", 1, None, None),                # INT1
+    0x0C: ("i4", 2, None, None),                # INT2
+    0x0D: ("i4", 4, None, None),                # INT4
+    0x0E: ("u4", 1, None, None),                # UINT1
+    0x0F: ("u4", 2, None, None),                # UINT2
+    0x10: ("u4", 4, None, None),                # UINT4
+    0x11: ("i4", 1, 0x7FFFFFFF, None),          # INT1N
+    0x12: ("i4", 2, 0x7FFFFFFF, None),          # INT2N
+    0x13: ("i4", 4, 0x7FFFFFFF, None),          # INT4N
+    0x14: ("u4", 1, 0xFFFFFFFF, None),          # UINT1N
+    0x15: ("u4", 2, 0xFFFFFFFF, None),          # UINT2N
+    0x16: ("u4", 4, 0xFFFFFFFF, None),          # UINT4N
+    0x17: ("u1", 4, None, None),                # UBYTE4
+    0x18: ("u1", 4, 4, None),                   # UBYTE4_X4
+    0x19: ("i1", 4, None, None),                # BYTE4
+    0x1A: ("u1", 4, 0xFF, None),                # UBYTE4N
+    0x1C: ("i1", 4, 0x7F, None),                # BYTE4N
+    0x1D: ("i2", 2, None, None),                # SHORT2
+    0x1E: ("i2", 4, None, None),                # SHORT4
+    0x1F: ("u2", 2, None, None),                # USHORT2
+    0x20: ("u2", 4, None, None),                # USHORT4
+    0x21: ("i2", 2, 0x7FFF, None),              # SHORT2N
+    0x22: ("i2", 3, 0x7FFF, None),              # SHORT3N
+    0x23: ("i2", 4, 0x7FFF, None),              # SHORT4N
+    0x24: ("u2", 2, 0xFFFF, None),              # USHORT2N
+    0x25: ("u2", 3, 0xFFFF, None),              # USHORT3N
+    0x26: ("u2", 4, 0xFFFF, None),              # USHORT4N
+    0x2A: ("f2", 2, None, None),                # HALF2
+    0x2B: ("f2", 4, None, None),                # HALF4
+    0x2D: ("i1", 3, 0x7F, None),                # BYTE3N
+    0x2E: ("i2", 3, None, None),                # SHORT3
+    0x2F: ("u2", 3, None, None),                # USHORT3
+    0x30: ("u1", 4, None, (3, 2, 1, 0)),        # UBYTE4_ENDIAN
+    0x31: ("u1", 4, None, None),                # UBYTE4_COLOR
+    0x32: ("i1", 3, None, None),                # BYTE3
+    0x36: ("i2", 4, 0x7FFF, None),              # SHORT4N_EDGE
+}
+
+
+def unpackBits(words, shift, bits):
+    return (words >> shift) & ((1 << bits) - 1)
+
+
+def unpackSignedBits(words, shift, bits):
+    """Sign and magnitude field, bits of magnitude normalised to 1 below the sign bit"""
+    magnitude = unpackBits(words, shift, bits) / ((1 << bits) - 1)
+    return numpy.where(unpackBits(words, shift + bits, 1) == 0, magnitude, -magnitude)
+
+
+def decodePacked_UBYTE2N_COLOR_5650(words):
+    return (unpackBits(words, 11, 5) / 31, unpackBits(words, 5, 6) / 63, unpackBits(words, 0, 5) / 31, 1.0)
+
+
+def decodePacked_UBYTE2N_COLOR_5551(words):
+    return (unpackBits(words, 0, 5) / 31, unpackBits(words, 5, 5) / 31, unpackBits(words, 10, 5) / 31, unpackBits(words, 15, 1))
+
+
+def decodePacked_UBYTE2N_COLOR_4444(words):
+    return (unpackBits(words, 0, 4) / 15, unpackBits(words, 4, 4) / 15, unpackBits(words, 8, 4) / 15, unpackBits(words, 12, 4) / 15)
+
+
+def decodePacked_UDEC3(words):
+    return (unpackBits(words, 0, 10), unpackBits(words, 10, 10), unpackBits(words, 20, 10), 1.0)
+
+
+def decodePacked_UDEC3_OES(words):
+    return (words >> 22, unpackBits(words, 12, 10), unpackBits(words, 2, 10), 1.0)
+
+
+def decodePacked_DEC3N(words):
+    return (unpackSignedBits(words, 0, 9), unpackSignedBits(words, 10, 9), unpackSignedBits(words, 20, 9), 1.0)
+
+
+def decodePacked_DEC3N_OES(words):
+    return (unpackSignedBits(words, 2, 9), unpackSignedBits(words, 12, 9), unpackSignedBits(words, 22, 9), 1.0)
+
+
+def decodePacked_DEC3N_S11_11_10(words):
+    return (unpackSignedBits(words, 0, 10), unpackSignedBits(words, 11, 10), unpackSignedBits(words, 22, 9), 1.0)
+
+
+# Vertex types packed into a single word, (dtype, decode function), the array
+# versions of the matching unpack functions
+vertexPackedTypes = {
+    0x08: ("u2", decodePacked_UBYTE2N_COLOR_5650),
+    0x09: ("u2", decodePacked_UBYTE2N_COLOR_5551),
+    0x0A: ("u2", decodePacked_UBYTE2N_COLOR_4444),
+    0x27: ("u4", decodePacked_UDEC3),
+    0x28: ("u4", decodePacked_DEC3N),
+    0x29: ("u4", decodePacked_DEC3N_S11_11_10),
+    0x33: ("u2", decodePacked_UBYTE2N_COLOR_5650),  # UBYTE2N_COLOR_5650_RGB
+    0x34: ("u4", decodePacked_UDEC3_OES),
+    0x35: ("u4", decodePacked_DEC3N_OES),
+}
+
+
+def decodeVertexField(raw, vertexType, scale):
+    """Float rows of 4 components from a structured field, the same values the unpack functions give"""
+    values = numpy.zeros((len(raw), 4))
+    if vertexType in vertexPackedTypes:
+        words = raw.astype(numpy.int64)
+        for i, component in enumerate(vertexPackedTypes[vertexType][1](words)):
+            values[:, i] = component
+    else:
+        dtype, count, normaliser, order = vertexFieldTypes[vertexType]
+        values[:, 3] = 1.0
+        values[:, :count] = raw.reshape(len(raw), count)
+        if normaliser is not None:
+            values[:, :count] /= normaliser
+        if order is not None:
+            values = values[:, order]
+    values[:, :3] *= scale
+    return values.astype(numpy.float32)
+
+
+def padAttribute(values, vertexCount, default):
+    """Copy a per vertex attribute into an array with one default row per missing vertex, plus one extra"""
+    padded = numpy.empty((vertexCount + 1, len(default)), dtype=numpy.float32)
+    padded[:] = default
+    values = numpy.asarray(values, dtype=numpy.float32)[:vertexCount]
+    padded[:len(values)] = values[:, :len(default)]
+    return padded
+
 # ------------------------------------------------------------------------------
 # Classes for data structures in Skylanders files
 # ------------------------------------------------------------------------------
@@ -603,6 +737,9 @@ class EdgeGeometryVertexDescriptor:
 
 
 class EdgeGeometryAttributeBlock:
+    __slots__ = ("offset", "format", "componentCount", "edgeAttributeId", "size",
+                 "vertexProgramSlotIndex", "fixedBlockOffset", "padding")
+
     def __init__(self):
         self.offset = 0
         self.format = 0                  # See Formats section of PS3 Reference
@@ -624,12 +761,25 @@ class EdgeGeometryAttributeBlock:
         self.padding = data[7]
 
     def unpack(self, vertexBuffer, vertexCount, stride):
+        if self.format == 3 and not (self.edgeAttributeId == 1 and self.componentCount == 4):
+            return self.unpackHalves(vertexBuffer, vertexCount, stride)
+
         vattributes = []
         for i in range(vertexCount):
             vattributes.extend(self.unpackVertex(
                 vertexBuffer[stride * i: stride * (i + 1)]))
         return bytes(vattributes)
 
+    def unpackHalves(self, vertexBuffer, vertexCount, stride):
+        """F16 components of every vertex widened in one go, laid out like unpack"""
+        count = min(self.componentCount, 4)
+        halves = numpy.ndarray((vertexCount, count), dtype='>f2', buffer=vertexBuffer,
+                               offset=self.offset, strides=(stride, 2))
+        values = numpy.zeros((vertexCount, 4), dtype='>f4')
+        values[:, 3] = 1.0
+        values[:, :count] = halves
+        return values.tobytes()
+
     def unpackVertex(self, data):
         ret = []
 
@@ -681,6 +831,9 @@ class EdgeGeomSpuConfigInfo:
 
 
 class igVertexElement:
+    __slots__ = ("_type", "_stream", "_mapToElement", "_count", "_usage", "_usageIndex",
+                 "_packDataOffset", "_packTypeAndFracHint", "_offset", "_freq")
+
     def __init__(self, data, endarg):
         self._type = data[0]
         self._stream = data[1]
@@ -693,36 +846,53 @@ class igVertexElement:
         self._offset = struct.unpack(f"{endarg}H", data[8:10])[0]
         self._freq = struct.unpack(f"{endarg}H", data[10:12])[0]
 
-    def unpack(self, vertexBuffer, stride, packData, endarg, debugPrint=False):
-        vattributes = []
-
+    def getPackScale(self, packData, endarg):
+        """Scale of the first three components, 1 / 2^n with n from the pack data"""
         scale = 1
         if (self._packTypeAndFracHint & 7) == 2 and packData is not None:
             scale /= 1 << struct.unpack(f"{endarg}I", bytes(
                 packData[self._packDataOffset:self._packDataOffset + 4]))[0]
             print(f"scale is 1 / {1 / scale}")
+        return scale
+
+    def getFieldDtype(self, endarg):
+        """dtype of the element in a structured vertex, None for types without an array decode"""
+        if self._type in vertexFieldTypes:
+            dtype, count, normaliser, order = vertexFieldTypes[self._type]
+            return numpy.dtype((f"{endarg}{dtype}", (count,)))
+        if self._type in vertexPackedTypes:
+            return numpy.dtype(f"{endarg}{vertexPackedTypes[self._type][0]}")
+        return None
+
+    def unpack(self, vertexBuffer, stride, packData, endarg, debugPrint=False):
+        scale = self.getPackScale(packData, endarg)
+        vertexCount = len(vertexBuffer) // stride
+
+        fieldDtype = self.getFieldDtype(endarg)
+        if fieldDtype is not None and self._offset + fieldDtype.itemsize <= stride:
+            field = numpy.ndarray((vertexCount,), dtype=fieldDtype, buffer=vertexBuffer,
+                                  offset=self._offset, strides=(stride,))
+            values = decodeVertexField(field, self._type, scale)
+        else:
+            values = numpy.array([sscvertexUnpackFunctions[self._type](
+                vertexBuffer[i * stride:(i + 1) * stride], self, endarg) for i in range(vertexCount)],
+                dtype=numpy.float64).reshape(vertexCount, 4)
+            values[:, :3] *= scale
 
-        magnitude = 0
-        for i in range(len(vertexBuffer) // stride):
-            attribute = sscvertexUnpackFunctions[self._type](
-                vertexBuffer[i * stride:(i + 1) * stride], self, endarg)
-            if debugPrint:
-                currMag = (attribute[0]*attribute[0] + attribute[1]
-                           * attribute[1] + attribute[2]*attribute[2])
-                print(attribute)
-                if magnitude < currMag:
-                    magnitude = currMag
-            vattributes.extend(bytes(struct.pack(
-                f"{endarg}ffff", attribute[0] * scale, attribute[1] * scale, attribute[2] * scale, attribute[3])))
         if debugPrint:
-            print(f"magnitude: {magnitude * (scale*scale)}")
-        return bytes(vattributes)
+            print(values)
+            magnitude = (values[:, :3].astype(numpy.float64) ** 2).sum(axis=1).max(initial=0)
+            print(f"magnitude: {magnitude}")
+        return values.astype(f"{endarg}f4").tobytes()
 
     def getElemNormaliser(self):
         return constants.vertexMaxMags[self._type]
 
 
 class PS3MeshObject:
+    __slots__ = ("vertexBuffers", "vertexStrides", "vertexCount", "indexBuffer",
+                 "spuConfigInfo", "vertexElements", "indexCount", "boneMapIndex")
+
     def __init__(self):
         self.vertexBuffers = []
         self.vertexStrides = []
@@ -803,7 +973,166 @@ class PS3MeshObject:
         return (bwBuffer, biBuffer)
 
 
+def emptyAttribute(dtype, components):
+    return numpy.empty((0, components), dtype=dtype)
+
+
+def readAttribute(buffer, endarg, stride, count, components):
+    """Rows of the first components floats of an unpacked buffer of stride bytes per vertex"""
+    values = numpy.frombuffer(buffer, dtype=f"{endarg}f4",
+                              count=count * stride // 4)
+    return values.reshape(count, stride // 4)[:, :components].astype(numpy.float32)
+
+
+def quantizeWeights(weights):
+    return numpy.rint(numpy.clip(weights, 0.0, 1.0) * 255).astype(numpy.uint8)
+
+
+# Decoded attribute and its components per vertex usage, the last three only
+# for the first usage index
+vertexUsageAttributes = {
+    0: ("vertices", 3),     # IG_VERTEX_USAGE_POSITION
+    1: ("normals", 3),      # IG_VERTEX_USAGE_NORMAL
+    4: ("colors", 4),       # IG_VERTEX_USAGE_COLOR
+    5: ("uvs", 2),          # IG_VERTEX_USAGE_TEXCOORD
+    6: ("weights", 4),      # IG_VERTEX_USAGE_BLENDWEIGHTS
+    8: ("boneIndices", 4),  # IG_VERTEX_USAGE_BLENDINDICES
+}
+
+
+class VertexDecodeStep:
+    """
+    Decode of one element into a MeshObject attribute
+
+    field names the element in the structured dtype of its stream, None for
+    types that are unpacked one vertex at a time.
+    """
+    __slots__ = ("name", "element", "components", "field")
+
+    def __init__(self, name, element, components):
+        self.name = name
+        self.element = element
+        self.components = components
+        self.field = None
+
+
+class VertexDecoderPlan:
+    """What buildMesh derives from a vertex format, shared by every mesh using it"""
+    __slots__ = ("streamStrides", "steps", "packDataOffset", "streamDtypes")
+
+    def __init__(self, elements, streamStrides, attributes, endarg):
+        self.streamStrides = tuple(streamStrides)
+        self.steps = []
+        # Pack data of old files sits behind the vertices, as far from the
+        # end as the largest pack data offset
+        self.packDataOffset = 0
+        for elem in elements:
+            if elem._type == 0x2C:
+                continue
+            if (elem._packTypeAndFracHint & 7) == 2:
+                self.packDataOffset = max(self.packDataOffset, elem._packDataOffset)
+
+            if elem._usage not in vertexUsageAttributes:
+                continue
+            if elem._usage >= 5 and elem._usageIndex != 0:
+                continue
+            name, components = vertexUsageAttributes[elem._usage]
+            if name not in attributes:
+                continue
+            if elem._usage >= 6:
+                components = min(elem._count, components)
+            self.steps.append(VertexDecodeStep(name, elem, components))
+
+        # One structured dtype per stream covering all of its plain fields, so
+        # a single view of the stream exposes every attribute
+        fields = {}
+        for step in self.steps:
+            elem = step.element
+            if step.name == "vertices" and elem._type == 0x23:
+                continue
+            fieldDtype = elem.getFieldDtype(endarg)
+            if fieldDtype is None:
+                continue
+            if elem._offset + fieldDtype.itemsize > self.streamStrides[elem._stream]:
+                continue
+            step.field = f"element{len(fields.get(elem._stream, ()))}"
+            fields.setdefault(elem._stream, []).append(
+                (step.field, fieldDtype, elem._offset))
+
+        self.streamDtypes = {}
+        for stream, streamFields in fields.items():
+            self.streamDtypes[stream] = numpy.dtype({
+                "names": [field[0] for field in streamFields],
+                "formats": [field[1] for field in streamFields],
+                "offsets": [field[2] for field in streamFields],
+                "itemsize": self.streamStrides[stream],
+            })
+
+    def getStreamView(self, vertexBuffer, stream, vertexCount):
+        """Zero copy view of a stream as one structured record per vertex"""
+        return numpy.frombuffer(vertexBuffer, dtype=self.streamDtypes[stream], count=vertexCount,
+                                offset=self.getStreamOffset(stream, vertexCount))
+
+    def getStreamOffset(self, stream, vertexCount):
+        """Streams follow each other, each padded to 0x20 bytes"""
+        offset = 0
+        for stride in self.streamStrides[:stream]:
+            offset += ((stride * vertexCount + 0x1F) // 0x20) * 0x20
+        return offset
+
+
+# Compiled plans by vertex format signature, least recently used first
+decoderPlanCacheSize = 256
+_decoderPlans = collections.OrderedDict()
+_decoderPlansLock = threading.Lock()
+
+
+def getVertexFormatSignature(elements, streamStrides, attributes, endarg):
+    return (tuple((elem._type, elem._stream, elem._count, elem._usage, elem._usageIndex,
+                   elem._offset, elem._packDataOffset, elem._packTypeAndFracHint)
+                  for elem in elements), tuple(streamStrides), attributes, endarg)
+
+
+def getDecoderPlan(elements, streamStrides, attributes, endarg):
+    """Decoder plan of a vertex format for a set of attributes, compiled on first use"""
+    signature = getVertexFormatSignature(
+        elements, streamStrides, attributes, endarg)
+    with _decoderPlansLock:
+        plan = _decoderPlans.get(signature)
+        if plan is not None:
+            _decoderPlans.move_to_end(signature)
+            return plan
+
+    plan = VertexDecoderPlan(elements, streamStrides, attributes, endarg)
+    with _decoderPlansLock:
+        _decoderPlans[signature] = plan
+        if len(_decoderPlans) > decoderPlanCacheSize:
+            _decoderPlans.popitem(last=False)
+    return plan
+
+
 class MeshObject:
+    # Decoded attributes, their dtypes and components per vertex. Faces are
+    # uint16 when every index fits, weights are stored in 1/255 steps
+    attributeLayouts = (
+        ("vertices", "f4", 3),
+        ("faces", "u4", 3),
+        ("normals", "f4", 3),
+        ("uvs", "f4", 2),
+        ("colors", "f4", 4),
+        ("weights", "u1", 4),
+        ("boneIndices", "u2", 4),
+    )
+
+    __slots__ = (
+        "name", "vertexBuffers", "vertexStrides", "vertexCount", "indexBuffer",
+        "isPs3", "ps3Segments", "spuConfigInfo", "skipBuild", "vertexElements",
+        "vertexStreams", "primType", "indexCount", "boneMapIndex",
+        "transformation", "packData", "platform", "platformData", "decoded",
+        "vertices", "faces", "normals", "uvs", "colors", "weights",
+        "boneIndices", "sharedArrays", "contentHash",
+    )
+
     def __init__(self):
         self.name = ""
         self.vertexBuffers = []
@@ -823,17 +1152,27 @@ class MeshObject:
         self.packData = None
         self.platform = 0
         self.platformData = None
+        self.decoded = False
 
         # For Blender mesh construction
-        self.vertices = []
-        self.faces = []
-        self.normals = []
-        self.uvs = []
-        self.colors = []
-        self.weights = []
-        self.boneIndices = []
-
-    def buildMesh(self, boneMapList, endianness, version, platform):
+        for name, dtype, components in MeshObject.attributeLayouts:
+            setattr(self, name, emptyAttribute(dtype, components))
+        self.sharedArrays = []
+        # Digest of the file data the attributes are decoded from
+        self.contentHash = None
+
+    def copyParsed(self):
+        """Copy sharing the parsed file data, without the decoded attributes"""
+        mesh_obj = copy.copy(self)
+        mesh_obj.vertexBuffers = list(self.vertexBuffers)
+        for name, dtype, components in MeshObject.attributeLayouts:
+            setattr(mesh_obj, name, emptyAttribute(dtype, components))
+        mesh_obj.sharedArrays = []
+        mesh_obj.decoded = False
+        mesh_obj.contentHash = None
+        return mesh_obj
+
+    def buildMesh(self, boneMapList, endianness, version, platform, options):
         if self.vertexCount == 0:
             return
 
@@ -845,212 +1184,151 @@ class MeshObject:
         print(f"name:           {self.name}")
         print(f"bone map index: {hex(self.boneMapIndex)}")
 
-        # Process vertex data
-        if platform == 2 and struct.unpack(">H", self.vertexBuffers[0][0:2])[0] == 0x9F:
-            self.vertexBuffers[0] = bytes(self.vertexBuffers[0][4:])
+        # Process vertex data, skipping the header of Wii buffers through a
+        # view so the parsed buffers stay as they were read
+        vertexBuffer = self.vertexBuffers[0]
+        if platform == 2 and struct.unpack(">H", vertexBuffer[0:2])[0] == 0x9F:
+            vertexBuffer = memoryview(vertexBuffer)[4:]
+
+        attributes = options.getDecodedAttributes()
+        plan = getDecoderPlan(self.vertexElements, self.vertexStreams,
+                              attributes, endarg)
 
         if version >= 6:
             packData = self.packData[2] if self.packData is not None else None
         else:
-            packDataOffset = 0
-            for elem in self.vertexElements:
-                if elem._type == 0x2C:
-                    continue
-                print(f"processing... {elem._packDataOffset}")
-                if (elem._packTypeAndFracHint & 7) == 2:
-                    if packDataOffset < elem._packDataOffset:
-                        packDataOffset = elem._packDataOffset
-            packData = bytes(self.vertexBuffers[0][len(
-                self.vertexBuffers[0]) - packDataOffset - 4:])
-
-        for elem in self.vertexElements:
-            if elem._type == 0x2C:
-                continue
-
-            streamOffset = 0
-            for i in range(elem._stream):
-                streamOffset += (((self.vertexStreams[i] *
-                                 self.vertexCount) + 0x1F) // 0x20) * 0x20
-            print(
-                f"Getting bytes for stream from {hex(streamOffset)} to {hex(streamOffset + self.vertexCount * self.vertexStreams[elem._stream])}")
-            stream = bytes(self.vertexBuffers[0][streamOffset:streamOffset +
-                           self.vertexCount * self.vertexStreams[elem._stream]])
-            streamSize = self.vertexStreams[elem._stream]
-
-            print(f"usage: {hex(elem._usage)}; offset: {hex(elem._offset)}; stream: {hex(elem._stream)}; count: {hex(elem._count)}; type: {hex(elem._type)}; mapToElement: {hex(elem._mapToElement)}; usageIndex: {hex(elem._usageIndex)}; packDataOffset: {hex(elem._packDataOffset)}; packTypeAndFracHint: {hex(elem._packTypeAndFracHint)}; freq: {hex(elem._freq)}; streamOffset: {hex(streamOffset)}")
-
-            if elem._usage == 0:  # IG_VERTEX_USAGE_POSITION
-                stride = 0x10
-                if elem._type == 0x23:
-                    fakeVertexBuffer = self.superchargersFunkiness(endarg)
-                    stride = 0x0C
-                else:
-                    fakeVertexBuffer = elem.unpack(
-                        stream, streamSize, packData, endarg)
-
-                # Extract positions
-                for i in range(self.vertexCount):
-                    x, y, z = struct.unpack(
-                        endarg + 'fff', fakeVertexBuffer[i * stride:i * stride + 12])
-                    self.vertices.append((x, y, z))
-
-            if elem._usage == 1:  # IG_VERTEX_USAGE_NORMAL
-                vnormals = elem.unpack(stream, streamSize, packData, endarg)
-
-                # Extract normals
-                for i in range(self.vertexCount):
-                    nx, ny, nz = struct.unpack(
-                        endarg + 'fff', vnormals[i * 0x10:i * 0x10 + 12])
-                    self.normals.append((nx, ny, nz))
-
-            if elem._usage == 4:  # IG_VERTEX_USAGE_COLOR
-                vcolors = elem.unpack(stream, streamSize, packData, endarg)
-
-                # Extract colors
-                for i in range(self.vertexCount):
-                    r, g, b, a = struct.unpack(
-                        endarg + 'ffff', vcolors[i * 0x10:i * 0x10 + 16])
-                    self.colors.append((r, g, b, a))
-
-            if elem._usage == 5 and elem._usageIndex == 0:  # IG_VERTEX_USAGE_TEXCOORD
-                vtexcoords = elem.unpack(stream, streamSize, packData, endarg)
-
-                # Extract UVs
-                for i in range(self.vertexCount):
-                    u = struct.unpack(
-                        endarg + 'f', vtexcoords[i * 0x10:i * 0x10 + 4])[0]
-                    v = struct.unpack(
-                        endarg + 'f', vtexcoords[i * 0x10 + 4:i * 0x10 + 8])[0]
-                    self.uvs.append((u, v))
-
-            if elem._usage == 6 and elem._usageIndex == 0 and constants.dBuildBones:  # IG_VERTEX_USAGE_BLENDWEIGHTS
-                vblendweights = elem.unpack(
-                    stream, streamSize, packData, endarg)
-
-                # Extract weights
-                for i in range(self.vertexCount):
-                    weights = []
-                    for j in range(elem._count):
-                        weight = struct.unpack(
-                            endarg + 'f', vblendweights[i * 0x10 + j * 4:i * 0x10 + (j + 1) * 4])[0]
-                        weights.append(weight)
-                    # Pad with zeros if needed
-                    while len(weights) < 4:
-                        weights.append(0.0)
-                    self.weights.append(weights)
-
-            if elem._usage == 8 and elem._usageIndex == 0 and constants.dBuildBones:  # IG_VERTEX_USAGE_BLENDINDICES
-                vfblendindices = elem.unpack(
-                    stream, streamSize, packData, endarg)
-
-                # Extract bone indices
-                for i in range(self.vertexCount):
-                    indices = []
-                    for j in range(elem._count):
-                        index = int(struct.unpack(
-                            endarg + 'f', vfblendindices[i * 0x10 + j * 4:i * 0x10 + (j + 1) * 4])[0])
-                        indices.append(index)
-                    # Pad with zeros if needed
-                    while len(indices) < 4:
-                        indices.append(0)
-                    self.boneIndices.append(indices)
+            packData = bytes(vertexBuffer[len(
+                vertexBuffer) - plan.packDataOffset - 4:])
+
+        streamViews = {}
+        for step in plan.steps:
+            elem = step.element
+            if step.name == "vertices" and elem._type == 0x23:
+                values = self.superchargersFunkiness(vertexBuffer, endarg)
+            elif step.field is not None:
+                if elem._stream not in streamViews:
+                    streamViews[elem._stream] = plan.getStreamView(
+                        vertexBuffer, elem._stream, self.vertexCount)
+                values = decodeVertexField(streamViews[elem._stream][step.field], elem._type,
+                                           elem.getPackScale(packData, endarg))[:, :step.components]
+            else:
+                streamOffset = plan.getStreamOffset(
+                    elem._stream, self.vertexCount)
+                streamSize = plan.streamStrides[elem._stream]
+                stream = bytes(vertexBuffer[streamOffset:streamOffset +
+                               self.vertexCount * streamSize])
+                unpacked = elem.unpack(stream, streamSize, packData, endarg)
+                values = readAttribute(
+                    unpacked, endarg, 0x10, self.vertexCount, step.components)
+            self.setAttribute(step, values)
 
         # Process index data
-        if constants.dBuildFaces and self.primType != constants.PrimitiveType.TRIANGLE_STRIP:
-            if self.vertexCount <= 0xFFFF:
-                # Extract triangles from 16-bit indices
-                for i in range(0, self.indexCount, 3):
-                    if i + 2 < self.indexCount:
-                        idx1 = struct.unpack(
-                            endarg + 'H', self.indexBuffer[i * 2:(i + 1) * 2])[0]
-                        idx2 = struct.unpack(
-                            endarg + 'H', self.indexBuffer[(i + 1) * 2:(i + 2) * 2])[0]
-                        idx3 = struct.unpack(
-                            endarg + 'H', self.indexBuffer[(i + 2) * 2:(i + 3) * 2])[0]
-                        self.faces.append((idx1, idx2, idx3))
-            else:
-                # Extract triangles from 32-bit indices
-                for i in range(0, self.indexCount, 3):
-                    if i + 2 < self.indexCount:
-                        idx1 = struct.unpack(
-                            endarg + 'I', self.indexBuffer[i * 4:(i + 1) * 4])[0]
-                        idx2 = struct.unpack(
-                            endarg + 'I', self.indexBuffer[(i + 1) * 4:(i + 2) * 4])[0]
-                        idx3 = struct.unpack(
-                            endarg + 'I', self.indexBuffer[(i + 2) * 4:(i + 3) * 4])[0]
-                        self.faces.append((idx1, idx2, idx3))
-        elif constants.dBuildFaces and self.primType == constants.PrimitiveType.TRIANGLE_STRIP:
+        if "faces" in attributes and self.primType != constants.PrimitiveType.TRIANGLE_STRIP:
+            # 16-bit indices unless there are too many vertices, a trailing
+            # partial triangle is dropped
+            indexType = "u2" if self.vertexCount <= 0xFFFF else "u4"
+            indices = numpy.frombuffer(
+                self.indexBuffer, dtype=endarg + indexType, count=self.indexCount // 3 * 3)
+            self.faces = indices.astype(indexType).reshape(-1, 3)
+        elif "faces" in attributes and self.primType == constants.PrimitiveType.TRIANGLE_STRIP:
             # Handle triangle strips - simplified for now
             # A proper implementation would convert strips to triangles
             pass
 
-    def buildPs3MeshNew(self, boneMapList, version):
+    def getContentHash(self, endianness, version, platform, attributes):
+        """Digest of the raw buffers and vertex format, equal for meshes that decode the same"""
+        # Sets are ordered differently in every process, sort them so worker
+        # processes agree
+        attributes = tuple(sorted(attributes))
+        if self.isPs3:
+            layout = [(sorted(vars(segment.spuConfigInfo).items()), segment.vertexCount,
+                       segment.indexCount, tuple(segment.vertexStrides),
+                       [[(block.offset, block.format, block.componentCount, block.edgeAttributeId, block.size)
+                         for block in getattr(descriptor, "elements", [])]
+                        for descriptor in segment.vertexElements])
+                      for segment in self.ps3Segments]
+            buffers = [buffer for segment in self.ps3Segments
+                       for buffer in segment.vertexBuffers + [segment.indexBuffer]]
+        else:
+            if self.vertexCount == 0:
+                return None
+            endarg = '>' if endianness == "BE" else '<'
+            layout = getVertexFormatSignature(
+                self.vertexElements, self.vertexStreams, attributes, endarg)
+            buffers = [self.vertexBuffers[0], self.indexBuffer,
+                       self.packData[2] if self.packData is not None else None]
+
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((self.isPs3, version, platform, attributes, self.vertexCount,
+                            self.indexCount, self.primType, layout)).encode())
+        for buffer in buffers:
+            # Length first so the buffers can't run into each other
+            size = len(buffer) if buffer is not None else -1
+            digest.update(size.to_bytes(8, "little", signed=True))
+            if buffer is not None:
+                digest.update(buffer)
+        return digest.hexdigest()
+
+    def setAttribute(self, step, values):
+        """Store decoded float rows as the attribute of a decode step"""
+        if step.name == "weights":
+            # Padded with zeros to 4 per vertex
+            weights = numpy.zeros((len(values), 4), dtype=numpy.float32)
+            weights[:, :step.components] = values
+            self.weights = quantizeWeights(weights)
+        elif step.name == "boneIndices":
+            indices = numpy.zeros((len(values), 4), dtype=numpy.uint16)
+            indices[:, :step.components] = values
+            self.boneIndices = indices
+        else:
+            setattr(self, step.name, values)
+
+    def buildPs3MeshNew(self, boneMapList, version, options):
         # Simplified PS3 mesh processing for Blender
         print(f"Building PS3 mesh {self.name}")
+        attributes = options.getDecodedAttributes()
 
         # Get position buffer
         vPositions = self.buildBatchedPS3VertexBuffer(1)
         if vPositions:
             # Extract positions
-            for i in range(len(vPositions) // 16):
-                x, y, z = struct.unpack('>fff', vPositions[i * 16:i * 16 + 12])
-                self.vertices.append((x, y, z))
+            self.vertices = readAttribute(
+                vPositions, '>', 16, len(vPositions) // 16, 3)
 
         # Get UVs if available
-        vUV0 = self.buildBatchedPS3VertexBuffer(5)
+        vUV0 = self.buildBatchedPS3VertexBuffer(5) if "uvs" in attributes else None
         if vUV0:
-            for i in range(len(vUV0) // 16):
-                u, v = struct.unpack('>ff', vUV0[i * 16:i * 16 + 8])
-                self.uvs.append((u, v))
+            self.uvs = readAttribute(vUV0, '>', 16, len(vUV0) // 16, 2)
 
         # Get colors if available
-        vColor = self.buildBatchedPS3VertexBuffer(9)
+        vColor = self.buildBatchedPS3VertexBuffer(9) if "colors" in attributes else None
         if vColor:
-            for i in range(len(vColor) // 16):
-                r, g, b, a = struct.unpack('>ffff', vColor[i * 16:i * 16 + 16])
-                self.colors.append((r, g, b, a))
+            self.colors = readAttribute(vColor, '>', 16, len(vColor) // 16, 4)
 
         # Handle bones if available
-        if constants.dBuildBones and len(boneMapList) > 0 and len(boneMapList[self.boneMapIndex]) > 0:
+        if "weights" in attributes and len(boneMapList) > 0 and len(boneMapList[self.boneMapIndex]) > 0:
             boneBuffers = self.buildBatchedPs3BoneBuffers()
             if boneBuffers:
                 weight_data = boneBuffers[0]
                 index_data = boneBuffers[1]
 
-                # Extract weights and indices
-                for i in range(len(weight_data) // 4):
-                    weights = []
-                    indices = []
-
-                    for j in range(4):
-                        w = weight_data[i*4+j] / 255.0
-                        weights.append(w)
-                        idx = index_data[i*4+j]
-                        indices.append(idx)
-
-                    # Normalize weights if they don't sum to 1
-                    weight_sum = sum(weights)
-                    if weight_sum > 0 and abs(weight_sum - 1.0) > 0.001:
-                        weights = [w / weight_sum for w in weights]
-
-                    self.weights.append(weights)
-                    self.boneIndices.append(indices)
+                # Extract weights and indices, the weights are already bytes
+                # and get normalized when they are assigned
+                vertexCount = len(weight_data) // 4
+                self.weights = numpy.frombuffer(
+                    weight_data, dtype=numpy.uint8, count=vertexCount * 4).reshape(-1, 4).copy()
+                self.boneIndices = numpy.frombuffer(
+                    index_data, dtype=numpy.uint8, count=vertexCount * 4).reshape(-1, 4).astype(numpy.uint16)
 
         # Extract faces
-        indexBuffer = self.buildBatchedPS3IndexBuffer()
+        indexBuffer = self.buildBatchedPS3IndexBuffer() if "faces" in attributes else None
         if indexBuffer:
             index_data = indexBuffer[0]
             index_count = indexBuffer[1]
 
-            for i in range(0, index_count, 3):
-                if i + 2 < index_count:
-                    idx1 = struct.unpack(
-                        '>I', index_data[i * 4:(i + 1) * 4])[0]
-                    idx2 = struct.unpack(
-                        '>I', index_data[(i + 1) * 4:(i + 2) * 4])[0]
-                    idx3 = struct.unpack(
-                        '>I', index_data[(i + 2) * 4:(i + 3) * 4])[0]
-                    self.faces.append((idx1, idx2, idx3))
+            indices = numpy.frombuffer(
+                index_data, dtype='>u4', count=index_count // 3 * 3)
+            self.faces = indices.astype(numpy.uint32).reshape(-1, 3)
 
     def buildBatchedPS3VertexBuffer(self, attributeId):
         batchedBuffer = []
@@ -1101,83 +1379,457 @@ class MeshObject:
 
         return None
 
-    def superchargersFunkiness(self, endarg):
-        fVBuf = []
-        for i in range(self.vertexCount):
-            coord = struct.unpack(
-                f"{endarg}hhh", self.vertexBuffers[0][i * self.vertexStrides[0]+0:i * self.vertexStrides[0]+6])
-            scale = struct.unpack(
-                f"{endarg}h", self.vertexBuffers[0][i * self.vertexStrides[0]+6:i * self.vertexStrides[0]+8])[0]
-            fVBuf.extend(bytes(struct.pack(f"{endarg}f", coord[0] / scale)))
-            fVBuf.extend(bytes(struct.pack(f"{endarg}f", coord[1] / scale)))
-            fVBuf.extend(bytes(struct.pack(f"{endarg}f", coord[2] / scale)))
-        return bytes(fVBuf)
+    def superchargersFunkiness(self, vertexBuffer, endarg):
+        """SuperChargers positions, three shorts divided by the fourth"""
+        coords = numpy.ndarray((self.vertexCount, 4), dtype=f"{endarg}i2", buffer=vertexBuffer,
+                               strides=(self.vertexStrides[0], 2))
+        return (coords[:, :3] / coords[:, 3:]).astype(numpy.float32)
 
     def handlePackData(self, vertexBuff, stride):
-        fVBuf = []
-        for i in range(self.vertexCount):
-            coord = struct.unpack(
-                '>hhh', vertexBuff[i * stride+0:i * stride+6])
-            fVBuf.extend(bytes(struct.pack(">f", coord[0] / 1024)))
-            fVBuf.extend(bytes(struct.pack(">f", coord[1] / 1024)))
-            fVBuf.extend(bytes(struct.pack(">f", coord[2] / 1024)))
-        return bytes(fVBuf)
+        coords = numpy.ndarray((self.vertexCount, 3), dtype=">i2", buffer=vertexBuff,
+                               strides=(stride, 2))
+        return (coords / 1024).astype(">f4").tobytes()
 
     def transform(self, mtx):
         self.transformation = mtx
 
+    def shareArrays(self):
+        """Move the decoded attributes into shared memory, leaving descriptors in their place"""
+        for name, dtype, components in MeshObject.attributeLayouts:
+            values = getattr(self, name)
+            if len(values) > 0:
+                setattr(self, name, shared_arrays.share(values, values.dtype))
+
+    def holdArrays(self):
+        """Keep the shared blocks alive after the worker that created them exits"""
+        for name, dtype, components in MeshObject.attributeLayouts:
+            value = getattr(self, name)
+            if isinstance(value, shared_arrays.SharedArray):
+                shared_arrays.hold(value)
+
+    def attachArrays(self):
+        """Replace shared memory descriptors with arrays viewing the shared blocks"""
+        for name, dtype, components in MeshObject.attributeLayouts:
+            value = getattr(self, name)
+            if isinstance(value, shared_arrays.SharedArray):
+                self.sharedArrays.append(value)
+                setattr(self, name, shared_arrays.attach(value))
+
+    def releaseArrays(self):
+        """Drop the decoded attributes and free their shared blocks"""
+        for name, dtype, components in MeshObject.attributeLayouts:
+            value = getattr(self, name)
+            if isinstance(value, shared_arrays.SharedArray):
+                self.sharedArrays.append(value)
+            setattr(self, name, emptyAttribute(dtype, components))
+        for descriptor in self.sharedArrays:
+            shared_arrays.release(descriptor)
+        self.sharedArrays = []
+
     def createBlenderMesh(self, name="Mesh"):
         """Create a Blender mesh from the extracted data"""
+        import bpy
+
         mesh = bpy.data.meshes.new(name)
 
         # Create mesh from vertices and faces
-        mesh.from_pydata(self.vertices, [], self.faces)
+        vertices = numpy.asarray(self.vertices, dtype=numpy.float32)
+        faces = numpy.asarray(self.faces, dtype=numpy.uint32).reshape(-1, 3)
+        vertexCount = len(vertices)
+        loopVertices = faces.ravel()
+
+        mesh.vertices.add(vertexCount)
+        mesh.vertices.foreach_set("co", vertices.ravel())
+        mesh.loops.add(len(loopVertices))
+        mesh.loops.foreach_set("vertex_index", loopVertices)
+        mesh.polygons.add(len(faces))
+        mesh.polygons.foreach_set("loop_start", numpy.arange(
+            0, len(loopVertices), 3, dtype=numpy.int32))
         mesh.update()
 
+        # Loops pointing past the vertex data read the default value instead
+        lookup = numpy.minimum(loopVertices, vertexCount)
+
         # Create UV coordinates if available
-        if self.uvs:
+        if len(self.uvs) > 0:
             uv_layer = mesh.uv_layers.new(name="UVMap")
-            for i, loop in enumerate(mesh.loops):
-                try:
-                    vidx = loop.vertex_index
-                    uv_layer.data[i].uv = (
-                        self.uvs[vidx][0], 1.0 - self.uvs[vidx][1])
-                except IndexError:
-                    # Handle cases where UV data might be missing
-                    uv_layer.data[i].uv = (0.0, 0.0)
+            uvs = padAttribute(self.uvs, vertexCount, (0.0, 0.0))
+            uvs[:, 1] = 1.0 - uvs[:, 1]
+            uvs[vertexCount] = (0.0, 0.0)
+            uv_layer.data.foreach_set("uv", uvs[lookup].ravel())
 
         # Create vertex colors if available
-        if self.colors:
+        if len(self.colors) > 0:
             color_layer = mesh.vertex_colors.new(name="Col")
-            for i, loop in enumerate(mesh.loops):
-                try:
-                    vidx = loop.vertex_index
-                    color_layer.data[i].color = (
-                        self.colors[vidx][0],
-                        self.colors[vidx][1],
-                        self.colors[vidx][2],
-                        self.colors[vidx][3]
-                    )
-                except IndexError:
-                    # Handle cases where color data might be missing
-                    color_layer.data[i].color = (1.0, 1.0, 1.0, 1.0)
+            colors = padAttribute(
+                self.colors, vertexCount, (1.0, 1.0, 1.0, 1.0))
+            color_layer.data.foreach_set("color", colors[lookup].ravel())
 
         return mesh
 
 
+def mergeMeshObjects(meshes, boneNames):
+    """
+    One MeshObject with the attributes of meshes stacked and their faces offset
+
+    boneNames are the vertex group names of each mesh, the merged bone indices
+    point into the returned union of them. Also returns the index of the
+    source mesh of every face.
+    """
+    merged = MeshObject()
+    counts = [len(mesh_obj.vertices) for mesh_obj in meshes]
+    offsets = numpy.cumsum([0] + counts)[:-1]
+    groupNames = list(dict.fromkeys(name for names in boneNames for name in names))
+    groupIndices = {name: index for index, name in enumerate(groupNames)}
+
+    for name, dtype, components in MeshObject.attributeLayouts:
+        if name == "faces" or all(len(getattr(mesh_obj, name)) == 0 for mesh_obj in meshes):
+            continue
+        parts = []
+        for mesh_obj, names, count in zip(meshes, boneNames, counts):
+            values = getattr(mesh_obj, name)[:count]
+            # Meshes without the attribute get the value Blender would use
+            part = numpy.full((count, components), 1 if name == "colors" else 0, dtype=dtype)
+            part[:len(values)] = values
+            if name == "boneIndices":
+                # Into the union of the names, unmapped bones point past its end
+                remap = numpy.array([groupIndices[bone] for bone in names] + [len(groupNames)],
+                                    dtype=numpy.uint16)
+                part = remap[numpy.minimum(part, len(names))]
+            parts.append(part)
+        setattr(merged, name, numpy.concatenate(parts))
+
+    faces = []
+    faceSources = []
+    for index, (mesh_obj, count, offset) in enumerate(zip(meshes, counts, offsets)):
+        meshFaces = numpy.asarray(mesh_obj.faces, dtype=numpy.uint32).reshape(-1, 3)
+        # Faces past a mesh's own vertices would land in the next one
+        meshFaces = meshFaces[(meshFaces < count).all(axis=1)]
+        faces.append(meshFaces + numpy.uint32(offset))
+        faceSources.append(numpy.full(len(meshFaces), index, dtype=numpy.int32))
+    if len(faces) > 0:
+        merged.faces = numpy.concatenate(faces)
+        faceSources = numpy.concatenate(faceSources)
+    else:
+        faceSources = numpy.empty(0, dtype=numpy.int32)
+
+    merged.vertexCount = int(sum(counts))
+    merged.decoded = True
+    if len(meshes) > 0 and all(mesh_obj.contentHash is not None for mesh_obj in meshes):
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr([(mesh_obj.contentHash, names)
+                            for mesh_obj, names in zip(meshes, boneNames)]).encode())
+        merged.contentHash = digest.hexdigest()
+    return merged, groupNames, faceSources
+
+
+def getMeshKey(contentHash, boneNames):
+    """Mesh cache key of a mesh's content and the vertex groups it is skinned to"""
+    if len(boneNames) == 0:
+        return contentHash
+    digest = hashlib.blake2b(contentHash.encode(), digest_size=16)
+    digest.update("\0".join(boneNames).encode())
+    return digest.hexdigest()
+
+
+class MeshCache:
+    """
+    Blender meshes by content key so repeated meshes share one datablock
+
+    Holds names rather than datablocks, which undo or the user may remove,
+    and checks the key stored on the mesh before handing it out again.
+    """
+    keyProperty = "igz_content_key"
+
+    def __init__(self):
+        self.names = {}
+
+    def get(self, key):
+        import bpy
+
+        name = self.names.get(key)
+        mesh = bpy.data.meshes.get(name) if name is not None else None
+        if mesh is None or mesh.get(self.keyProperty) != key:
+            return None
+        return mesh
+
+    def add(self, key, mesh):
+        mesh[self.keyProperty] = key
+        self.names[key] = mesh.name
+
+
+# Shared by the imports of a session that set sessionMeshes
+sessionMeshCache = MeshCache()
+
+
+class ModelLibrary:
+    """
+    Collections of the models built for instancing by content key
+
+    They live under one library collection that is excluded from the view
+    layer, so only their instances show.
+    """
+    rootName = "IGZ Library"
+    keyProperty = "igz_content_key"
+
+    def __init__(self):
+        self.names = {}
+
+    def getRoot(self):
+        import bpy
+
+        root = bpy.data.collections.get(self.rootName)
+        if root is None:
+            root = bpy.data.collections.new(self.rootName)
+        scene_collection = bpy.context.scene.collection
+        if root.name not in scene_collection.children:
+            scene_collection.children.link(root)
+        bpy.context.view_layer.layer_collection.children[root.name].exclude = True
+        return root
+
+    def get(self, key):
+        import bpy
+
+        name = self.names.get(key)
+        collection = bpy.data.collections.get(name) if name is not None else None
+        if collection is None or collection.get(self.keyProperty) != key:
+            return None
+        return collection
+
+    def newCollection(self, name):
+        """Collection to build a model into, in the scene until store moves it to the library"""
+        import bpy
+
+        collection = bpy.data.collections.new(name)
+        # Armatures need their object in the view layer to enter edit mode
+        bpy.context.scene.collection.children.link(collection)
+        return collection
+
+    def store(self, collection, key):
+        import bpy
+
+        self.getRoot().children.link(collection)
+        bpy.context.scene.collection.children.unlink(collection)
+        if key is not None:
+            collection[self.keyProperty] = key
+            self.names[key] = collection.name
+
+    def discard(self, collection):
+        """Remove a collection from newCollection along with whatever was built into it"""
+        import bpy
+
+        for obj in list(collection.objects):
+            bpy.data.objects.remove(obj)
+        bpy.data.collections.remove(collection)
+
+
+# Corners of a box, bit i of the corner index picks the min or max along
+# axis i, and its twelve edges
+boxCorners = numpy.array([[(corner >> axis) & 1 for axis in range(3)] for corner in range(8)])
+boxEdges = numpy.array([(corner, corner | (1 << axis)) for corner in range(8) for axis in range(3)
+                        if not corner & (1 << axis)], dtype=numpy.int32)
+
+
+def getProxyPoints(positions, proxyMode, pointLimit):
+    """Bounding box corners or at most pointLimit evenly spread positions"""
+    if proxyMode == "BOUNDS":
+        bounds = numpy.stack([positions.min(axis=0), positions.max(axis=0)])
+        return bounds[boxCorners, numpy.arange(3)]
+    step = -(-len(positions) // pointLimit)
+    return positions[::step]
+
+
+def getMeshCache(options):
+    """Mesh cache for one import, None if meshes aren't deduplicated"""
+    if not options.dedupMeshes:
+        return None
+    if options.sessionMeshes:
+        return sessionMeshCache
+    return MeshCache()
+
+
 class ModelObject:
+    __slots__ = ("meshes", "boneList", "boneMatrices", "boneTransforms", "boneIdList",
+                 "boneMapList", "anims", "id", "transformation", "metatype")
+
     def __init__(self, id=0):
         self.meshes = []
         self.boneList = []
         self.boneMatrices = []
+        # World matrices of boneList as one (n, 4, 4) array
+        self.boneTransforms = None
         self.boneIdList = []
         self.boneMapList = []
         self.anims = []
         self.id = id
+        # 4x4 placement of the model, None leaves it at the origin
+        self.transformation = None
+        # Metatype of the object the model was read from
+        self.metatype = None
+
+    def copyParsed(self):
+        """Copy to decode and build without touching the parsed model"""
+        model = copy.copy(self)
+        model.meshes = [mesh_obj.copyParsed() for mesh_obj in self.meshes]
+        return model
+
+    def getVertexCount(self):
+        """Vertices in the file buffers of the meshes, before they are decoded or released"""
+        return sum(sum(segment.vertexCount for segment in mesh_obj.ps3Segments) if mesh_obj.isPs3
+                   else mesh_obj.vertexCount for mesh_obj in self.meshes)
+
+    def decodeMeshes(self, igz):
+        """Extract vertex and index data for the meshes that haven't been processed yet"""
+        for mesh_obj in self.meshes:
+            if not mesh_obj.decoded:
+                # Hashed for deduplication and so refreshes can tell which
+                # models changed, while the raw buffers are still there
+                if mesh_obj.contentHash is None:
+                    mesh_obj.contentHash = mesh_obj.getContentHash(
+                        igz.endianness, igz.version, igz.platform, igz.options.getDecodedAttributes())
+                if mesh_obj.isPs3:
+                    mesh_obj.buildPs3MeshNew(
+                        self.boneMapList, igz.version, igz.options)
+                else:
+                    mesh_obj.buildMesh(
+                        self.boneMapList, igz.endianness, igz.version, igz.platform, igz.options)
+                mesh_obj.decoded = True
+
+    def shareArrays(self):
+        for mesh_obj in self.meshes:
+            mesh_obj.shareArrays()
+
+    def holdArrays(self):
+        for mesh_obj in self.meshes:
+            mesh_obj.holdArrays()
+
+    def attachArrays(self):
+        for mesh_obj in self.meshes:
+            mesh_obj.attachArrays()
+
+    def releaseArrays(self):
+        for mesh_obj in self.meshes:
+            mesh_obj.releaseArrays()
+
+    def releaseRawData(self):
+        """Drop the file buffers of the meshes once they have been decoded"""
+        for mesh_obj in self.meshes:
+            mesh_obj.vertexBuffers = []
+            mesh_obj.indexBuffer = None
+            mesh_obj.ps3Segments = []
+            mesh_obj.packData = None
+            mesh_obj.platformData = None
+
+    def getBoneNames(self, bone_map):
+        """Vertex group names of the bones in a mesh's bone map"""
+        return [self.boneList[mapped_bone].name if mapped_bone < len(self.boneList)
+                else f"Bone_{mapped_bone}" for mapped_bone in bone_map]
+
+    def getContentKey(self):
+        """Digest of the meshes and skeleton, equal for models that build the same, None if a mesh wasn't hashed"""
+        digest = hashlib.blake2b(digest_size=16)
+        for mesh_obj in self.meshes:
+            if mesh_obj.contentHash is None and len(mesh_obj.vertices) > 0:
+                return None
+            digest.update(repr((mesh_obj.contentHash, mesh_obj.boneMapIndex)).encode())
+        digest.update(repr([(bone.name, bone.parentIndex) for bone in self.boneList]).encode())
+        digest.update(repr(self.boneMapList).encode())
+        if self.boneTransforms is not None:
+            digest.update(numpy.ascontiguousarray(self.boneTransforms).tobytes())
+        return digest.hexdigest()
+
+    def getSourceKey(self, igz):
+        """Digest of the file data the model is built from, hashing the raw buffers of meshes that weren't decoded yet"""
+        attributes = igz.options.getDecodedAttributes()
+        for mesh_obj in self.meshes:
+            if mesh_obj.contentHash is None and not mesh_obj.decoded:
+                mesh_obj.contentHash = mesh_obj.getContentHash(
+                    igz.endianness, igz.version, igz.platform, attributes)
+        digest = hashlib.blake2b(repr(self.getContentKey()).encode(), digest_size=16)
+        digest.update(repr([mesh_obj.name for mesh_obj in self.meshes]).encode())
+        if self.transformation is not None:
+            digest.update(numpy.ascontiguousarray(self.transformation, dtype=numpy.float64).tobytes())
+        return digest.hexdigest()
+
+    def buildProxy(self, igz, modelIndex, collection=None):
+        """Build a placeholder from the positions alone, a box or a point cloud"""
+        import bpy
+        from mathutils import Matrix
+
+        if collection is None:
+            collection = bpy.context.scene.collection
+
+        self.decodeMeshes(igz)
+        positions = [mesh_obj.vertices for mesh_obj in self.meshes if len(mesh_obj.vertices) > 0]
+        if len(positions) == 0:
+            return None
+        points = getProxyPoints(numpy.concatenate(positions).astype(numpy.float32),
+                                igz.options.proxyMode, igz.options.proxyPointLimit)
+
+        name = f"Proxy_{modelIndex}"
+        mesh = bpy.data.meshes.new(name)
+        mesh.vertices.add(len(points))
+        mesh.vertices.foreach_set("co", points.ravel())
+        if igz.options.proxyMode == "BOUNDS":
+            mesh.edges.add(len(boxEdges))
+            mesh.edges.foreach_set("vertices", boxEdges.ravel())
+        mesh.update()
+
+        proxy = bpy.data.objects.new(name, mesh)
+        # Placed like the instance it would be realized into
+        if self.transformation is not None:
+            proxy.matrix_world = Matrix(numpy.asarray(self.transformation).tolist())
+        collection.objects.link(proxy)
+        return proxy
+
+    def buildInstance(self, igz, modelIndex, collection, library, meshCache=None):
+        """
+        Place the model as an instance of its library collection, building that on first use
+
+        Returns None when the model has no mesh to instance.
+        """
+        import bpy
+        from mathutils import Matrix
+
+        self.decodeMeshes(igz)
+        key = self.getContentKey()
+        source = library.get(key) if key is not None else None
+        if source is None:
+            source = library.newCollection(f"Model_{modelIndex}")
+            objects = None
+            try:
+                objects = self.build(igz, modelIndex, source, meshCache)
+            finally:
+                # Models without a mesh object would leave empty collections behind
+                built = objects is not None and any(part >= 0 for part in objects)
+                if built:
+                    library.store(source, key)
+                else:
+                    library.discard(source)
+            if not built:
+                return None
+
+        instance = bpy.data.objects.new(f"Model_{modelIndex}", None)
+        instance.instance_type = 'COLLECTION'
+        instance.instance_collection = source
+        if self.transformation is not None:
+            instance.matrix_world = Matrix(numpy.asarray(self.transformation).tolist())
+        collection.objects.link(instance)
+        return instance
+
+    def build(self, igz, modelIndex, collection=None, meshCache=None):
+        """
+        Build Blender objects from the parsed data, sharing meshes through meshCache
+
+        Returns the objects by build part, the index of the mesh or 0 for the
+        merged one and -1 for the armature.
+        """
+        import bpy
 
-    def build(self, igz, modelIndex):
-        """Build Blender objects from the parsed data"""
         index = 0
+        objects = {}
+        if collection is None:
+            collection = bpy.context.scene.collection
 
         if len(self.meshes) == 0:
             print("No meshes found in model")
@@ -1185,64 +1837,51 @@ class ModelObject:
 
         # Create armature if we have bones
         armature = None
-        if constants.dBuildBones and len(self.boneList) > 0:
-            armature_name = f"Armature_{modelIndex}"
-            armature = bpy.data.armatures.new(armature_name)
-            armature_obj = bpy.data.objects.new(armature_name, armature)
-            bpy.context.scene.collection.objects.link(armature_obj)
-
-            # Enter edit mode to add bones
-            bpy.context.view_layer.objects.active = armature_obj
-            bpy.ops.object.mode_set(mode='EDIT')
-
-            # Create Blender bones from the bone list
-            edit_bones = {}
-            for bone in self.boneList:
-                edit_bone = armature.edit_bones.new(bone.name)
-                edit_bones[bone.index] = edit_bone
-
-                # Set up parent relationships
-                if bone.parentIndex != -1 and bone.parentIndex in edit_bones:
-                    edit_bone.parent = edit_bones[bone.parentIndex]
-
-                # Set bone positions (head, tail, roll)
-                position = bone.getPosition()
-                edit_bone.head = position
-
-                # Basic tail calculation (point down Y-axis by default)
-                if hasattr(bone, 'children') and bone.children:
-                    # Point to first child
-                    child_position = bone.children[0].getPosition()
-                    edit_bone.tail = child_position
-                else:
-                    # No children, create a small tail offset
-                    edit_bone.tail = (
-                        position[0], position[1], position[2] + 5)
-
-            # Exit edit mode
-            bpy.ops.object.mode_set(mode='OBJECT')
+        if igz.options.buildBones and len(self.boneList) > 0:
+            armature_obj = utils.create_armature_from_bones(
+                self.boneList, f"Armature_{modelIndex}", collection, self.boneTransforms)
+            armature = armature_obj.data
+            objects[-1] = armature_obj
+
+        # Extract mesh data if not already processed
+        self.decodeMeshes(igz)
+
+        # Process each mesh, or all of them merged into one
+        if igz.options.mergeMeshes:
+            parts = [self.mergeMeshes(modelIndex)]
+        else:
+            parts = [(mesh_obj, f"Mesh_{modelIndex}_{index}", self.getBoneNames(self.getBoneMap(mesh_obj)), None)
+                     for index, mesh_obj in enumerate(self.meshes)]
 
-        # Process each mesh
-        for mesh_obj in self.meshes:
-            print(f"Building mesh {index} of {len(self.meshes)}")
-            mesh_name = f"Mesh_{modelIndex}_{index}"
-
-            if len(mesh_obj.vertices) == 0:
-                # Extract mesh data if not already processed
-                if mesh_obj.isPs3:
-                    mesh_obj.buildPs3MeshNew(self.boneMapList, igz.version)
-                else:
-                    mesh_obj.buildMesh(
-                        self.boneMapList, igz.endianness, igz.version, igz.platform)
+        for index, (mesh_obj, mesh_name, bone_names, draw_calls) in enumerate(parts):
+            print(f"Building mesh {index} of {len(parts)}")
 
             if len(mesh_obj.vertices) > 0:
+                skinned = (armature and igz.options.buildBones and len(mesh_obj.weights) > 0
+                           and len(mesh_obj.boneIndices) > 0)
+                if not skinned:
+                    bone_names = []
+
+                # Reuse the Blender mesh of an identical mesh built before,
+                # vertex groups live on the mesh so the bones have to match too
+                key = None
+                mesh = None
+                if meshCache is not None and mesh_obj.contentHash is not None:
+                    key = getMeshKey(mesh_obj.contentHash, bone_names)
+                    mesh = meshCache.get(key)
+                reused = mesh is not None
+
                 # Create the Blender mesh
-                mesh = mesh_obj.createBlenderMesh(mesh_name)
+                if not reused:
+                    mesh = mesh_obj.createBlenderMesh(mesh_name)
+                    if draw_calls is not None:
+                        self.assignDrawCalls(mesh, *draw_calls)
                 blender_obj = bpy.data.objects.new(mesh_name, mesh)
-                bpy.context.scene.collection.objects.link(blender_obj)
+                collection.objects.link(blender_obj)
+                objects[index] = blender_obj
 
                 # If we have an armature, parent and add vertex groups
-                if armature and constants.dBuildBones:
+                if armature and igz.options.buildBones:
                     # Parent mesh to armature
                     blender_obj.parent = armature_obj
 
@@ -1252,233 +1891,72 @@ class ModelObject:
                     modifier.object = armature_obj
 
                     # Create vertex groups for skinning
-                    if mesh_obj.weights and mesh_obj.boneIndices:
-                        # Create groups for each bone
-                        bone_map = self.boneMapList[mesh_obj.boneMapIndex] if len(
-                            self.boneMapList) > mesh_obj.boneMapIndex else []
-
-                        # Pre-create all needed vertex groups
-                        for bone_idx in range(len(bone_map)):
-                            mapped_bone = bone_map[bone_idx]
-                            if mapped_bone < len(self.boneList):
-                                bone_name = self.boneList[mapped_bone].name
-                            else:
-                                bone_name = f"Bone_{mapped_bone}"
-
-                            if bone_name not in blender_obj.vertex_groups:
-                                blender_obj.vertex_groups.new(name=bone_name)
-
-                        # Assign weights to vertex groups
-                        for vertex_idx in range(len(mesh_obj.weights)):
-                            # Normalize weights if needed
-                            weights = mesh_obj.weights[vertex_idx]
-                            weight_sum = sum(weights)
-                            if weight_sum > 0.001 and abs(weight_sum - 1.0) > 0.01:
-                                weights = [w / weight_sum for w in weights]
-
-                            # Assign weights that are significant
-                            for i in range(4):
-                                weight = weights[i]
-                                if weight > 0.001:  # Skip near-zero weights
-                                    bone_idx = mesh_obj.boneIndices[vertex_idx][i]
-                                    if bone_idx < len(bone_map):
-                                        mapped_bone = bone_map[bone_idx]
-                                        bone_name = self.boneList[mapped_bone].name if mapped_bone < len(
-                                            self.boneList) else f"Bone_{mapped_bone}"
-
-                                        if bone_name in blender_obj.vertex_groups:
-                                            blender_obj.vertex_groups[bone_name].add(
-                                                [vertex_idx], weight, 'ADD')
-
-            index += 1
-
-        return True
-
-    def __init__(self):
-        self.name = ""
-        self.boneList = []
-        self.boneMatrices = []
-        self.boneIdList = []
-        self.boneMapList = []
-        self.anims = []
-        self.id = 0
-        self.meshes = []
-        self.meshCount = 0
-        self.name = ""
-        self.vertexBuffers = []
-        self.vertexStrides = []
-        self.vertexCount = 0
-        self.indexBuffer = None
-        self.isPs3 = False
-        self.ps3Segments = []
-        self.spuConfigInfo = False  # PS3 Exclusive
-        self.skipBuild = False
-        self.vertexElements = []
-        self.vertexStreams = []
-        self.primType = constants.PrimitiveType.TRIANGLE
-        self.indexCount = 0
-        self.boneMapIndex = 0
-        self.transformation = None
-        self.packData = None
-        self.platform = 0
-        self.platformData = None
+                    if skinned and not reused:
+                        self.assignWeights(blender_obj, mesh_obj, bone_names)
 
-        # For Blender mesh construction
-        self.vertices = []
-        self.faces = []
-        self.normals = []
-        self.uvs = []
-        self.colors = []
-        self.weights = []
-        self.boneIndices = []
-
-    def buildMesh(self, boneMapList, endianness, version, platform):
-        if self.vertexCount == 0:
-            return
+                if key is not None and not reused:
+                    meshCache.add(key, mesh)
 
-        endarg = '>' if endianness == "BE" else '<'
+        return objects
 
-        print(f"vertex count    {hex(self.vertexCount)}")
-        print(f"vertex stride   {hex(self.vertexStrides[0])}")
-        print(f"index count     {hex(self.indexCount)}")
-        print(f"name:           {self.name}")
-        print(f"bone map index: {hex(self.boneMapIndex)}")
+    def getBoneMap(self, mesh_obj):
+        return self.boneMapList[mesh_obj.boneMapIndex] if len(
+            self.boneMapList) > mesh_obj.boneMapIndex else []
 
-        # Process vertex data
-        if platform == 2 and struct.unpack(">H", self.vertexBuffers[0][0:2])[0] == 0x9F:
-            self.vertexBuffers[0] = bytes(self.vertexBuffers[0][4:])
+    def assignWeights(self, blender_obj, mesh_obj, bone_names):
+        """Create a vertex group per bone name and add the weights of mesh_obj to them"""
+        # Pre-create all needed vertex groups
+        for bone_name in bone_names:
+            if bone_name not in blender_obj.vertex_groups:
+                blender_obj.vertex_groups.new(name=bone_name)
 
-        if version >= 6:
-            packData = self.packData[2] if self.packData is not None else None
-        else:
-            packDataOffset = 0
-            for elem in self.vertexElements:
-                if elem._type == 0x2C:
-                    continue
-                print(f"processing... {elem._packDataOffset}")
-                if (elem._packTypeAndFracHint & 7) == 2:
-                    if packDataOffset < elem._packDataOffset:
-                        packDataOffset = elem._packDataOffset
-            packData = bytes(self.vertexBuffers[0][len(
-                self.vertexBuffers[0]) - packDataOffset - 4:])
-
-        for elem in self.vertexElements:
-            if elem._type == 0x2C:
-                continue
-
-            streamOffset = 0
-            for i in range(elem._stream):
-                streamOffset += (((self.vertexStreams[i] *
-                                 self.vertexCount) + 0x1F) // 0x20) * 0x20
-            print(
-                f"Getting bytes for stream from {hex(streamOffset)} to {hex(streamOffset + self.vertexCount * self.vertexStreams[elem._stream])}")
-            stream = bytes(self.vertexBuffers[0][streamOffset:streamOffset +
-                           self.vertexCount * self.vertexStreams[elem._stream]])
-            streamSize = self.vertexStreams[elem._stream]
-
-            print(f"usage: {hex(elem._usage)}; offset: {hex(elem._offset)}; stream: {hex(elem._stream)}; count: {hex(elem._count)}; type: {hex(elem._type)}; mapToElement: {hex(elem._mapToElement)}; usageIndex: {hex(elem._usageIndex)}; packDataOffset: {hex(elem._packDataOffset)}; packTypeAndFracHint: {hex(elem._packTypeAndFracHint)}; freq: {hex(elem._freq)}; streamOffset: {hex(streamOffset)}")
-
-            if elem._usage == 0:  # IG_VERTEX_USAGE_POSITION
-                stride = 0x10
-                if elem._type == 0x23:
-                    fakeVertexBuffer = self.superchargersFunkiness(endarg)
-                    stride = 0x0C
-                else:
-                    fakeVertexBuffer = elem.unpack(
-                        stream, streamSize, packData, endarg)
-
-                # Extract positions
-                for i in range(self.vertexCount):
-                    x, y, z = struct.unpack(
-                        endarg + 'fff', fakeVertexBuffer[i * stride:i * stride + 12])
-                    self.vertices.append((x, y, z))
-
-            if elem._usage == 1:  # IG_VERTEX_USAGE_NORMAL
-                vnormals = elem.unpack(stream, streamSize, packData, endarg)
-
-                # Extract normals
-                for i in range(self.vertexCount):
-                    nx, ny, nz = struct.unpack(
-                        endarg + 'fff', vnormals[i * 0x10:i * 0x10 + 12])
-                    self.normals.append((nx, ny, nz))
-
-            if elem._usage == 4:  # IG_VERTEX_USAGE_COLOR
-                vcolors = elem.unpack(stream, streamSize, packData, endarg)
-
-                # Extract colors
-                for i in range(self.vertexCount):
-                    r, g, b, a = struct.unpack(
-                        endarg + 'ffff', vcolors[i * 0x10:i * 0x10 + 16])
-                    self.colors.append((r, g, b, a))
-
-            if elem._usage == 5 and elem._usageIndex == 0:  # IG_VERTEX_USAGE_TEXCOORD
-                vtexcoords = elem.unpack(stream, streamSize, packData, endarg)
-
-                # Extract UVs
-                for i in range(self.vertexCount):
-                    u = struct.unpack(
-                        endarg + 'f', vtexcoords[i * 0x10:i * 0x10 + 4])[0]
-                    v = struct.unpack(
-                        endarg + 'f', vtexcoords[i * 0x10 + 4:i * 0x10 + 8])[0]
-                    self.uvs.append((u, v))
-
-            if elem._usage == 6 and elem._usageIndex == 0 and constants.dBuildBones:  # IG_VERTEX_USAGE_BLENDWEIGHTS
-                vblendweights = elem.unpack(
-                    stream, streamSize, packData, endarg)
-
-                # Extract weights
-                for i in range(self.vertexCount):
-                    weights = []
-                    for j in range(elem._count):
-                        weight = struct.unpack(
-                            endarg + 'f', vblendweights[i * 0x10 + j * 4:i * 0x10 + (j + 1) * 4])[0]
-                        weights.append(weight)
-                    # Pad with zeros if needed
-                    while len(weights) < 4:
-                        weights.append(0.0)
-                    self.weights.append(weights)
-
-            if elem._usage == 8 and elem._usageIndex == 0 and constants.dBuildBones:  # IG_VERTEX_USAGE_BLENDINDICES
-                vfblendindices = elem.unpack(
-                    stream, streamSize, packData, endarg)
-
-                # Extract bone indices
-                for i in range(self.vertexCount):
-                    indices = []
-                    for j in range(elem._count):
-                        index = int(struct.unpack(
-                            endarg + 'f', vfblendindices[i * 0x10 + j * 4:i * 0x10 + (j + 1) * 4])[0])
-                        indices.append(index)
-                    # Pad with zeros if needed
-                    while len(indices) < 4:
-                        indices.append(0)
-                    self.boneIndices.append(indices)
+        if len(mesh_obj.weights) == 0 or len(bone_names) == 0:
+            return
 
-        # Process index data
-        if constants.dBuildFaces and self.primType != constants.PrimitiveType.TRIANGLE_STRIP:
-            if self.vertexCount <= 0xFFFF:
-                # Extract triangles from 16-bit indices
-                for i in range(0, self.indexCount, 3):
-                    if i + 2 < self.indexCount:
-                        idx1 = struct.unpack(
-                            endarg + 'H', self.indexBuffer[i * 2:(i + 1) * 2])[0]
-                        idx2 = struct.unpack(
-                            endarg + 'H', self.indexBuffer[(i + 1) * 2:(i + 2) * 2])[0]
-                        idx3 = struct.unpack(
-                            endarg + 'H', self.indexBuffer[(i + 2) * 2:(i + 3) * 2])[0]
-                        self.faces.append((idx1, idx2, idx3))
-            else:
-                # Extract triangles from 32-bit indices
-                for i in range(0, self.indexCount, 3):
-                    if i + 2 < self.indexCount:
-                        idx1 = struct.unpack(
-                            endarg + 'I', self.indexBuffer[i * 4:(i + 1) * 4])[0]
-                        idx2 = struct.unpack(
-                            endarg + 'I', self.indexBuffer[(i + 1) * 4:(i + 2) * 4])[0]
-                        idx3 = struct.unpack(
-                            endarg + 'I', self.indexBuffer[(i + 2) * 4:(i + 3) * 4])[0]
-                        self.faces.append((idx1, idx2, idx3))
-        elif constants.dBuildFaces and self.primType == constants.PrimitiveType.TRIANGLE_STRIP:
-            # Handle triangle strips - simplified for now
-            # A proper implementation would convert strips to triangles
-            pass
+        # Normalize weights if needed
+        weights = numpy.asarray(mesh_obj.weights, dtype=numpy.float64)[:, :4] / 255.0
+        sums = weights.sum(axis=1, keepdims=True)
+        normalize = (sums > 0.001) & (numpy.abs(sums - 1.0) > 0.01)
+        weights = numpy.where(normalize, weights / numpy.where(normalize, sums, 1.0), weights)
+
+        # Significant weights of bones with a name, bones of the same name share a group
+        group_names = {}
+        group_of_bone = numpy.array([group_names.setdefault(name, len(group_names)) for name in bone_names])
+        bone_indices = numpy.asarray(mesh_obj.boneIndices, dtype=numpy.int64)[:len(weights), :4]
+        keep = (weights > 0.001) & (bone_indices < len(bone_names))
+        vertices = numpy.broadcast_to(numpy.arange(len(weights))[:, None], weights.shape)[keep]
+        groups = group_of_bone[bone_indices[keep]]
+
+        # A bone in several slots of a vertex adds up, like one ADD per slot
+        pairs, inverse = numpy.unique(vertices * len(group_names) + groups, return_inverse=True)
+        if len(pairs) == 0:
+            return
+        weights = numpy.minimum(numpy.bincount(inverse, weights[keep]), 1.0).astype(numpy.float32)
+        vertices, groups = numpy.divmod(pairs, len(group_names))
+
+        # One add per group and weight instead of one per vertex and slot
+        order = numpy.lexsort((vertices, weights, groups))
+        vertices, weights, groups = vertices[order], weights[order], groups[order]
+        starts = numpy.flatnonzero(numpy.r_[True, (groups[1:] != groups[:-1]) | (weights[1:] != weights[:-1])])
+        vertex_groups = [blender_obj.vertex_groups[name] for name in group_names]
+        for start, end in zip(starts, numpy.r_[starts[1:], len(groups)]):
+            vertex_groups[groups[start]].add(vertices[start:end].tolist(), float(weights[start]), 'ADD')
+
+    def mergeMeshes(self, modelIndex):
+        """The model's meshes as one (mesh, name, bone names, draw calls) build part"""
+        sources = [(index, mesh_obj) for index, mesh_obj in enumerate(self.meshes)
+                   if len(mesh_obj.vertices) > 0]
+        merged, group_names, face_sources = mergeMeshObjects(
+            [mesh_obj for index, mesh_obj in sources],
+            [self.getBoneNames(self.getBoneMap(mesh_obj)) for index, mesh_obj in sources])
+        slot_names = [mesh_obj.name or f"Mesh_{modelIndex}_{index}" for index, mesh_obj in sources]
+        return (merged, f"Mesh_{modelIndex}", group_names, (face_sources, slot_names))
+
+    def assignDrawCalls(self, mesh, face_sources, slot_names):
+        """One material slot per source draw call, faces use the slot of the mesh they came from"""
+        import bpy
+
+        for slot_name in slot_names:
+            mesh.materials.append(bpy.data.materials.new(slot_name))
+        mesh.polygons.foreach_set("material_index", face_sources)
+        mesh.update()
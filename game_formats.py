@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Optional
 from . import igz_file
 from . import formats
 from . import utils
@@ -10,11 +10,11 @@ from . import constants
 
 
 class sttIgzFile(igz_file.igzFile):
-    def __init__(self, data: bytes) -> None:
-        super().__init__(data)
+    def __init__(self, data: bytes, options: Optional[constants.ImportOptions] = None) -> None:
+        super().__init__(data, options)
         # On trap team, IG_CORE_PLATFORM_MARMALADE was turned into IG_CORE_PLATFORM_DEPRECATED
         self.is64Bit = ssfIgzFile.is64BitCall
-        self.arkRegisteredTypes = sttarkRegisteredTypes
+        self.arkRegisteredTypes = getRegisteredTypes(sttarkRegisteredTypes, self.options)
 
     def process_tfbSpriteInfo(self, bs: Any, offset: int) -> None:
         self.bitAwareSeek(bs, offset, 0x00, 0xD8)
@@ -59,9 +59,10 @@ class sttIgzFile(igz_file.igzFile):
         _geometry = self.process_igObject(bs, self.readPointer(bs))
 
     def process_tfbPhysicsWorld(self, bs: Any, offset: int) -> None:
-        self.addModel(offset)
-        self.bitAwareSeek(bs, offset, 0x00, 0x28)
-        _entityInfo = self.process_igObject(bs, self.readPointer(bs))
+        isModelNew = self.addModel(offset)
+        if isModelNew:
+            self.bitAwareSeek(bs, offset, 0x00, 0x28)
+            _entityInfo = self.process_igObject(bs, self.readPointer(bs))
 
     def process_tfbPhysicsCombinerLink(self, bs: Any, offset: int) -> None:
         self.bitAwareSeek(bs, offset, 0x00, 0x0C)
@@ -84,10 +85,10 @@ class sttIgzFile(igz_file.igzFile):
 # Giants implementation
 # ------------------------------------------------------------------------------
 class sgIgzFile(igz_file.igzFile):
-    def __init__(self, data: bytes) -> None:
-        super().__init__(data)
+    def __init__(self, data: bytes, options: Optional[constants.ImportOptions] = None) -> None:
+        super().__init__(data, options)
         self.is64Bit = sgIgzFile.is64BitCall
-        self.arkRegisteredTypes = sgarkRegisteredTypes
+        self.arkRegisteredTypes = getRegisteredTypes(sgarkRegisteredTypes, self.options)
 
     def is64BitCall(self) -> bool:
         platformbittness = [
@@ -142,10 +143,10 @@ class sgIgzFile(igz_file.igzFile):
 # Spyro's Adventure implementation
 # ------------------------------------------------------------------------------
 class ssaIgzFile(igz_file.igzFile):
-    def __init__(self, data: bytes) -> None:
-        super().__init__(data)
+    def __init__(self, data: bytes, options: Optional[constants.ImportOptions] = None) -> None:
+        super().__init__(data, options)
         self.is64Bit = ssaIgzFile.is64BitCall
-        self.arkRegisteredTypes = ssaarkRegisteredTypes
+        self.arkRegisteredTypes = getRegisteredTypes(ssaarkRegisteredTypes, self.options)
 
     def is64BitCall(self) -> bool:
         platformbittness = [
@@ -179,8 +180,8 @@ class ssaIgzFile(igz_file.igzFile):
 class sscIgzFile(igz_file.igzFile):
     """SuperChargers implementation"""
 
-    def __init__(self, data: bytes) -> None:
-        super().__init__(data)
+    def __init__(self, data: bytes, options: Optional[constants.ImportOptions] = None) -> None:
+        super().__init__(data, options)
         self.is64Bit = sscIgzFile.is64BitCall
         self.arkRegisteredTypes = sscarkRegisteredTypes
 
@@ -208,7 +209,7 @@ class sscIgzFile(igz_file.igzFile):
         return platformbittness[self.platform]
 
     def process_CGraphicsSkinInfo(self, bs: Any, offset: int) -> None:
-        self.models.append(formats.ModelObject())
+        self.newModel()
         self.bitAwareSeek(bs, offset, 0x28, 0x14)
         _skeleton = self.process_igObject(bs, self.readPointer(bs))
         self.bitAwareSeek(bs, offset, 0x30, 0x18)
@@ -226,28 +227,29 @@ class sscIgzFile(igz_file.igzFile):
     def process_igSkeletonBoneList(self, bs: Any, offset: int) -> None:
         bones = self.process_igObjectList(bs, offset)
         endarg = constants.Endianness.BIG if self.endianness == "BE" else constants.Endianness.LITTLE
-        index = 0
 
-        # Check if there are any corrupted bones
-        for bone in bones:
-            if bone[2] == -1:
-                bones.remove(bone)
+        # Drop corrupted bones
+        bones = [bone for bone in bones if bone[2] != -1]
 
-        mtxStream = utils.NoeBitStream(self.models[-1].boneMatrices, endarg)
+        matrices, valid = utils.invertJointMatrices(
+            self.models[-1].boneMatrices, [bone[2] for bone in bones], endarg)
 
-        for bone in bones:
+        for index, bone in enumerate(bones):
             print(f"bone_{index}_{bone[2]}_{bone[1]}::{bone[0]}::{bone[3]}")
 
             # Create a Blender-compatible bone
             bone_obj = utils.Bone(bone[2], bone[0], bone[1]-1, bone[3])
 
-            if bone[2] != -1:
-                mtxStream.seek(bone[2] * 0x40, constants.SeekMode.ABS)
-                bone_matrix_data = mtxStream.readBytes(0x40)
-                bone_obj.setMatrix(bone_matrix_data, endarg)
+            if valid[index]:
+                bone_obj.matrix = matrices[index]
+                bone_obj.position = tuple(matrices[index, :3, 3])
+            else:
+                # Bones without a usable matrix sit at their translation
+                matrices[index, :3, 3] = bone[3]
 
             self.models[-1].boneList.append(bone_obj)
-            index += 1
+
+        self.models[-1].boneTransforms = matrices
 
     def process_igSkeletonBone(self, bs: Any, offset: int) -> tuple:
         _name = self.process_igNamedObject(bs, offset)
@@ -260,7 +262,7 @@ class sscIgzFile(igz_file.igzFile):
         return (_name, _parentIndex, _blendMatrixIndex, _translation)
 
     def process_igModelInfo(self, bs: Any, offset: int) -> None:
-        self.models.append(formats.ModelObject())
+        self.newModel()
         self.bitAwareSeek(bs, offset, 0x28, 0x14)
         _modelData = self.process_igObject(bs, self.readPointer(bs))
 
@@ -480,10 +482,10 @@ class sscIgzFile(igz_file.igzFile):
 # Swap Force implementation
 # ------------------------------------------------------------------------------
 class ssfIgzFile(igz_file.igzFile):
-    def __init__(self, data: bytes) -> None:
-        super().__init__(data)
+    def __init__(self, data: bytes, options: Optional[constants.ImportOptions] = None) -> None:
+        super().__init__(data, options)
         self.is64Bit = ssfIgzFile.is64BitCall
-        self.arkRegisteredTypes = ssfarkRegisteredTypes
+        self.arkRegisteredTypes = getRegisteredTypes(ssfarkRegisteredTypes, self.options)
 
     def is64BitCall(self) -> bool:
         platformbittness = [
@@ -509,7 +511,7 @@ class ssfIgzFile(igz_file.igzFile):
         return platformbittness[self.platform]
 
     def process_igSceneInfo(self, bs: Any, offset: int) -> None:
-        self.models.append(formats.ModelObject())
+        self.newModel()
         self.bitAwareSeek(bs, offset, 0x00, 0x14)
         _sceneGraph = self.process_igObject(bs, self.readPointer(bs))
 
@@ -520,6 +522,20 @@ class ssfIgzFile(igz_file.igzFile):
     def process_igTransform(self, bs: Any, offset: int) -> None:
         self.process_igGroup(bs, offset)
 
+    def process_igTransformPlacement(self, bs: Any, offset: int) -> None:
+        """igTransform that places the models below it, registered for instanced imports only"""
+        if self.is64Bit(self):
+            print(f"Ignoring the placement of igTransform at {hex(offset)}, its 64 bit layout is unknown")
+            ssfIgzFile.process_igGroup(self, bs, offset)
+            return
+        # The matrix offset is only checked against synthetic files so far
+        self.bitAwareSeek(bs, offset, 0x00, 0x30)
+        self.pushPlacement(self.readMatrix44(bs))
+        try:
+            ssfIgzFile.process_igGroup(self, bs, offset)
+        finally:
+            self.popPlacement()
+
     def process_igFxMaterialNode(self, bs: Any, offset: int) -> None:
         self.process_igGroup(bs, offset)
 
@@ -545,7 +561,7 @@ class ssfIgzFile(igz_file.igzFile):
         _indexBuffer = self.process_igObject(bs, self.readPointer(bs))
 
     def process_asAnimationDatabase(self, bs: Any, offset: int) -> None:
-        self.models.append(formats.ModelObject())
+        self.newModel()
         self.bitAwareSeek(bs, offset, 0x00, 0x14)
         _skeleton = self.process_igObject(bs, self.readPointer(bs))
         self.bitAwareSeek(bs, offset, 0x00, 0x18)
@@ -785,3 +801,41 @@ sscarkRegisteredTypes = {
     "igPS3EdgeGeometry": sscIgzFile.process_igPS3EdgeGeometry,
     "igPS3EdgeGeometrySegment": sscIgzFile.process_igPS3EdgeGeometrySegment,
 }
+
+
+def getRegisteredTypes(registeredTypes: dict, options: constants.ImportOptions) -> dict:
+    """
+    A scene graph game's registry, with igTransform placing models for instanced imports
+
+    Other imports walk transforms like they always did, the placement layout
+    hasn't been checked against game files yet.
+    """
+    if not options.instanceModels:
+        return registeredTypes
+    return dict(registeredTypes, igTransform=ssfIgzFile.process_igTransformPlacement)
+
+
+def createParser(data: bytes, options: Optional[constants.ImportOptions] = None) -> igz_file.igzFile:
+    """Probe the IGZ header and return the parser for the file's version"""
+    bs = utils.NoeBitStream(data, constants.Endianness.BIG)
+    magic = bs.readUInt()
+    if magic == 0x015A4749:
+        bs = utils.NoeBitStream(data, constants.Endianness.LITTLE)
+        bs.readUInt()
+    elif magic != 0x49475A01:
+        raise ValueError("Invalid IGZ file format")
+
+    version = bs.readUInt()
+
+    if version == 0x05:
+        return ssaIgzFile(data, options)
+    elif version == 0x06:
+        return sgIgzFile(data, options)
+    elif version == 0x07:
+        return ssfIgzFile(data, options)
+    elif version == 0x08:
+        return sttIgzFile(data, options)
+    elif version == 0x09:
+        return sscIgzFile(data, options)
+    else:
+        raise NotImplementedError(f"Version {hex(version)} is unsupported.")
@@ -2,13 +2,20 @@
 Base IGZ file class for handling Skylanders file formats
 """
 
+import queue
 import struct
-from typing import Any, List, Optional
+import threading
+from typing import Any, Callable, Iterator, List, Optional, Sequence
+import numpy
 from . import constants
 from . import utils
 from . import formats
 
 
+class ParseCancelled(Exception):
+    """Unwinds the graph parse when its consumer stopped iterating"""
+
+
 class igzFile:
     inFile: utils.NoeBitStream
     endianness: str
@@ -19,11 +26,17 @@ class igzFile:
     platform: int
     version: int
     models: List[Any]
+    occurrences: List[Any]
+    placements: List[Any]
     boneIdList: List[Any]
     is64Bit: Optional[Any]
     arkRegisteredTypes: Optional[Any]
+    options: constants.ImportOptions
+    headerLoaded: bool
+    graphLoaded: bool
 
-    def __init__(self, data: bytes) -> None:
+    def __init__(self, data: bytes, options: Optional[constants.ImportOptions] = None) -> None:
+        self.options = options if options is not None else constants.ImportOptions()
         self.inFile = utils.NoeBitStream(data, constants.Endianness.BIG)
         self.endianness = "BE"
         magic = self.inFile.readUInt()
@@ -39,16 +52,31 @@ class igzFile:
         self.version = 0
 
         self.models = []
+        # (model index, matrix) of every placed reference to a model after its first
+        self.occurrences = []
+        # World matrices of the transforms around the object being parsed
+        self.placements = []
         self.boneIdList = []
 
         self.is64Bit = None
         self.arkRegisteredTypes = None
 
+        self.headerLoaded = False
+        self.graphLoaded = False
+        # Called with each model once it is complete, while the graph is parsed
+        self.modelSink = None
+        self.completedCount = 0
+
     def __del__(self) -> None:
         self.arkRegisteredTypes = None
         self.is64Bit = None
 
     def loadFile(self) -> None:
+        for model in self.iter_models():
+            pass
+
+    def loadHeader(self) -> None:
+        """Read the header and the fixup sections, everything but the object graph"""
         bs = self.inFile
         bs.seek(0x0, constants.SeekMode.ABS)
 
@@ -74,45 +102,176 @@ class igzFile:
 
         bs.seek(self.pointers[0], constants.SeekMode.ABS)
         self.processFixupSections(bs, numFixups)
-        if constants.dFirstObjectOffset >= 0:
-            self.process_igObject(bs, constants.dFirstObjectOffset)
+        self.headerLoaded = True
+
+    def iter_models(self) -> Iterator[Any]:
+        """
+        Parse the object graph, yielding each model as soon as it is complete
+
+        Handlers only ever add to the last model, so a model is complete once
+        the next one is started or the whole graph was read. Handlers recurse
+        through the graph, so it is parsed on a helper thread that waits at
+        every completed model until it was taken. Only the model being parsed
+        and the one handed out are held at a time, whatever the number of
+        root objects.
+        """
+        if self.graphLoaded:
+            yield from self.models
+            return
+
+        if not self.headerLoaded:
+            self.loadHeader()
+
+        handoff = queue.Queue(1)
+        cancelled = threading.Event()
+
+        def put(item: Any) -> None:
+            while True:
+                if cancelled.is_set():
+                    raise ParseCancelled()
+                try:
+                    handoff.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def parse() -> None:
+            try:
+                self.modelSink = lambda model: put((model, None))
+                self.processGraph()
+                self.graphLoaded = True
+                self.completeModels(len(self.models))
+                put((None, None))
+            except ParseCancelled:
+                pass
+            except BaseException as e:
+                try:
+                    put((None, e))
+                except ParseCancelled:
+                    pass
+            finally:
+                self.modelSink = None
+
+        thread = threading.Thread(target=parse, daemon=True)
+        thread.start()
+        try:
+            while True:
+                model, error = handoff.get()
+                if error is not None:
+                    raise error
+                if model is None:
+                    return
+                yield model
+        finally:
+            cancelled.set()
+            thread.join()
+
+    def processGraph(self) -> None:
+        """Run the handlers over the whole object graph"""
+        bs = self.inFile
+        if self.options.firstObjectOffset >= 0:
+            self.process_igObject(bs, self.options.firstObjectOffset)
+        elif self.version >= 0x09:
+            for rootObject in self.iter_igObjectList(bs, self.pointers[1]):
+                pass
         else:
-            if self.version >= 0x09:
-                self.process_igObjectList(bs, self.pointers[1])
-            else:
-                self.process_igObjectList(bs, self.pointers[1] + 4)
+            for rootObject in self.iter_igObjectList(bs, self.pointers[1] + 4):
+                pass
+
+    def completeModels(self, count: int) -> None:
+        """Hand the models before count to the model sink, each only once"""
+        while self.completedCount < count:
+            model = self.models[self.completedCount]
+            self.completedCount += 1
+            if self.modelSink is not None:
+                self.modelSink(model)
+
+    def newModel(self, id: int = 0) -> Any:
+        """Start a model, which completes the ones before it"""
+        self.completeModels(len(self.models))
+        model = formats.ModelObject(id)
+        model.transformation = self.getPlacement()
+        self.models.append(model)
+        return model
 
     def addModel(self, id: int) -> bool:
         shouldAddModel = True
         if len(self.models) > 0:
-            for model in self.models:
+            for index, model in enumerate(self.models):
                 if model.id == id:
                     shouldAddModel = False
                     break
         if shouldAddModel == True:
-            self.models.append(formats.ModelObject(id))
+            self.newModel(id)
             print(f"Adding model with id {hex(id)}, model didn't exist")
         else:
             print(f"Adding model with id {hex(id)}, model did exist")
+            self.addOccurrence(index)
         return shouldAddModel
 
-    def buildMeshes(self) -> None:
-        """Build Blender meshes from the parsed data"""
+    def addOccurrence(self, index: int) -> None:
+        """Record another placement of the model at index, references outside transforms place nothing"""
+        placement = self.getPlacement()
+        if placement is None:
+            return
+        known = [self.models[index].transformation] + \
+            [matrix for other, matrix in self.occurrences if other == index]
+        if any(matrix is not None and numpy.array_equal(matrix, placement) for matrix in known):
+            return
+        self.occurrences.append((index, placement))
+
+    def getPlacement(self) -> Optional[Any]:
+        """World matrix of the innermost transform being parsed, None outside of transforms"""
+        return self.placements[-1] if len(self.placements) > 0 else None
+
+    def pushPlacement(self, matrix: Any) -> None:
+        """Enter a transform, matrices that aren't finite leave the placement as it was"""
+        parent = self.getPlacement()
+        if not numpy.isfinite(matrix).all():
+            matrix = parent if parent is not None else numpy.eye(4)
+        elif parent is not None:
+            matrix = parent @ matrix
+        self.placements.append(matrix)
+
+    def popPlacement(self) -> None:
+        self.placements.pop()
+
+    def getModelRange(self) -> Sequence[int]:
+        """Return the indices of the models that should be built"""
+        if self.options.modelIndices is not None:
+            return [index for index in sorted(self.options.modelIndices) if index < len(self.models)]
+
         startIndex = 0
         numModels = len(self.models)
 
-        # If there are too many models, ask the user how many to import
-        if len(self.models) > constants.dModelThreshold:
+        # If there are too many models, ask the user how many to import,
+        # placeholders are cheap enough to build every one
+        if len(self.models) > self.options.modelThreshold and self.options.proxyMode == "NONE":
             # In Blender, we'll replace this with a proper UI dialog
             startIndex = 0  # Default to starting from the first model
-            numModels = min(constants.dModelThreshold, len(
+            numModels = min(self.options.modelThreshold, len(
                 self.models))  # Limit to threshold by default
 
+        return range(startIndex, startIndex + numModels)
+
+    def buildMeshes(self) -> None:
+        """Build Blender meshes while the file is parsed"""
         # Process the selected models
-        for index in range(numModels):
-            print(f"Building model {index+startIndex} of {len(self.models)}")
-            if len(self.models[index+startIndex].meshes) > 0:
-                self.models[index+startIndex].build(self, index+startIndex)
+        for index, model in enumerate(self.iter_models()):
+            if not self.isModelSelected(index):
+                continue
+            print(f"Building model {index}")
+            if len(model.meshes) > 0:
+                model.build(self, index)
+            # Only the decoded data is needed once the objects exist
+            model.releaseRawData()
+            model.releaseArrays()
+
+    def isModelSelected(self, index: int) -> bool:
+        """Whether getModelRange will contain index, without knowing the model count yet"""
+        if self.options.modelIndices is not None:
+            return index in self.options.modelIndices
+        return index < self.options.modelThreshold or self.options.proxyMode != "NONE"
 
     def bitAwareSeek(self, bs: utils.NoeBitStream, baseOffset: int, offset64: int, offset32: int) -> None:
         if self.is64Bit(self):
@@ -185,6 +344,11 @@ class igzFile:
     def readVector3(self, bs: utils.NoeBitStream) -> tuple:
         return (bs.readFloat(), bs.readFloat(), bs.readFloat())
 
+    def readMatrix44(self, bs: utils.NoeBitStream) -> Any:
+        """A float 4x4 matrix, stored column major, transposed into Blender's row major order"""
+        values = [bs.readFloat() for i in range(16)]
+        return numpy.array(values, dtype=numpy.float64).reshape(4, 4).T
+
     def readString(self, bs: utils.NoeBitStream) -> str:
         if self.is64Bit(self):
             raw = bs.readUInt64()
@@ -227,15 +391,15 @@ class igzFile:
                     if self.version > 0x07 and bs.tell() % 2 != 0:
                         bs.seek(1, constants.SeekMode.REL)
             if magic == 0x4E484D54 or magic == 10:
+                # Views instead of copies, the buffers are only read once the
+                # model that uses them gets decoded
+                dataView = memoryview(bs.data)
                 for j in range(count):
                     tmhnSize = bs.readUInt() & 0x00FFFFFF
                     if self.is64Bit(self):
                         bs.seek(0x04, constants.SeekMode.REL)
                     tmhnOffset = self.readPointer(bs)
-                    offset = bs.tell()
-                    bs.seek(tmhnOffset, constants.SeekMode.ABS)
-                    memory = bs.readBytes(tmhnSize)
-                    bs.seek(offset, constants.SeekMode.ABS)
+                    memory = dataView[tmhnOffset:tmhnOffset + tmhnSize]
                     self.thumbnails.append((tmhnSize, tmhnOffset, memory))
 
             start += length
@@ -255,7 +419,13 @@ class igzFile:
             return None
 
         if metatype in self.arkRegisteredTypes:
-            return self.arkRegisteredTypes[metatype](self, bs, pointer)
+            modelCount = len(self.models)
+            result = self.arkRegisteredTypes[metatype](self, bs, pointer)
+            # Models take the metatype of the innermost object that added them
+            for model in self.models[modelCount:]:
+                if model.metatype is None:
+                    model.metatype = metatype
+            return result
         else:
             return None
 
@@ -274,15 +444,16 @@ class igzFile:
 
     # ☑️
     def process_igObjectList(self, bs: utils.NoeBitStream, offset: int) -> List[Optional[Any]]:
+        return list(self.iter_igObjectList(bs, offset))
+
+    def iter_igObjectList(self, bs: utils.NoeBitStream, offset: int) -> Iterator[Optional[Any]]:
         dataList = self.process_igDataList(bs, offset)
         pointerSize = 4
         if self.is64Bit(self):
             pointerSize = 8
-        returns = []
         for i in range(dataList[0]):
             bs.seek(dataList[2][1] + i * pointerSize, constants.SeekMode.ABS)
-            returns.append(self.process_igObject(bs, self.readPointer(bs)))
-        return returns
+            yield self.process_igObject(bs, self.readPointer(bs))
 
     def process_igIntList(self, bs: utils.NoeBitStream, offset: int) -> List[int]:
         dataList = self.process_igDataList(bs, offset)
@@ -0,0 +1,791 @@
+"""
+Synthetic IGZ writer for test fixtures and benchmarks
+
+Emits files with the header, section pointers, TSTR/TMET/TMHN fixups and the
+object layouts each game_formats registry reads, so scale tests and benchmarks
+don't need retail assets. Only the objects the parser follows are written.
+
+Object graphs per version:
+    0x05, 0x06  tfbPhysicsModel -> tfbPhysicsBody -> igGroup -> igBlendMatrixSelect
+                -> tfbRuntimeTechniqueInstance -> igGeometryAttr
+    0x07        igSceneInfo/asAnimationDatabase -> igGroup -> igBlendMatrixSelect
+                -> igGeometry -> igGeometryAttr
+    0x08        tfbPhysicsModel -> tfbPhysicsBody -> tfbBodyEntityInfo -> Drawable
+                -> igGeometryAttr
+    0x09, 0x0A  igModelInfo/CGraphicsSkinInfo -> igModelData -> igModelDrawCallData
+
+The scene graph handlers of versions 0x05 to 0x08 only know 32-bit offsets, so
+64-bit platforms are limited to 0x09 and 0x0A. Version 0x0A reuses the
+SuperChargers layout, there is no parser for it yet.
+"""
+
+import math
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+import numpy
+
+from . import game_formats
+
+# Vertex usages of the attributes of a FixtureMesh
+vertexUsages = {
+    "positions": 0,
+    "normals": 1,
+    "colors": 4,
+    "uvs": 5,
+    "weights": 6,
+    "boneIndices": 8,
+}
+
+defaultVertexTypes = {
+    "positions": 0x02,     # FLOAT3
+    "normals": 0x02,       # FLOAT3
+    "colors": 0x04,        # UBYTE4N_COLOR
+    "uvs": 0x01,           # FLOAT2
+    "weights": 0x1A,       # UBYTE4N
+    "boneIndices": 0x17,   # UBYTE4
+}
+
+# Vertex types stored as plain components, (dtype, component count, normaliser)
+plainVertexTypes = {
+    0x00: ("f4", 1, None),      # FLOAT1
+    0x01: ("f4", 2, None),      # FLOAT2
+    0x02: ("f4", 3, None),      # FLOAT3
+    0x03: ("f4", 4, None),      # FLOAT4
+    0x04: ("u1", 4, 0xFF),      # UBYTE4N_COLOR
+    0x0B: ("i4", 1, None),      # INT1
+    0x0C: ("i4", 2, None),      # INT2
+    0x0D: ("i4", 4, None),      # INT4
+    0x17: ("u1", 4, None),      # UBYTE4
+    0x19: ("i1", 4, None),      # BYTE4
+    0x1A: ("u1", 4, 0xFF),      # UBYTE4N
+    0x1C: ("i1", 4, 0x7F),      # BYTE4N
+    0x1D: ("i2", 2, None),      # SHORT2
+    0x1E: ("i2", 4, None),      # SHORT4
+    0x1F: ("u2", 2, None),      # USHORT2
+    0x20: ("u2", 4, None),      # USHORT4
+    0x21: ("i2", 2, 0x7FFF),    # SHORT2N
+    0x23: ("i2", 4, 0x7FFF),    # SHORT4N
+    0x24: ("u2", 2, 0xFFFF),    # USHORT2N
+    0x26: ("u2", 4, 0xFFFF),    # USHORT4N
+    0x2A: ("f2", 2, None),      # HALF2
+    0x2B: ("f2", 4, None),      # HALF4
+    0x2E: ("i2", 3, None),      # SHORT3
+}
+
+# Vertex types packed into a single integer, (dtype, size)
+packedVertexTypes = {
+    0x08: ("u2", 2),    # UBYTE2N_COLOR_5650
+    0x09: ("u2", 2),    # UBYTE2N_COLOR_5551
+    0x0A: ("u2", 2),    # UBYTE2N_COLOR_4444
+    0x27: ("u4", 4),    # UDEC3
+    0x28: ("u4", 4),    # DEC3N
+    0x29: ("u4", 4),    # DEC3N_S11_11_10
+}
+
+
+class FixtureBone:
+    """Bone of a synthetic skeleton, parentIndex is -1 for roots"""
+    name: str
+    parentIndex: int
+    translation: Tuple[float, float, float]
+    matrix: Any
+
+    def __init__(self, name: str, parentIndex: int, translation: Tuple[float, float, float], matrix: Any = None) -> None:
+        self.name = name
+        self.parentIndex = parentIndex
+        self.translation = translation
+        # World space bind matrix, translation only if not given
+        if matrix is None:
+            matrix = numpy.identity(4)
+            matrix[:3, 3] = translation
+        self.matrix = numpy.asarray(matrix, dtype=numpy.float64)
+
+
+class FixtureMesh:
+    """
+    Mesh of a synthetic model
+
+    Attributes are per vertex arrays, vertexTypes overrides the igVertexType
+    each one is stored as. boneMap maps the mesh's bone indices to skeleton
+    bones. packExponent scales positions by 2 ** packExponent through the
+    vertex buffer's pack data, for integer position types.
+    """
+    name: str
+    positions: Any
+    faces: Any
+    normals: Any
+    uvs: Any
+    colors: Any
+    weights: Any
+    boneIndices: Any
+    boneMap: List[int]
+    vertexTypes: Dict[str, int]
+    packExponent: int
+
+    def __init__(self, positions: Any, faces: Any, normals: Any = None, uvs: Any = None, colors: Any = None,
+                 weights: Any = None, boneIndices: Any = None, boneMap: Optional[List[int]] = None,
+                 vertexTypes: Optional[Dict[str, int]] = None, packExponent: int = 0, name: str = "") -> None:
+        self.name = name
+        self.positions = numpy.asarray(positions, dtype=numpy.float64)
+        self.faces = numpy.asarray(faces, dtype=numpy.int64).reshape(-1, 3)
+        self.normals = normals
+        self.uvs = uvs
+        self.colors = colors
+        self.weights = weights
+        self.boneIndices = boneIndices
+        self.boneMap = boneMap if boneMap is not None else []
+        self.vertexTypes = dict(defaultVertexTypes)
+        if vertexTypes is not None:
+            self.vertexTypes.update(vertexTypes)
+        self.packExponent = packExponent
+
+    def getAttributes(self) -> List[Tuple[str, Any]]:
+        """The attributes that are set, positions first"""
+        attributes = []
+        for name in vertexUsages:
+            values = getattr(self, name)
+            if values is not None:
+                attributes.append(
+                    (name, numpy.asarray(values, dtype=numpy.float64)))
+        return attributes
+
+
+class FixtureModel:
+    """Model of a synthetic file, the meshes share the skeleton"""
+    meshes: List[FixtureMesh]
+    bones: List[FixtureBone]
+    placements: List[Any]
+
+    def __init__(self, meshes: List[FixtureMesh], bones: Optional[List[FixtureBone]] = None,
+                 placements: Optional[List[Any]] = None) -> None:
+        self.meshes = meshes
+        self.bones = bones if bones is not None else []
+        # Row major 4x4 world matrices, versions 0x05, 0x06 and 0x08 reference
+        # the model from one igTransform per placement, which only instanced
+        # imports parse
+        self.placements = placements if placements is not None else []
+
+
+def encodeVertexAttribute(values: Any, vertexType: int, endarg: str, packExponent: int = 0, isPosition: bool = False) -> numpy.ndarray:
+    """Encode (vertexCount, components) values as the bytes of vertexType, one row per vertex"""
+    values = numpy.asarray(values, dtype=numpy.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    vertexCount = len(values)
+
+    if vertexType in plainVertexTypes:
+        dtype, componentCount, normaliser = plainVertexTypes[vertexType]
+        components = numpy.zeros((vertexCount, componentCount))
+        used = min(componentCount, values.shape[1])
+        components[:, :used] = values[:, :used]
+        if vertexType == 0x23 and isPosition and vertexCount > 0:
+            # SuperChargers positions, xyz are divided by w on load
+            scale = max(1, min(0x7FFF, int(0x7FFF / max(numpy.abs(values[:, :3]).max(), 1e-6))))
+            components[:, :3] = values[:, :3] * scale
+            components[:, 3] = scale
+        elif normaliser is not None:
+            components *= normaliser
+        components *= 2.0 ** packExponent
+        if dtype[0] in "iu":
+            info = numpy.iinfo(dtype)
+            components = numpy.clip(numpy.rint(components), info.min, info.max)
+        encoded = components.astype(f"{endarg}{dtype}")
+        return encoded.view(numpy.uint8).reshape(vertexCount, -1)
+
+    if vertexType not in packedVertexTypes:
+        raise NotImplementedError(
+            f"Writing vertex type {hex(vertexType)} is not supported.")
+
+    dtype, size = packedVertexTypes[vertexType]
+    components = numpy.zeros((vertexCount, 4))
+    components[:, 3] = 1.0
+    used = min(4, values.shape[1])
+    components[:, :used] = values[:, :used]
+
+    def unorm(channel, bits):
+        return numpy.rint(numpy.clip(components[:, channel], 0.0, 1.0) * ((1 << bits) - 1)).astype(numpy.uint32)
+
+    def signMagnitude(channel, bits):
+        magnitude = numpy.rint(numpy.clip(numpy.abs(components[:, channel]), 0.0, 1.0) * ((1 << bits) - 1)).astype(numpy.uint32)
+        return magnitude | numpy.where(components[:, channel] < 0, 1 << bits, 0).astype(numpy.uint32)
+
+    if vertexType == 0x08:
+        packed = (unorm(0, 5) << 11) | (unorm(1, 6) << 5) | unorm(2, 5)
+    elif vertexType == 0x09:
+        packed = unorm(0, 5) | (unorm(1, 5) << 5) | (unorm(2, 5) << 10) | (unorm(3, 1) << 15)
+    elif vertexType == 0x0A:
+        packed = unorm(0, 4) | (unorm(1, 4) << 4) | (unorm(2, 4) << 8) | (unorm(3, 4) << 12)
+    elif vertexType == 0x27:
+        raw = numpy.clip(numpy.rint(components[:, :3]), 0, 0x3FF).astype(numpy.uint32)
+        packed = raw[:, 0] | (raw[:, 1] << 10) | (raw[:, 2] << 20)
+    elif vertexType == 0x28:
+        packed = signMagnitude(0, 9) | (signMagnitude(1, 9) << 10) | (signMagnitude(2, 9) << 20)
+    else:
+        packed = signMagnitude(0, 10) | (signMagnitude(1, 10) << 11) | (signMagnitude(2, 9) << 22)
+
+    encoded = packed.astype(f"{endarg}{dtype}")
+    return encoded.view(numpy.uint8).reshape(vertexCount, size)
+
+
+def getIs64BitCall(version: int) -> Any:
+    """The parser's platform bitness table for a version"""
+    if version == 0x05:
+        return game_formats.ssaIgzFile.is64BitCall
+    elif version == 0x06:
+        return game_formats.sgIgzFile.is64BitCall
+    elif version in (0x07, 0x08):
+        # Trap Team reuses the Swap Force table
+        return game_formats.ssfIgzFile.is64BitCall
+    elif version in (0x09, 0x0A):
+        return game_formats.sscIgzFile.is64BitCall
+    raise NotImplementedError(f"Version {hex(version)} is unsupported.")
+
+
+class IgzWriter:
+    """
+    Lays out objects and memory in sections and serialises them with fixups
+
+    Locations are (section, offset) tuples, None is a null pointer. Section 0
+    starts with the root object list like the parser expects.
+    """
+    version: int
+    platform: int
+    endianness: str
+    endarg: str
+    stringList: List[str]
+    metatypes: List[str]
+    thumbnails: List[Tuple[int, Tuple[int, int]]]
+    sections: List[bytearray]
+    rootObjects: List[Tuple[int, int]]
+
+    def __init__(self, version: int, platform: int = 1, endianness: str = "LE") -> None:
+        self.version = version
+        self.platform = platform
+        self.endianness = endianness
+        self.endarg = '>' if endianness == "BE" else '<'
+        # The parser's own table decides the pointer size of a platform
+        self.pointerSize = 8 if getIs64BitCall(version)(self) else 4
+        self.stringList = []
+        self.stringIndices = {}
+        self.metatypes = []
+        self.metatypeIndices = {}
+        self.thumbnails = []
+        self.rootObjects = []
+
+        if version <= 0x06:
+            self.pointerShift = 0x18
+            self.sectionLimit = 0x00FFFFFF
+        else:
+            self.pointerShift = 0x1B
+            self.sectionLimit = 0x07FFFFFF
+
+        # The root list sits at the start of the first section, behind four
+        # bytes before SuperChargers
+        self.sections = [bytearray()]
+        if version < 0x09:
+            self.allocate(4)
+        self.rootList = self.allocate(self.field(0x28, 0x18))
+        self.putUInt(self.rootList, 0, self.getMetatypeIndex("igObjectList"),
+                     self.pointerSize)
+
+    def is64Bit(self) -> bool:
+        return self.pointerSize == 8
+
+    def field(self, offset64: int, offset32: int) -> int:
+        return offset64 if self.is64Bit() else offset32
+
+    def allocate(self, size: int, align: int = 4) -> Tuple[int, int]:
+        section = self.sections[-1]
+        offset = (len(section) + align - 1) // align * align
+        if offset + size > self.sectionLimit:
+            if size > self.sectionLimit:
+                raise ValueError(
+                    f"Block of {hex(size)} bytes doesn't fit in a section")
+            if len(self.sections) >= 0x1F:
+                raise ValueError("Ran out of sections")
+            self.sections.append(bytearray())
+            return self.allocate(size, align)
+        section.extend(bytes(offset + size - len(section)))
+        return (len(self.sections) - 1, offset)
+
+    def allocateObject(self, metatype: str, size64: int, size32: int) -> Tuple[int, int]:
+        location = self.allocate(self.field(size64, size32), 8)
+        self.putUInt(location, 0, self.getMetatypeIndex(metatype), self.pointerSize)
+        return location
+
+    def allocateMemory(self, data: bytes, align: int = 0x10) -> Tuple[int, int]:
+        location = self.allocate(len(data), align)
+        self.sections[location[0]][location[1]:location[1] + len(data)] = data
+        return location
+
+    def getMetatypeIndex(self, metatype: str) -> int:
+        if metatype not in self.metatypeIndices:
+            self.metatypeIndices[metatype] = len(self.metatypes)
+            self.metatypes.append(metatype)
+        return self.metatypeIndices[metatype]
+
+    def getStringIndex(self, string: str) -> int:
+        if string not in self.stringIndices:
+            self.stringIndices[string] = len(self.stringList)
+            self.stringList.append(string)
+        return self.stringIndices[string]
+
+    def addRootObject(self, location: Tuple[int, int]) -> None:
+        self.rootObjects.append(location)
+
+    # Field writers, offsets are relative to the object's location
+
+    def pack(self, location: Tuple[int, int], offset: int, fmt: str, *values: Any) -> None:
+        struct.pack_into(f"{self.endarg}{fmt}", self.sections[location[0]],
+                         location[1] + offset, *values)
+
+    def putUInt(self, location: Tuple[int, int], offset: int, value: int, size: int = 4) -> None:
+        self.pack(location, offset, {1: "B", 2: "H", 4: "I", 8: "Q"}[size], value)
+
+    def putInt(self, location: Tuple[int, int], offset: int, value: int) -> None:
+        self.pack(location, offset, "i", value)
+
+    def putFloats(self, location: Tuple[int, int], offset: int, values: Any) -> None:
+        self.pack(location, offset, "f" * len(values), *values)
+
+    def encodePointer(self, target: Optional[Tuple[int, int]]) -> int:
+        if target is None:
+            return 0
+        return (target[0] << self.pointerShift) | target[1]
+
+    def putPointer(self, location: Tuple[int, int], offset: int, target: Optional[Tuple[int, int]]) -> None:
+        self.putUInt(location, offset, self.encodePointer(target), self.pointerSize)
+
+    def putString(self, location: Tuple[int, int], offset: int, string: str) -> None:
+        self.putUInt(location, offset, self.getStringIndex(string), self.pointerSize)
+
+    def putMemoryRef(self, location: Tuple[int, int], offset: int, data: Optional[bytes]) -> None:
+        if data is None or len(data) == 0:
+            return
+        if len(data) > 0x00FFFFFF:
+            raise ValueError(
+                f"Memory block of {hex(len(data))} bytes is too big for a memory reference")
+        self.putUInt(location, offset, len(data))
+        self.putPointer(location, offset + self.field(8, 4),
+                        self.allocateMemory(data))
+
+    def putMemoryHandle(self, location: Tuple[int, int], offset: int, data: bytes) -> None:
+        if len(data) > 0x00FFFFFF:
+            raise ValueError(
+                f"Memory block of {hex(len(data))} bytes is too big for a memory handle")
+        self.putUInt(location, offset, len(self.thumbnails), self.pointerSize)
+        self.thumbnails.append((len(data), self.allocateMemory(data)))
+
+    def putVector(self, location: Tuple[int, int], offset: int, count: int, elementSize: int, data: Optional[Tuple[int, int]]) -> None:
+        size = 8 if self.is64Bit() and self.version >= 0x09 else 4
+        self.putUInt(location, offset, count, size)
+        self.putUInt(location, offset + size, count * elementSize, size)
+        self.putPointer(location, offset + size * 2, data)
+
+    # Shared object layouts
+
+    def writeDataList(self, location: Tuple[int, int], data: bytes, count: int) -> None:
+        self.putUInt(location, self.field(0x0C, 0x08), count)
+        self.putUInt(location, self.field(0x10, 0x0C), count)
+        self.putMemoryRef(location, self.field(0x18, 0x10), data)
+
+    def writeObjectList(self, metatype: str, items: List[Optional[Tuple[int, int]]]) -> Tuple[int, int]:
+        location = self.allocateObject(metatype, 0x28, 0x18)
+        self.writeDataList(location, self.encodePointers(items), len(items))
+        return location
+
+    def writeIntList(self, values: List[int]) -> Tuple[int, int]:
+        location = self.allocateObject("igIntList", 0x28, 0x18)
+        data = struct.pack(f"{self.endarg}{len(values)}i", *values)
+        self.writeDataList(location, data, len(values))
+        return location
+
+    def encodePointers(self, items: List[Optional[Tuple[int, int]]]) -> bytes:
+        fmt = "Q" if self.is64Bit() else "I"
+        return struct.pack(f"{self.endarg}{len(items)}{fmt}",
+                           *[self.encodePointer(item) for item in items])
+
+    def writeSkeleton(self, bones: List[FixtureBone]) -> Tuple[int, int]:
+        boneObjects = []
+        for index, bone in enumerate(bones):
+            location = self.allocateObject("igSkeletonBone", 0x30, 0x20)
+            self.putString(location, self.field(0x10, 0x08), bone.name)
+            # The parser subtracts one from the stored parent index
+            self.putInt(location, self.field(0x18, 0x0C), bone.parentIndex + 1)
+            self.putInt(location, self.field(0x1C, 0x10), index)
+            self.putFloats(location, self.field(0x20, 0x14), bone.translation)
+            boneObjects.append(location)
+
+        # Inverse bind matrices, the parser transposes and inverts them back
+        matrices = bytearray()
+        for bone in bones:
+            inverse = numpy.linalg.inv(bone.matrix).T
+            matrices += inverse.astype(f"{self.endarg}f4").tobytes()
+
+        skeleton = self.allocateObject("igSkeleton2", 0x30, 0x18)
+        self.putString(skeleton, self.field(0x10, 0x08), "skeleton")
+        self.putPointer(skeleton, self.field(0x18, 0x0C),
+                        self.writeObjectList("igSkeletonBoneList", boneObjects))
+        self.putMemoryRef(skeleton, self.field(0x20, 0x10), bytes(matrices))
+        return skeleton
+
+    def writeVertexBuffer(self, mesh: FixtureMesh) -> Tuple[int, int]:
+        vertexCount = len(mesh.positions)
+        elements = bytearray()
+        columns = []
+        stride = 0
+        usesPackData = False
+        for name, values in mesh.getAttributes():
+            vertexType = mesh.vertexTypes[name]
+            packExponent = 0
+            if name == "positions" and mesh.packExponent != 0 and vertexType in plainVertexTypes \
+                    and plainVertexTypes[vertexType][0][0] in "iu" and plainVertexTypes[vertexType][2] is None:
+                packExponent = mesh.packExponent
+                usesPackData = True
+            column = encodeVertexAttribute(values, vertexType, self.endarg, packExponent,
+                                           name == "positions")
+            # Positions come first, SHORT4N ones are always read from the
+            # start of the vertex
+            offset = (stride + 3) // 4 * 4
+            count = min(values.shape[1] if values.ndim > 1 else 1, 4)
+            packType = 2 if packExponent != 0 else 0
+            elements += struct.pack(f"{self.endarg}8BHH", vertexType, 0, 0, count,
+                                    vertexUsages[name], 0, 0, packType, offset, 0)
+            columns.append((offset, column))
+            stride = offset + column.shape[1]
+        stride = (stride + 3) // 4 * 4
+
+        vertexData = numpy.zeros((vertexCount, stride), dtype=numpy.uint8)
+        for offset, column in columns:
+            vertexData[:, offset:offset + column.shape[1]] = column
+        vertexData = vertexData.tobytes()
+
+        packData = None
+        if usesPackData:
+            packData = struct.pack(f"{self.endarg}I", mesh.packExponent)
+            if self.version < 0x06:
+                # Older versions keep the pack data behind the vertices
+                vertexData += packData
+
+        vertexFormat = self.allocateObject("igVertexFormat", 0x68, 0x38)
+        self.putUInt(vertexFormat, self.field(0x0C, 0x08), stride)
+        self.putMemoryRef(vertexFormat, self.field(0x10, 0x0C), bytes(elements))
+        self.putUInt(vertexFormat, self.field(0x30, 0x1C), self.platform)
+
+        vertexBuffer = self.allocateObject("igVertexBuffer", 0x40, 0x28)
+        self.putUInt(vertexBuffer, self.field(0x0C, 0x08), vertexCount)
+        self.putMemoryHandle(vertexBuffer, self.field(0x20, 0x14), vertexData)
+        self.putPointer(vertexBuffer, self.field(0x28, 0x18), vertexFormat)
+        if self.version >= 0x06:
+            self.putMemoryRef(vertexBuffer, self.field(0x30, 0x20), packData)
+        return vertexBuffer
+
+    def writeIndexBuffer(self, mesh: FixtureMesh) -> Tuple[int, int]:
+        indices = mesh.faces.reshape(-1)
+        indexType = "u2" if len(mesh.positions) <= 0xFFFF else "u4"
+        indexBuffer = self.allocateObject("igIndexBuffer", 0x38, 0x20)
+        self.putUInt(indexBuffer, self.field(0x0C, 0x08), len(indices))
+        self.putMemoryHandle(indexBuffer, self.field(0x20, 0x14),
+                             indices.astype(f"{self.endarg}{indexType}").tobytes())
+        self.putInt(indexBuffer, self.field(0x30, 0x1C), 3)    # triangle list
+        return indexBuffer
+
+    def writeGeometryAttr(self, mesh: FixtureMesh) -> Tuple[int, int]:
+        geometryAttr = self.allocateObject("igGeometryAttr", 0x20, 0x18)
+        self.putPointer(geometryAttr, 0x10, self.writeVertexBuffer(mesh))
+        self.putPointer(geometryAttr, 0x14, self.writeIndexBuffer(mesh))
+        return geometryAttr
+
+    # Per game model layouts
+
+    def writeModel(self, model: FixtureModel) -> None:
+        if self.version >= 0x09:
+            self.writeSscModel(model)
+            return
+
+        if self.is64Bit():
+            raise NotImplementedError(
+                f"Version {hex(self.version)} has no 64-bit object layouts in the parser.")
+        if self.version == 0x07:
+            self.writeSsfModel(model)
+        elif self.version == 0x08:
+            self.writeSttModel(model)
+        else:
+            self.writeSgModel(model)
+
+    def writeSscModel(self, model: FixtureModel) -> None:
+        blendMatrixIndices = []
+        drawCalls = []
+        for index, mesh in enumerate(model.meshes):
+            graphicsVertexBuffer = self.allocateObject("igGraphicsVertexBuffer", 0x18, 0x10)
+            self.putPointer(graphicsVertexBuffer, self.field(0x10, 0x0C),
+                            self.writeVertexBuffer(mesh))
+            graphicsIndexBuffer = self.allocateObject("igGraphicsIndexBuffer", 0x18, 0x10)
+            self.putPointer(graphicsIndexBuffer, self.field(0x10, 0x0C),
+                            self.writeIndexBuffer(mesh))
+
+            drawCall = self.allocateObject("igModelDrawCallData", 0x68, 0x48)
+            self.putString(drawCall, self.field(0x10, 0x08),
+                           mesh.name or f"drawCall_{index}")
+            self.putPointer(drawCall, self.field(0x48, 0x34), graphicsVertexBuffer)
+            self.putPointer(drawCall, self.field(0x50, 0x38), graphicsIndexBuffer)
+            self.putUInt(drawCall, self.field(0x60, 0x40), len(blendMatrixIndices), 2)
+            self.putUInt(drawCall, self.field(0x62, 0x42), len(mesh.boneMap), 2)
+            blendMatrixIndices.extend(mesh.boneMap)
+            drawCalls.append(drawCall)
+
+        modelData = self.allocateObject("igModelData", 0xD0, 0x78)
+        self.putVector(modelData, self.field(0x70, 0x48), len(drawCalls), self.pointerSize,
+                       self.allocateMemory(self.encodePointers(drawCalls)))
+        self.putVector(modelData, self.field(0xB8, 0x6C), len(blendMatrixIndices), 4,
+                       self.allocateMemory(struct.pack(f"{self.endarg}{len(blendMatrixIndices)}i", *blendMatrixIndices)))
+
+        if len(model.bones) > 0:
+            # The skin points straight at the model data so the skeleton and
+            # the meshes end up in the same model
+            skinInfo = self.allocateObject("CGraphicsSkinInfo", 0x38, 0x1C)
+            self.putPointer(skinInfo, self.field(0x28, 0x14),
+                            self.writeSkeleton(model.bones))
+            self.putPointer(skinInfo, self.field(0x30, 0x18), modelData)
+            self.addRootObject(skinInfo)
+        else:
+            modelInfo = self.allocateObject("igModelInfo", 0x30, 0x18)
+            self.putPointer(modelInfo, self.field(0x28, 0x14), modelData)
+            self.addRootObject(modelInfo)
+
+    def writeGroup(self, metatype: str, size: int, children: List[Tuple[int, int]]) -> Tuple[int, int]:
+        group = self.allocateObject(metatype, size, size)
+        self.putPointer(group, 0x20, self.writeObjectList("igNodeList", children))
+        return group
+
+    def writeBlendMatrixSelect(self, mesh: FixtureMesh, child: Tuple[int, int]) -> Tuple[int, int]:
+        blendMatrixSelect = self.writeGroup("igBlendMatrixSelect", 0xB8, [child])
+        boneMapOffset = 0xB0 if self.version == 0x05 else 0xB4
+        self.putPointer(blendMatrixSelect, boneMapOffset,
+                        self.writeIntList(mesh.boneMap))
+        return blendMatrixSelect
+
+    def writeSsfModel(self, model: FixtureModel) -> None:
+        nodes = []
+        for mesh in model.meshes:
+            geometry = self.allocateObject("igGeometry", 0x28, 0x28)
+            self.putPointer(geometry, 0x24, self.writeObjectList(
+                "igAttrList", [self.writeGeometryAttr(mesh)]))
+            if len(mesh.boneMap) > 0:
+                geometry = self.writeBlendMatrixSelect(mesh, geometry)
+            nodes.append(geometry)
+        sceneGraph = self.writeGroup("igGroup", 0x24, nodes)
+
+        if len(model.bones) > 0:
+            animationDatabase = self.allocateObject("asAnimationDatabase", 0x1C, 0x1C)
+            self.putPointer(animationDatabase, 0x14,
+                            self.writeSkeleton(model.bones))
+            self.putPointer(animationDatabase, 0x18, sceneGraph)
+            self.addRootObject(animationDatabase)
+        else:
+            sceneInfo = self.allocateObject("igSceneInfo", 0x18, 0x18)
+            self.putPointer(sceneInfo, 0x14, sceneGraph)
+            self.addRootObject(sceneInfo)
+
+    def writeCombinerLink(self, model: FixtureModel) -> Optional[Tuple[int, int]]:
+        if len(model.bones) == 0:
+            return None
+        combinerLink = self.allocateObject("tfbPhysicsCombinerLink", 0x10, 0x10)
+        self.putPointer(combinerLink, 0x0C, self.writeSkeleton(model.bones))
+        return combinerLink
+
+    def writePhysicsModel(self, body: Tuple[int, int], placements: List[Any]) -> None:
+        if len(placements) > 0:
+            for placement in placements:
+                transform = self.writeGroup("igTransform", 0x70, [body])
+                self.putFloats(transform, 0x30, numpy.asarray(placement, dtype=numpy.float32).T.ravel())
+                self.addRootObject(transform)
+            return
+        physicsModel = self.allocateObject("tfbPhysicsModel", 0x18, 0x18)
+        self.putPointer(physicsModel, 0x14, body)
+        self.addRootObject(physicsModel)
+
+    def writeSttModel(self, model: FixtureModel) -> None:
+        drawables = []
+        boneMaps = []
+        for mesh in model.meshes:
+            drawable = self.allocateObject("Drawable", 0x18, 0x18)
+            self.putPointer(drawable, 0x0C, self.writeGeometryAttr(mesh))
+            if len(mesh.boneMap) > 0:
+                self.putUInt(drawable, 0x16, len(boneMaps), 2)
+                boneMaps.append(self.writeIntList(mesh.boneMap))
+            drawables.append(drawable)
+
+        entityInfo = self.allocateObject("tfbBodyEntityInfo", 0x28, 0x28)
+        self.putPointer(entityInfo, 0x14,
+                        self.writeObjectList("DrawableList", drawables))
+        if len(boneMaps) > 0:
+            self.putPointer(entityInfo, 0x24,
+                            self.writeObjectList("igIntListList", boneMaps))
+
+        body = self.allocateObject("tfbPhysicsBody", 0x34, 0x34)
+        self.putPointer(body, 0x28, self.writeCombinerLink(model))
+        self.putPointer(body, 0x20 if self.platform in (0x04, 0x0B) else 0x30,
+                        entityInfo)
+        self.writePhysicsModel(body, model.placements)
+
+    def writeSgModel(self, model: FixtureModel) -> None:
+        nodes = []
+        for mesh in model.meshes:
+            technique = self.allocateObject("tfbRuntimeTechniqueInstance", 0x2C, 0x2C)
+            self.putPointer(technique, 0x28, self.writeGeometryAttr(mesh))
+            if len(mesh.boneMap) > 0:
+                technique = self.writeBlendMatrixSelect(mesh, technique)
+            nodes.append(technique)
+
+        body = self.allocateObject("tfbPhysicsBody", 0x2C, 0x2C)
+        self.putPointer(body, 0x20, self.writeGroup("igGroup", 0x24, nodes))
+        self.putPointer(body, 0x24, self.writeCombinerLink(model))
+        self.writePhysicsModel(body, model.placements)
+
+    # Serialisation
+
+    def buildFixups(self, start: int) -> Tuple[bytes, int]:
+        """The fixup section for a file where it begins at start"""
+        stringData = bytearray()
+        for string in self.stringList:
+            stringData += string.encode("utf-8") + b"\0"
+            if self.version > 0x07 and len(stringData) % 2 != 0:
+                stringData += b"\0"
+        metatypeData = bytearray()
+        for metatype in self.metatypes:
+            metatypeData += metatype.encode("utf-8") + b"\0"
+            if self.version > 0x07 and len(metatypeData) % 2 != 0:
+                metatypeData += b"\0"
+        handleData = bytearray()
+        for size, location in self.thumbnails:
+            handleData += struct.pack(f"{self.endarg}I", size)
+            if self.is64Bit():
+                handleData += bytes(4)
+            handleData += struct.pack(f"{self.endarg}{'Q' if self.is64Bit() else 'I'}",
+                                      self.encodePointer(location))
+
+        if self.version <= 0x06:
+            records = [(0, len(self.metatypes), metatypeData),
+                       (1, len(self.stringList), stringData),
+                       (10, len(self.thumbnails), handleData)]
+            headerSize = 0x18
+        else:
+            records = [(0x54454D54, len(self.metatypes), metatypeData),
+                       (0x52545354, len(self.stringList), stringData),
+                       (0x4E484D54, len(self.thumbnails), handleData)]
+            headerSize = 0x10
+
+        fixups = bytearray()
+        if self.version <= 0x06:
+            # Older versions keep the platform and fixup count in this section
+            fixups += bytes(0x1C)
+            struct.pack_into(f"{self.endarg}H", fixups, 0x08, self.platform)
+            struct.pack_into(f"{self.endarg}I", fixups, 0x10, len(records))
+        assert start % 4 == 0
+
+        for magic, count, data in records:
+            length = (headerSize + len(data) + 3) // 4 * 4
+            if self.version <= 0x06:
+                header = struct.pack(f"{self.endarg}I8xIII", magic, count, length, headerSize)
+            else:
+                header = struct.pack(f"{self.endarg}IIII", magic, count, length, headerSize)
+            fixups += header + data + bytes(length - headerSize - len(data))
+        return bytes(fixups), len(records)
+
+    def build(self) -> bytes:
+        """Serialise everything written so far into an IGZ file"""
+        self.writeDataList(self.rootList, self.encodePointers(self.rootObjects),
+                           len(self.rootObjects))
+        # Root objects register their strings while being written, so the
+        # fixups are built once everything else is laid out
+        pointerStart = 0x18 if self.version >= 0x07 else 0x10
+        sectionCount = 1 + len(self.sections)
+        headerSize = (pointerStart + (sectionCount + 1) * 0x10 + 0x7F) // 0x80 * 0x80
+
+        fixups, fixupCount = self.buildFixups(headerSize)
+        blocks = [fixups] + [bytes(section) for section in self.sections]
+
+        offsets = []
+        offset = headerSize
+        for block in blocks:
+            offsets.append(offset)
+            offset = (offset + len(block) + 0x7F) // 0x80 * 0x80
+
+        data = bytearray(offset)
+        struct.pack_into(f"{self.endarg}III", data, 0, 0x49475A01, self.version, 0)
+        if self.version >= 0x07:
+            struct.pack_into(f"{self.endarg}II", data, 0x0C, self.platform, fixupCount)
+        for i, block in enumerate(blocks):
+            struct.pack_into(f"{self.endarg}II", data, pointerStart + i * 0x10,
+                             offsets[i], len(block))
+            data[offsets[i]:offsets[i] + len(block)] = block
+        return bytes(data)
+
+
+def writeIgz(models: List[FixtureModel], version: int, platform: int = 1, endianness: str = "LE") -> bytes:
+    """Write models into an IGZ file of the given version, platform and endianness"""
+    writer = IgzWriter(version, platform, endianness)
+    for model in models:
+        writer.writeModel(model)
+    return writer.build()
+
+
+def makeGridMesh(vertexCount: int, boneCount: int = 0, offset: Tuple[float, float, float] = (0.0, 0.0, 0.0),
+                 vertexTypes: Optional[Dict[str, int]] = None, seed: int = 0) -> FixtureMesh:
+    """A flat grid of about vertexCount vertices, skinned to boneCount bones if any"""
+    columns = max(2, int(math.ceil(math.sqrt(vertexCount))))
+    rows = max(2, (vertexCount + columns - 1) // columns)
+    grid = numpy.indices((rows, columns)).reshape(2, -1).T[:vertexCount]
+    vertexCount = len(grid)
+
+    positions = numpy.zeros((vertexCount, 3))
+    positions[:, 0] = grid[:, 1] / (columns - 1) + offset[0]
+    positions[:, 1] = grid[:, 0] / (rows - 1) + offset[1]
+    positions[:, 2] = offset[2]
+
+    # Two triangles per grid cell whose corners all exist
+    cells = numpy.indices((rows - 1, columns - 1)).reshape(2, -1).T
+    corners = cells[:, 0] * columns + cells[:, 1]
+    quads = numpy.stack([corners, corners + 1, corners + columns + 1, corners + columns], axis=1)
+    quads = quads[quads.max(axis=1) < vertexCount]
+    faces = numpy.concatenate([quads[:, [0, 1, 2]], quads[:, [0, 2, 3]]])
+
+    random = numpy.random.default_rng(seed)
+    normals = numpy.tile([0.0, 0.0, 1.0], (vertexCount, 1))
+    uvs = grid[:, ::-1] / [columns - 1, rows - 1]
+    colors = random.random((vertexCount, 4))
+
+    weights = boneIndices = None
+    boneMap = []
+    if boneCount > 0:
+        boneMap = list(range(boneCount))
+        boneIndices = numpy.zeros((vertexCount, 4))
+        boneIndices[:, 0] = random.integers(0, boneCount, vertexCount)
+        boneIndices[:, 1] = random.integers(0, boneCount, vertexCount)
+        weights = numpy.zeros((vertexCount, 4))
+        weights[:, 0] = random.random(vertexCount)
+        weights[:, 1] = 1.0 - weights[:, 0]
+
+    return FixtureMesh(positions, faces, normals, uvs, colors, weights, boneIndices,
+                       boneMap, vertexTypes)
+
+
+def makeSkeleton(boneCount: int) -> List[FixtureBone]:
+    """A chain of bones one unit apart"""
+    bones = []
+    for index in range(boneCount):
+        bones.append(FixtureBone(f"bone_{index}", index - 1, (0.0, 0.0, float(index))))
+    return bones
+
+
+def makeModels(modelCount: int = 1, meshCount: int = 1, vertexCount: int = 64, boneCount: int = 0,
+               vertexTypes: Optional[Dict[str, int]] = None, seed: int = 0) -> List[FixtureModel]:
+    """modelCount models of meshCount grid meshes each, for scale tests"""
+    models = []
+    for modelIndex in range(modelCount):
+        meshes = [makeGridMesh(vertexCount, boneCount, (float(meshIndex), float(modelIndex), 0.0),
+                               vertexTypes, seed + modelIndex * meshCount + meshIndex)
+                  for meshIndex in range(meshCount)]
+        models.append(FixtureModel(meshes, makeSkeleton(boneCount)))
+    return models
@@ -0,0 +1,536 @@
+"""
+Import pipeline shared by the synchronous and background import operators
+"""
+
+import collections
+import concurrent.futures
+import copy
+import dataclasses
+import hashlib
+import importlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+from . import constants
+from . import game_formats
+from . import igz_file
+from . import shared_arrays
+
+
+def openFile(filepath: str, options: constants.ImportOptions) -> igz_file.igzFile:
+    """Read an IGZ/BLD file from disk and its header, the object graph is left to iter_models"""
+    with open(filepath, 'rb') as file:
+        data = file.read()
+    return openData(data, options)
+
+
+def openData(data: bytes, options: constants.ImportOptions) -> igz_file.igzFile:
+    """Parser of a file's bytes with the header read"""
+    parser = game_formats.createParser(data, options)
+    parser.loadHeader()
+    checkWii(parser, options)
+    return parser
+
+
+def checkWii(parser: igz_file.igzFile, options: constants.ImportOptions) -> None:
+    if parser.version < 0x0A and parser.platform == 2 and not options.allowWii:
+        raise ValueError(
+            "Wii Models are not allowed as they are buggy. Enable 'Allow Wii Models' in import options to try anyway.")
+
+
+def parseFile(filepath: str, options: constants.ImportOptions) -> igz_file.igzFile:
+    """Read an IGZ/BLD file from disk and parse its object graph"""
+    parser = openFile(filepath, options)
+    parser.loadFile()
+    return parser
+
+
+def getFileHash(data: bytes) -> str:
+    """Digest of a file's bytes, imported objects keep it to tell when their file changed"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def getSourceHash(source: Any) -> str:
+    """File hash of the parser or DecodedFile a model came from"""
+    # Worker results are DecodedFiles of the worker module's copy of this
+    # module, which isinstance doesn't recognise inside Blender
+    fileHash = getattr(source, "fileHash", None)
+    if fileHash is not None:
+        return fileHash
+    return getFileHash(source.inFile.data)
+
+
+class ParseCache:
+    """
+    Parsed files of a session by path, modification time and size
+
+    Keeps each parser with its object graph and raw buffers. Imports decode
+    copies of its models, so importing the file again with other options
+    starts from the same parse. The least recently used files are dropped
+    once the cached file data passes maxBytes.
+    """
+    maxBytes: int
+
+    def __init__(self, maxBytes: int = 512 * 1024 * 1024) -> None:
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def getKey(self, filepath: str, options: constants.ImportOptions) -> Optional[tuple]:
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return None
+        # The graph only depends on the object parsing starts from and on
+        # whether transforms are read for instancing
+        return (os.path.abspath(filepath), stat.st_mtime_ns, stat.st_size, options.firstObjectOffset,
+                options.instanceModels)
+
+    def get(self, filepath: str, options: constants.ImportOptions) -> Optional[igz_file.igzFile]:
+        """Parser of the file with options in place of the cached ones, None if it isn't cached"""
+        key = self.getKey(filepath, options)
+        with self.lock:
+            parser = self.entries.get(key)
+            if parser is None:
+                return None
+            self.entries.move_to_end(key)
+        checkWii(parser, options)
+        parser = copy.copy(parser)
+        parser.options = options
+        return parser
+
+    def add(self, filepath: str, options: constants.ImportOptions, parser: igz_file.igzFile) -> None:
+        """Cache a parser whose whole graph was read"""
+        key = self.getKey(filepath, options)
+        if key is None or not parser.graphLoaded or len(parser.inFile.data) > self.maxBytes:
+            return
+        with self.lock:
+            # Older versions of the file won't be asked for again
+            for oldKey in [oldKey for oldKey in self.entries if oldKey[0] == key[0]]:
+                del self.entries[oldKey]
+            self.entries[key] = parser
+            while self.getSize() > self.maxBytes:
+                self.entries.popitem(last=False)
+
+    def getSize(self) -> int:
+        return sum(len(parser.inFile.data) for parser in self.entries.values())
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+# Shared by the imports of a session
+sessionParseCache = ParseCache()
+
+
+def loadParsed(filepath: str, options: constants.ImportOptions, parseCache: Optional[ParseCache] = None) -> igz_file.igzFile:
+    """Parsed file from parseCache, parsed and added to it if it isn't there yet"""
+    parser = parseCache.get(filepath, options) if parseCache is not None else None
+    if parser is None:
+        parser = parseFile(filepath, options)
+        if parseCache is not None:
+            parseCache.add(filepath, options, parser)
+    return parser
+
+
+def encodeOptions(options: constants.ImportOptions) -> str:
+    """Options as JSON, for objects that remember how they were imported"""
+    values = dataclasses.asdict(options)
+    values["attributes"] = sorted(options.attributes)
+    if options.modelIndices is not None:
+        values["modelIndices"] = sorted(options.modelIndices)
+    return json.dumps(values)
+
+
+def decodeOptions(text: str) -> constants.ImportOptions:
+    """Options from encodeOptions, fields that no longer exist are dropped"""
+    values = json.loads(text)
+    values["attributes"] = frozenset(values["attributes"])
+    if values.get("modelIndices") is not None:
+        values["modelIndices"] = frozenset(values["modelIndices"])
+    names = {field.name for field in dataclasses.fields(constants.ImportOptions)}
+    return constants.ImportOptions(**{name: value for name, value in values.items() if name in names})
+
+
+def parseModelSelection(text: str) -> Optional[frozenset]:
+    """Model indices of a selection like "0-9, 12", None for an empty one"""
+    if text.strip() == "":
+        return None
+    indices = set()
+    for part in text.split(","):
+        part = part.strip()
+        if part == "":
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            indices.update(range(int(first), int(last) + 1))
+        else:
+            indices.add(int(part))
+    return frozenset(indices)
+
+
+def formatModelSelection(indices: Sequence[int]) -> str:
+    """Inverse of parseModelSelection, consecutive indices become ranges"""
+    parts = []
+    for index in sorted(indices):
+        if len(parts) > 0 and parts[-1][1] == index - 1:
+            parts[-1][1] = index
+        else:
+            parts.append([index, index])
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in parts)
+
+
+class ModelSummary:
+    """What the model list of the import dialog shows about a model"""
+    index: int
+    id: int
+    metatype: Optional[str]
+    meshCount: int
+    vertexCount: int
+    hasSkeleton: bool
+
+    def __init__(self, index: int, model: Any) -> None:
+        self.index = index
+        self.id = model.id
+        self.metatype = model.metatype
+        self.meshCount = len(model.meshes)
+        self.vertexCount = model.getVertexCount()
+        self.hasSkeleton = len(model.boneList) > 0
+
+
+def scanFile(filepath: str, options: constants.ImportOptions, parseCache: Optional[ParseCache] = None) -> List[ModelSummary]:
+    """
+    Summaries of every model of a file from its object graph, no vertex data is decoded
+
+    With parseCache the parse is kept for the import that follows.
+    """
+    if parseCache is not None:
+        parser = loadParsed(filepath, options, parseCache)
+        return [ModelSummary(index, model) for index, model in enumerate(parser.models)]
+
+    parser = openFile(filepath, options)
+    summaries = []
+    for index, model in enumerate(parser.iter_models()):
+        summaries.append(ModelSummary(index, model))
+        model.releaseRawData()
+    return summaries
+
+
+class DecodedFile:
+    """
+    Everything the builder needs from a parsed file, without the file data
+
+    Returned by worker processes in place of the parser so only the decoded
+    models are pickled back to Blender.
+    """
+    filepath: str
+    version: int
+    platform: int
+    endianness: str
+    options: constants.ImportOptions
+    models: List[Any]
+    occurrences: List[Any]
+    modelRange: Sequence[int]
+    fileHash: str
+
+    def __init__(self, filepath: str, parser: igz_file.igzFile) -> None:
+        self.filepath = filepath
+        self.fileHash = getFileHash(parser.inFile.data)
+        self.version = parser.version
+        self.platform = parser.platform
+        self.endianness = parser.endianness
+        self.options = parser.options
+        self.models = parser.models
+        self.occurrences = parser.occurrences
+        self.modelRange = parser.getModelRange()
+
+
+# Set in worker processes, flags of the batch tasks whose shared blocks the
+# importing process holds
+heldTasks = None
+
+
+def initWorker(held: Any) -> None:
+    global heldTasks
+    heldTasks = held
+
+
+def decodeFile(filepath: str, options: constants.ImportOptions, shareArrays: bool = True,
+               task: int = 0) -> DecodedFile:
+    """
+    Worker process entry point, parses and decodes a whole file
+
+    With shareArrays the decoded attributes are moved to shared memory so only
+    their descriptors are pickled, the importing process has to hold, attach
+    and release them. The blocks are filed under task, the worker lets go of
+    them once the importing process flagged the task as held.
+    """
+    if heldTasks is not None:
+        for group in shared_arrays.getExportGroups():
+            if heldTasks[group]:
+                shared_arrays.closeExported(group)
+    shared_arrays.beginExport(task)
+
+    parser = openFile(filepath, options)
+
+    # Decode each model while the rest of the graph is still being parsed so
+    # only one model's raw buffers are held at a time
+    for index, model in enumerate(parser.iter_models()):
+        if options.buildMeshes and parser.isModelSelected(index):
+            model.decodeMeshes(parser)
+            if shareArrays:
+                model.shareArrays()
+        model.releaseRawData()
+
+    return DecodedFile(filepath, parser)
+
+
+def releaseDecodedFile(future: concurrent.futures.Future) -> None:
+    """Free the shared blocks of a worker result that will never be built"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    for model in future.result().models:
+        model.releaseArrays()
+
+
+def getWorkerModule() -> Any:
+    """
+    Return this module under a name that spawned worker processes can import
+
+    Blender loads extensions into the in-memory bl_ext namespace which a fresh
+    interpreter can't import, so functions are pickled by reference to the
+    package's folder name instead and its parent folder is put on sys.path,
+    which spawned processes inherit.
+    """
+    packageDir = os.path.dirname(os.path.abspath(__file__))
+    parentDir, packageName = os.path.split(packageDir)
+    if parentDir not in sys.path:
+        sys.path.append(parentDir)
+    return importlib.import_module(f"{packageName}.importer")
+
+
+class ImportJob:
+    """
+    Parses and decodes files on a background thread
+
+    A single file is streamed on the job's thread, batches are fanned out to a
+    process pool. Decoded models are handed to the main thread through the
+    ready queue as (filepath, source, index, model) tuples, where source is
+    the parser or DecodedFile the model came from. Blender data has to be
+    created on the main thread.
+
+    The queue is bounded so parsing a large file waits for the builder
+    instead of holding every decoded model at once.
+
+    With a parseCache, files parsed by an earlier job skip straight to
+    decoding and files this job parses on its own thread are added to it.
+    """
+    filepaths: List[str]
+    options: constants.ImportOptions
+    error: Optional[Exception]
+    errors: List[Tuple[str, Exception]]
+    ready: queue.Queue
+    parsedFileCount: int
+    parsedModelCount: int
+    modelCount: int
+    decodedCount: int
+    builtCount: int
+
+    # Seconds between checks for cancellation while waiting on workers
+    pollInterval: float = 0.1
+    # Decoded models that may wait for the builder at once
+    readyLimit: int = 8
+
+    def __init__(self, filepaths: List[str], options: Optional[constants.ImportOptions] = None,
+                 parseCache: Optional[ParseCache] = None) -> None:
+        self.filepaths = filepaths
+        self.options = options if options is not None else constants.ImportOptions()
+        self.parseCache = parseCache
+        self.error = None
+        self.errors = []
+        self.ready = queue.Queue(self.readyLimit)
+        self.parsedFileCount = 0
+        self.parsedModelCount = 0
+        self.modelCount = 0
+        self.decodedCount = 0
+        self.builtCount = 0
+        self.finished = threading.Event()
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def cancel(self) -> None:
+        """Ask the worker to stop, it finishes the model it is decoding and exits"""
+        self.cancelled.set()
+
+    def run(self) -> None:
+        try:
+            for item in self.iterDecoded():
+                self.putReady(item)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished.set()
+
+    def putReady(self, item: Tuple[str, Any, int, Any]) -> None:
+        """Wait for room in the ready queue, dropping the model on cancel"""
+        while not self.cancelled.is_set():
+            try:
+                self.ready.put(item, timeout=self.pollInterval)
+            except queue.Full:
+                continue
+            # A cancel may have drained the queue before the put got in, the
+            # model would never be built nor released
+            if self.cancelled.is_set():
+                self.discardReady()
+            return
+        item[3].releaseArrays()
+
+    def iterDecoded(self) -> Iterator[Tuple[str, Any, int, Any]]:
+        """Decoded models in build order, the synchronous import consumes this directly"""
+        if len(self.filepaths) == 1:
+            return self.iterSingle(self.filepaths[0])
+        return self.iterBatch()
+
+    def iterSingle(self, filepath: str) -> Iterator[Tuple[str, Any, int, Any]]:
+        parser = self.parseCache.get(filepath, self.options) if self.parseCache is not None else None
+        cached = parser is not None
+        if not cached:
+            parser = openFile(filepath, self.options)
+        yield from self.iterParser(filepath, parser)
+        if self.parseCache is not None and not cached:
+            self.parseCache.add(filepath, self.options, parser)
+
+    def iterParser(self, filepath: str, parser: igz_file.igzFile) -> Iterator[Tuple[str, Any, int, Any]]:
+        for index, model in enumerate(parser.iter_models()):
+            if self.cancelled.is_set():
+                return
+            self.parsedModelCount += 1
+            if not self.options.buildMeshes or not parser.isModelSelected(index):
+                if self.parseCache is None:
+                    model.releaseRawData()
+                continue
+            # Cached models have to stay as they were parsed
+            if self.parseCache is not None:
+                model = model.copyParsed()
+            self.modelCount += 1
+            if len(model.meshes) > 0:
+                model.decodeMeshes(parser)
+            model.releaseRawData()
+            self.decodedCount += 1
+            yield (filepath, parser, index, model)
+        self.parsedFileCount += 1
+
+    def iterBatch(self) -> Iterator[Tuple[str, Any, int, Any]]:
+        # Cached files are decoded here, only the others go to the workers
+        filepaths = []
+        for filepath in self.filepaths:
+            try:
+                parser = self.parseCache.get(filepath, self.options) if self.parseCache is not None else None
+            except Exception as e:
+                print(f"Failed to parse {filepath}: {str(e)}")
+                self.errors.append((filepath, e))
+                self.parsedFileCount += 1
+                continue
+            if parser is None:
+                filepaths.append(filepath)
+            else:
+                yield from self.iterParser(filepath, parser)
+            if self.cancelled.is_set():
+                return
+        if len(filepaths) == 0:
+            return
+
+        worker = getWorkerModule()
+        # Rebuilt from the worker module's copy of the class so it is pickled
+        # by a name the worker processes can import
+        options = worker.constants.ImportOptions(
+            **dataclasses.asdict(self.options))
+
+        maxWorkers = min(len(filepaths), os.cpu_count() or 1)
+        context = multiprocessing.get_context("spawn")
+        # Set once this process holds a task's shared blocks, so the worker
+        # may close its own handles of them
+        held = context.Array("b", len(filepaths), lock=False)
+        pool = concurrent.futures.ProcessPoolExecutor(
+            maxWorkers, mp_context=context, initializer=worker.initWorker, initargs=(held,))
+        try:
+            futures = {pool.submit(worker.decodeFile, filepath, options, True, task): (task, filepath)
+                       for task, filepath in enumerate(filepaths)}
+            pending = set(futures)
+            while len(pending) > 0:
+                if self.cancelled.is_set():
+                    for future in pending:
+                        future.add_done_callback(releaseDecodedFile)
+                    return
+                done, pending = concurrent.futures.wait(
+                    pending, self.pollInterval, concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task, filepath = futures[future]
+                    try:
+                        decoded = future.result()
+                    except Exception as e:
+                        print(f"Failed to parse {filepath}: {str(e)}")
+                        self.errors.append((filepath, e))
+                        self.parsedFileCount += 1
+                        continue
+                    # Hold every block before the models are queued, the pool
+                    # may shut down and its workers exit while they wait
+                    for model in decoded.models:
+                        model.holdArrays()
+                    held[task] = 1
+                    yield from self.addDecodedFile(decoded)
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def addDecodedFile(self, decoded: DecodedFile) -> Iterator[Tuple[str, Any, int, Any]]:
+        self.parsedFileCount += 1
+        self.parsedModelCount += len(decoded.models)
+
+        if not self.options.buildMeshes:
+            return
+
+        self.modelCount += len(decoded.modelRange)
+        for index in decoded.modelRange:
+            self.decodedCount += 1
+            yield (decoded.filepath, decoded, index, decoded.models[index])
+
+    def discardDecoded(self, decoded: Iterator[Tuple[str, Any, int, Any]]) -> None:
+        """Cancel and free whatever a partially consumed iterDecoded still holds"""
+        self.cancel()
+        for filepath, source, index, model in decoded:
+            model.releaseArrays()
+
+    def discardReady(self) -> None:
+        """Free the models that were decoded but won't be built"""
+        while True:
+            try:
+                filepath, source, index, model = self.ready.get_nowait()
+            except queue.Empty:
+                break
+            model.releaseArrays()
+
+    def isDone(self) -> bool:
+        """True once the worker has exited and every decoded model was built"""
+        return self.finished.is_set() and self.ready.empty()
+
+    def getProgress(self) -> float:
+        """Overall progress in [0, 1], parsing, decoding and building weigh the same"""
+        fileProgress = self.parsedFileCount / len(self.filepaths)
+        if self.modelCount == 0:
+            return 1.0 if self.finished.is_set() else fileProgress / 3
+        modelProgress = (self.decodedCount + self.builtCount) / \
+            (2 * self.modelCount)
+        return (fileProgress + 2 * modelProgress) / 3
+
+    def getStatus(self) -> str:
+        if self.parsedFileCount < len(self.filepaths):
+            return f"Parsed {self.parsedFileCount} of {len(self.filepaths)} files, built {self.builtCount} models"
+        return f"Building model {self.builtCount} of {self.modelCount}"
@@ -0,0 +1,773 @@
+"""
+Blender operators for the Skylanders importer
+"""
+
+import dataclasses
+import json
+import os
+import queue
+import time
+import bpy
+from bpy.props import (
+    StringProperty,
+    BoolProperty,
+    CollectionProperty,
+    EnumProperty,
+    IntProperty
+)
+from bpy_extras.io_utils import ImportHelper
+from mathutils import Matrix
+from typing import Any, List
+from . import constants
+from . import formats
+from . import importer
+
+
+class ImportSkylandersIGZ(bpy.types.Operator, ImportHelper):
+    """Import Skylanders IGZ/BLD models"""
+    bl_idname = "import_mesh.skylanders_igz"
+    bl_label = "Import Skylanders IGZ/BLD"
+    bl_options = {'PRESET', 'UNDO'}
+
+    filename_ext: str = ".igz;.bld"
+    filter_glob: StringProperty = StringProperty(
+        default="*.igz;*.bld", options={'HIDDEN'})
+
+    files: CollectionProperty = CollectionProperty(
+        type=bpy.types.OperatorFileListElement,
+        options={'HIDDEN', 'SKIP_SAVE'},
+    )
+
+    directory: StringProperty = StringProperty(
+        subtype='DIR_PATH',
+        options={'HIDDEN', 'SKIP_SAVE'},
+    )
+
+    build_meshes: BoolProperty = BoolProperty(
+        name="Build Meshes",
+        description="Whether to build the meshes or just parse the file",
+        default=True,
+    )
+
+    build_bones: BoolProperty = BoolProperty(
+        name="Build Bones",
+        description="Whether to build the bones",
+        default=True,
+    )
+
+    build_faces: BoolProperty = BoolProperty(
+        name="Build Faces",
+        description="Whether to build the faces",
+        default=True,
+    )
+
+    allow_wii: BoolProperty = BoolProperty(
+        name="Allow Wii Models",
+        description="Whether to allow Wii models (may be buggy)",
+        default=True,
+    )
+
+    attribute_preset: EnumProperty = EnumProperty(
+        name="Attributes",
+        description="Mesh attributes to read from the file, the rest of the vertex data is skipped",
+        items=(
+            ('FULL', "Full", "Positions, faces, normals, UVs, colors and skinning"),
+            ('NO_SKINNING', "No Skinning", "Everything but the bone weights and indices"),
+            ('POSITIONS_ONLY', "Positions Only", "Positions and faces, for layout and blocking"),
+        ),
+        default='FULL',
+    )
+
+    deduplicate_meshes: BoolProperty = BoolProperty(
+        name="Deduplicate Meshes",
+        description="Let meshes with identical file data share one Blender mesh",
+        default=True,
+    )
+
+    reuse_session_meshes: BoolProperty = BoolProperty(
+        name="Reuse Earlier Imports",
+        description="Also share meshes with the ones of earlier imports in this session",
+        default=False,
+    )
+
+    proxy_mode: EnumProperty = EnumProperty(
+        name="Geometry",
+        description="Build the meshes or cheap placeholders that Realize Selected IGZ Proxies turns into meshes later",
+        items=(
+            ('NONE', "Full", "Build the meshes"),
+            ('BOUNDS', "Bounding Boxes", "One box per model, from the positions alone"),
+            ('POINTS', "Point Clouds", "A decimated cloud of each model's positions"),
+        ),
+        default='NONE',
+    )
+
+    merge_meshes: BoolProperty = BoolProperty(
+        name="Merge Meshes",
+        description="Join the meshes of each model into one object with a material slot per draw call",
+        default=False,
+    )
+
+    instance_models: BoolProperty = BoolProperty(
+        name="Instance Repeated Models",
+        description="Build each distinct model once into a hidden library collection and place its occurrences as collection instances",
+        default=False,
+    )
+
+    choose_models: BoolProperty = BoolProperty(
+        name="Choose Models",
+        description="Scan the file first and pick the models to import from a list",
+        default=False,
+        options={'SKIP_SAVE'},
+    )
+
+    model_selection: StringProperty = StringProperty(
+        name="Models",
+        description="Indices and ranges of the models to import like 0-9,12, empty for the first 50",
+        default="",
+        options={'SKIP_SAVE'},
+    )
+
+    keep_parsed_files: BoolProperty = BoolProperty(
+        name="Reuse Parsed Files",
+        description="Keep parsed files in memory for the session so importing them again with other settings skips parsing",
+        default=False,
+    )
+
+    use_background: BoolProperty = BoolProperty(
+        name="Background Import",
+        description="Parse the file on a background thread and keep the UI responsive, press Esc to cancel",
+        default=True,
+    )
+
+    # Seconds of main thread time spent building objects per timer tick
+    build_time_slice: float = 0.05
+
+    def get_filepaths(self) -> List[str]:
+        """Selected files, every IGZ/BLD file of the directory if none were picked"""
+        names = [file.name for file in self.files if file.name]
+        if len(names) > 0:
+            return [os.path.join(self.directory, name) for name in names]
+
+        if self.directory and not os.path.isfile(self.filepath):
+            return [os.path.join(self.directory, name)
+                    for name in sorted(os.listdir(self.directory))
+                    if name.lower().endswith((".igz", ".bld"))]
+
+        return [self.filepath]
+
+    def execute(self, context: Any) -> set:
+        try:
+            model_indices = importer.parseModelSelection(self.model_selection)
+        except ValueError:
+            self.report({'ERROR'}, f"Invalid model selection: {self.model_selection}")
+            return {'CANCELLED'}
+
+        options = constants.ImportOptions(
+            buildMeshes=self.build_meshes,
+            buildBones=self.build_bones,
+            buildFaces=self.build_faces,
+            allowWii=self.allow_wii,
+            attributes=constants.attributePresets[self.attribute_preset],
+            dedupMeshes=self.deduplicate_meshes,
+            sessionMeshes=self.reuse_session_meshes,
+            instanceModels=self.instance_models,
+            mergeMeshes=self.merge_meshes,
+            proxyMode=self.proxy_mode,
+            modelIndices=model_indices,
+        )
+
+        filepaths = self.get_filepaths()
+        if len(filepaths) == 0:
+            self.report({'ERROR'}, "No IGZ/BLD files selected")
+            return {'CANCELLED'}
+
+        if self.choose_models:
+            if len(filepaths) != 1:
+                self.report({'ERROR'}, "Models can only be chosen from a single file")
+                return {'CANCELLED'}
+            settings = self.as_keywords(ignore=(
+                "filepath", "files", "directory", "filter_glob", "choose_models", "model_selection"))
+            bpy.ops.import_mesh.skylanders_igz_models(
+                'INVOKE_DEFAULT', filepath=filepaths[0], settings=json.dumps(settings))
+            return {'FINISHED'}
+
+        self._job = importer.ImportJob(
+            filepaths, options, importer.sessionParseCache if self.keep_parsed_files else None)
+        self._collections = {}
+        self._mesh_cache = formats.getMeshCache(options)
+        self._model_library = formats.ModelLibrary() if options.instanceModels else None
+        self._file_hashes = {}
+        self._instances = {}
+        self._sources = {}
+
+        if self.use_background and not bpy.app.background:
+            return self.start_background_import(context)
+
+        # Load, decode and build the files one model at a time
+        decoded = self._job.iterDecoded()
+        try:
+            for filepath, source, index, model in decoded:
+                self.build_model(context, filepath, source, index, model)
+        except Exception as e:
+            self._job.discardDecoded(decoded)
+            self.report({'ERROR'}, f"Error: {str(e)}")
+            return {'CANCELLED'}
+
+        self.place_occurrences()
+        return self.report_result()
+
+    def get_collection(self, context: Any, filepath: str) -> Any:
+        """Collection the objects of a file are linked to, one per file in a batch"""
+        if len(self._job.filepaths) == 1:
+            return context.scene.collection
+
+        if filepath not in self._collections:
+            collection = bpy.data.collections.new(os.path.basename(filepath))
+            context.scene.collection.children.link(collection)
+            self._collections[filepath] = collection
+        return self._collections[filepath]
+
+    def build_ready_models(self, context: Any, deadline: float = None) -> None:
+        """Build decoded models until the queue is empty or the deadline passes"""
+        job = self._job
+        while deadline is None or time.perf_counter() < deadline:
+            try:
+                filepath, source, index, model = job.ready.get_nowait()
+            except queue.Empty:
+                break
+            self.build_model(context, filepath, source, index, model)
+
+    def build_model(self, context: Any, filepath: str, source: Any, index: int, model: Any) -> None:
+        """Create the Blender objects of a decoded model, tag them with their source and free its decoded data"""
+        print(f"Building model {index}")
+        model.attachArrays()
+        try:
+            if len(model.meshes) > 0:
+                objects = build_objects(source, index, model, self.get_collection(context, filepath),
+                                        self._mesh_cache, self._model_library)
+                if filepath not in self._file_hashes:
+                    self._file_hashes[filepath] = importer.getSourceHash(source)
+                tag_objects(objects.items(), filepath, self._file_hashes[filepath], index,
+                            model.id, model.getSourceKey(source), source.options, self.keep_parsed_files)
+                if source.options.instanceModels and 0 in objects:
+                    self._instances[(filepath, index)] = objects[0]
+                    self._sources[filepath] = source
+        finally:
+            model.releaseArrays()
+        self._job.builtCount += 1
+
+    def place_occurrences(self) -> None:
+        """Copy the instance or proxy of each model the files reference again to its other placements"""
+        for filepath, source in self._sources.items():
+            for index, placement in source.occurrences:
+                instance = self._instances.get((filepath, index))
+                if instance is None:
+                    continue
+                occurrence = instance.copy()
+                occurrence.matrix_world = Matrix(placement.tolist())
+                for collection in instance.users_collection:
+                    collection.objects.link(occurrence)
+
+    def report_result(self) -> set:
+        job = self._job
+        for filepath, error in job.errors:
+            self.report(
+                {'WARNING'}, f"Failed to import {os.path.basename(filepath)}: {str(error)}")
+
+        if len(job.errors) == len(job.filepaths):
+            return {'CANCELLED'}
+
+        if len(job.filepaths) == 1:
+            self.report(
+                {'INFO'}, f"Successfully imported {job.parsedModelCount} models")
+        else:
+            self.report(
+                {'INFO'}, f"Successfully imported {job.parsedModelCount} models from {job.parsedFileCount - len(job.errors)} files")
+        return {'FINISHED'}
+
+    def start_background_import(self, context: Any) -> set:
+        self._job.start()
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.05, window=context.window)
+        wm.progress_begin(0, 100)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context: Any, event: Any) -> set:
+        job = self._job
+
+        if event.type == 'ESC':
+            job.cancel()
+            job.discardReady()
+            self.finish_background_import(context)
+            self.report(
+                {'WARNING'}, f"Import cancelled after {job.builtCount} of {job.modelCount} models")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        if job.error is not None:
+            self.finish_background_import(context)
+            self.report({'ERROR'}, f"Error: {str(job.error)}")
+            return {'CANCELLED'}
+
+        # Build as many decoded models as fit in this tick's time slice
+        try:
+            self.build_ready_models(
+                context, time.perf_counter() + self.build_time_slice)
+        except Exception as e:
+            self.cancel(context)
+            self.report({'ERROR'}, f"Error: {str(e)}")
+            return {'CANCELLED'}
+
+        if len(job.filepaths) == 1:
+            name = os.path.basename(job.filepaths[0])
+        else:
+            name = f"{len(job.filepaths)} files"
+        context.window_manager.progress_update(int(job.getProgress() * 100))
+        context.workspace.status_text_set(
+            f"Importing {name}: {job.getStatus()} (Esc to cancel)")
+
+        if job.isDone():
+            self.finish_background_import(context)
+            self.place_occurrences()
+            return self.report_result()
+
+        return {'RUNNING_MODAL'}
+
+    def cancel(self, context: Any) -> None:
+        self._job.cancel()
+        self._job.discardReady()
+        self.finish_background_import(context)
+
+    def finish_background_import(self, context: Any) -> None:
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+
+class SkylandersIGZModelItem(bpy.types.PropertyGroup):
+    index: IntProperty = IntProperty()
+    model_id: IntProperty = IntProperty()
+    metatype: StringProperty = StringProperty()
+    mesh_count: IntProperty = IntProperty()
+    vertex_count: IntProperty = IntProperty()
+    has_skeleton: BoolProperty = BoolProperty()
+    selected: BoolProperty = BoolProperty(name="Import")
+
+
+class IGZ_UL_models(bpy.types.UIList):
+    def draw_item(self, context: Any, layout: Any, data: Any, item: Any, icon: Any,
+                  active_data: Any, active_propname: str, index: int = 0) -> None:
+        row = layout.row(align=True)
+        row.prop(item, "selected", text="")
+        row.label(text=f"{item.index}")
+        row.label(text=item.metatype)
+        row.label(text=f"{item.mesh_count} meshes")
+        row.label(text=f"{item.vertex_count} vertices")
+        row.label(text="", icon='ARMATURE_DATA' if item.has_skeleton else 'BLANK1')
+
+
+class SelectSkylandersIGZModels(bpy.types.Operator):
+    """Pick the models of an IGZ/BLD file to import from a scan of its object graph"""
+    bl_idname = "import_mesh.skylanders_igz_models"
+    bl_label = "Choose IGZ Models"
+    bl_options = {'INTERNAL'}
+
+    filepath: StringProperty = StringProperty(options={'HIDDEN'})
+
+    # Keyword arguments of the import operator as JSON
+    settings: StringProperty = StringProperty(options={'HIDDEN'})
+
+    models: CollectionProperty = CollectionProperty(
+        type=SkylandersIGZModelItem, options={'SKIP_SAVE'})
+
+    active_model: IntProperty = IntProperty(options={'HIDDEN', 'SKIP_SAVE'})
+
+    model_selection: StringProperty = StringProperty(
+        name="Also Import",
+        description="Indices and ranges like 0-9,12 to import on top of the ticked models",
+        default="",
+        options={'SKIP_SAVE'},
+    )
+
+    def invoke(self, context: Any, event: Any) -> set:
+        settings = json.loads(self.settings)
+        options = constants.ImportOptions(allowWii=settings.get("allow_wii", True))
+        try:
+            summaries = importer.scanFile(
+                self.filepath, options,
+                importer.sessionParseCache if settings.get("keep_parsed_files", False) else None)
+        except Exception as e:
+            self.report({'ERROR'}, f"Error: {str(e)}")
+            return {'CANCELLED'}
+
+        # Tick the models an import without a selection would build
+        self.models.clear()
+        for summary in summaries:
+            item = self.models.add()
+            item.index = summary.index
+            item.model_id = summary.id
+            item.metatype = summary.metatype or ""
+            item.mesh_count = summary.meshCount
+            item.vertex_count = summary.vertexCount
+            item.has_skeleton = summary.hasSkeleton
+            item.selected = summary.index < options.modelThreshold
+        return context.window_manager.invoke_props_dialog(self, width=520)
+
+    def draw(self, context: Any) -> None:
+        layout = self.layout
+        layout.label(text=f"{len(self.models)} models in {os.path.basename(self.filepath)}")
+        layout.template_list("IGZ_UL_models", "", self, "models",
+                             self, "active_model", rows=12)
+        layout.prop(self, "model_selection")
+
+    def execute(self, context: Any) -> set:
+        indices = {item.index for item in self.models if item.selected}
+        try:
+            extra = importer.parseModelSelection(self.model_selection)
+        except ValueError:
+            self.report({'ERROR'}, f"Invalid model selection: {self.model_selection}")
+            return {'CANCELLED'}
+        if extra is not None:
+            indices |= extra
+
+        if len(indices) == 0:
+            self.report({'WARNING'}, "No models selected")
+            return {'CANCELLED'}
+
+        bpy.ops.import_mesh.skylanders_igz(
+            filepath=self.filepath, model_selection=importer.formatModelSelection(indices),
+            **json.loads(self.settings))
+        return {'FINISHED'}
+
+
+def build_objects(source: Any, index: int, model: Any, collection: Any, mesh_cache: Any,
+                  library: Any = None) -> dict:
+    """Build a model the way its import options ask for, returning its objects by build part"""
+    if source.options.proxyMode != 'NONE':
+        proxy = model.buildProxy(source, index, collection)
+        return {0: proxy} if proxy is not None else {}
+    if library is not None:
+        instance = model.buildInstance(source, index, collection, library, mesh_cache)
+        return {0: instance} if instance is not None else {}
+    return model.build(source, index, collection, mesh_cache) or {}
+
+
+def tag_objects(objects: Any, filepath: str, file_hash: str, index: int, model_id: int,
+                model_key: str, options: constants.ImportOptions, keep_parsed: bool) -> None:
+    """Remember where (part, object) pairs came from so they can be realized or refreshed later"""
+    options_text = importer.encodeOptions(options)
+    for part, obj in objects:
+        obj["igz_filepath"] = filepath
+        obj["igz_file_hash"] = file_hash
+        obj["igz_model_index"] = index
+        obj["igz_model_id"] = model_id
+        obj["igz_model_key"] = model_key
+        obj["igz_part"] = part
+        obj["igz_options"] = options_text
+        obj["igz_keep_parsed"] = keep_parsed
+
+
+def get_parse_cache(keep_parsed: bool) -> Any:
+    """Parse cache of a tagged object's Reuse Parsed Files setting, None if it was off"""
+    return importer.sessionParseCache if keep_parsed else None
+
+
+def is_proxy(obj: Any) -> bool:
+    """Whether obj is a placeholder built by an import with a proxy mode"""
+    return "igz_options" in obj and importer.decodeOptions(obj["igz_options"]).proxyMode != 'NONE'
+
+
+def find_model(parser: Any, index: int, model_id: int) -> Any:
+    """
+    Index of the model an object was built from in a new parse of its file
+
+    None if no model has its id any more, guessing from the index could
+    rebuild an unrelated model into the object.
+    """
+    if index < len(parser.models) and parser.models[index].id == model_id:
+        return index
+    for other, model in enumerate(parser.models):
+        if model.id == model_id:
+            return other
+    return None
+
+
+def swap_data(obj: Any, new_obj: Any) -> None:
+    """Give obj the data of new_obj, an unused old datablock is removed"""
+    if obj.type == 'EMPTY':
+        obj.instance_collection = new_obj.instance_collection
+        return
+
+    old = obj.data
+    if old == new_obj.data:
+        return
+    # Materials the user assigned to the old mesh carry over
+    if isinstance(old, bpy.types.Mesh) and len(new_obj.data.materials) == 0:
+        for material in old.materials:
+            new_obj.data.materials.append(material)
+    obj.data = new_obj.data
+    if old.users == 0:
+        if isinstance(old, bpy.types.Mesh):
+            bpy.data.meshes.remove(old)
+        elif isinstance(old, bpy.types.Armature):
+            bpy.data.armatures.remove(old)
+
+
+class RealizeSkylandersProxies(bpy.types.Operator):
+    """Replace the selected IGZ placeholders with the full geometry of their models"""
+    bl_idname = "object.skylanders_igz_realize_proxies"
+    bl_label = "Realize Selected IGZ Proxies"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context: Any) -> bool:
+        return any(is_proxy(obj) for obj in context.selected_objects)
+
+    def execute(self, context: Any) -> set:
+        # Parse every file once for all of its selected proxies, a model
+        # placed more than once has a proxy per placement
+        groups = {}
+        for obj in context.selected_objects:
+            if is_proxy(obj) and "igz_model_index" in obj:
+                key = (obj["igz_filepath"], obj["igz_options"], bool(obj.get("igz_keep_parsed", False)))
+                model_key = (obj["igz_model_index"], obj["igz_model_id"])
+                groups.setdefault(key, {}).setdefault(model_key, []).append(obj)
+
+        realized = 0
+        library = formats.ModelLibrary()
+        for (filepath, options_text, keep_parsed), models in groups.items():
+            try:
+                options = dataclasses.replace(
+                    importer.decodeOptions(options_text), proxyMode='NONE')
+                parser = importer.loadParsed(
+                    filepath, options, get_parse_cache(keep_parsed))
+                file_hash = importer.getFileHash(parser.inFile.data)
+                mesh_cache = formats.getMeshCache(options)
+                for (index, model_id), proxies in models.items():
+                    index = find_model(parser, index, model_id)
+                    if index is None:
+                        names = ", ".join(proxy.name for proxy in proxies)
+                        self.report(
+                            {'WARNING'}, f"Left {names} as proxies, model {model_id:#x} is no longer in {os.path.basename(filepath)}")
+                        continue
+                    if len(parser.models[index].meshes) == 0:
+                        continue
+                    model = parser.models[index].copyParsed()
+                    try:
+                        for proxy in proxies:
+                            objects = self.realize(context, parser, index, model, proxy, mesh_cache,
+                                                   library if options.instanceModels else None)
+                            tag_objects(objects.items(), filepath, file_hash, index,
+                                        model.id, model.getSourceKey(parser), options, keep_parsed)
+                            realized += 1
+                    finally:
+                        model.releaseArrays()
+            except Exception as e:
+                self.report(
+                    {'WARNING'}, f"Failed to realize {os.path.basename(filepath)}: {str(e)}")
+
+        self.report({'INFO'}, f"Realized {realized} models")
+        return {'FINISHED'} if realized > 0 else {'CANCELLED'}
+
+    def realize(self, context: Any, parser: Any, index: int, model: Any, proxy: Any, mesh_cache: Any,
+                library: Any) -> dict:
+        """Build a model the way an import with its options does, in its proxy's place, and remove the proxy"""
+        collection = proxy.users_collection[0] if len(
+            proxy.users_collection) > 0 else context.scene.collection
+        objects = build_objects(parser, index, model, collection, mesh_cache, library)
+
+        # Proxies are built at the model's placement and may have been moved since
+        placement = Matrix(model.transformation.tolist()) if model.transformation is not None else Matrix.Identity(4)
+        offset = proxy.matrix_world @ placement.inverted_safe()
+        for obj in objects.values():
+            if obj.parent is None:
+                obj.matrix_world = offset @ obj.matrix_world
+
+        data = proxy.data
+        bpy.data.objects.remove(proxy)
+        if data is not None and data.users == 0:
+            bpy.data.meshes.remove(data)
+        return objects
+
+
+class RefreshSkylandersIGZ(bpy.types.Operator):
+    """Rebuild the imported IGZ models whose files changed on disk, leaving the others as they are"""
+    bl_idname = "object.skylanders_igz_refresh"
+    bl_label = "Refresh IGZ Imports"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context: Any) -> bool:
+        return any("igz_file_hash" in obj for obj in context.scene.objects)
+
+    def execute(self, context: Any) -> set:
+        # Tagged objects by file and import options, then by model
+        groups = {}
+        for obj in context.scene.objects:
+            if "igz_file_hash" in obj and "igz_options" in obj:
+                key = (obj["igz_filepath"], obj["igz_options"], bool(obj.get("igz_keep_parsed", False)))
+                model_key = (obj["igz_model_index"], obj["igz_model_id"])
+                groups.setdefault(key, {}).setdefault(model_key, []).append(obj)
+
+        changed_files = set()
+        rebuilt = 0
+        read_path = None
+        # Sorted so only one file's data is held at a time
+        for (filepath, options_text, keep_parsed), models in sorted(groups.items()):
+            try:
+                options = importer.decodeOptions(options_text)
+                parse_cache = get_parse_cache(keep_parsed)
+                # A cached parse of the file as it is now saves reading it
+                parser = parse_cache.get(filepath, options) if parse_cache is not None else None
+                if parser is not None:
+                    data = parser.inFile.data
+                    read_path = filepath
+                    file_hash = importer.getFileHash(data)
+                elif filepath != read_path:
+                    with open(filepath, 'rb') as file:
+                        data = file.read()
+                    read_path = filepath
+                    file_hash = importer.getFileHash(data)
+
+                if all(obj["igz_file_hash"] == file_hash
+                       for objects in models.values() for obj in objects):
+                    continue
+                changed_files.add(filepath)
+
+                if parser is None:
+                    parser = importer.openData(data, options)
+                    parser.loadFile()
+                    if parse_cache is not None:
+                        parse_cache.add(filepath, options, parser)
+                rebuilt += self.refresh_file(context, parser, filepath, file_hash, models, keep_parsed)
+            except Exception as e:
+                read_path = None
+                self.report(
+                    {'WARNING'}, f"Failed to refresh {os.path.basename(filepath)}: {str(e)}")
+
+        if len(changed_files) == 0:
+            self.report({'INFO'}, "All IGZ imports are up to date")
+            return {'CANCELLED'}
+
+        self.report(
+            {'INFO'}, f"Rebuilt {rebuilt} models from {len(changed_files)} changed files")
+        return {'FINISHED'}
+
+    def refresh_file(self, context: Any, parser: Any, filepath: str, file_hash: str, models: dict,
+                     keep_parsed: bool) -> int:
+        """
+        Rebuild the models of a changed file whose data changed and retag all of them
+
+        With keep_parsed the parser may be cached, its models are copied
+        instead of decoded in place.
+        """
+        options = parser.options
+        mesh_cache = formats.getMeshCache(options)
+        library = formats.ModelLibrary() if options.instanceModels else None
+
+        rebuilt = 0
+        for (index, model_id), objects in models.items():
+            index = find_model(parser, index, model_id)
+            if index is None:
+                names = ", ".join(obj.name for obj in objects)
+                self.report(
+                    {'WARNING'}, f"Left {names} unchanged, model {model_id:#x} is no longer in {os.path.basename(filepath)}")
+                continue
+
+            # The key only hashes raw buffers, unchanged models are never decoded
+            model = parser.models[index]
+            if keep_parsed:
+                model = model.copyParsed()
+            model_key = model.getSourceKey(parser)
+            parts = [(obj["igz_part"], obj) for obj in objects]
+            if any(obj["igz_model_key"] != model_key for obj in objects):
+                parts += self.rebuild(context, parser, index, model, objects,
+                                      mesh_cache, library).items()
+                rebuilt += 1
+            tag_objects(parts, filepath, file_hash, index, model.id, model_key, options, keep_parsed)
+            if not keep_parsed:
+                model.releaseRawData()
+        return rebuilt
+
+    def rebuild(self, context: Any, parser: Any, index: int, model: Any, objects: List[Any],
+                mesh_cache: Any, library: Any) -> dict:
+        """
+        Build a model into a scratch collection and move the new data onto its objects
+
+        The objects keep their names, transforms, modifiers and parents. Build
+        parts none of them had are moved over as new objects and returned.
+        """
+        scratch = bpy.data.collections.new("IGZ Refresh")
+        # Armatures need their object in the view layer to enter edit mode
+        context.scene.collection.children.link(scratch)
+        try:
+            built = build_objects(parser, index, model, scratch, mesh_cache, library)
+            replaced = {}
+            for obj in objects:
+                new_obj = built.get(obj["igz_part"])
+                if new_obj is not None and new_obj.type == obj.type:
+                    swap_data(obj, new_obj)
+                    replaced[new_obj] = obj
+
+            collection = objects[0].users_collection[0] if len(
+                objects[0].users_collection) > 0 else context.scene.collection
+            added = {}
+            for part, new_obj in built.items():
+                if new_obj in replaced:
+                    continue
+                collection.objects.link(new_obj)
+                scratch.objects.unlink(new_obj)
+                # Hook new meshes up to the armature that stays
+                if new_obj.parent in replaced:
+                    new_obj.parent = replaced[new_obj.parent]
+                for modifier in new_obj.modifiers:
+                    if modifier.type == 'ARMATURE' and modifier.object in replaced:
+                        modifier.object = replaced[modifier.object]
+                added[part] = new_obj
+        finally:
+            model.releaseArrays()
+            for obj in list(scratch.objects):
+                bpy.data.objects.remove(obj)
+            bpy.data.collections.remove(scratch)
+        return added
+
+
+# ------------------------------------------------------------------------------
+# Register/Unregister functionality
+# ------------------------------------------------------------------------------
+def menu_func_import(self, context):
+    self.layout.operator(ImportSkylandersIGZ.bl_idname,
+                         text="Skylanders IGZ/BLD (.igz/.bld)")
+
+
+def menu_func_object(self, context):
+    self.layout.operator(RealizeSkylandersProxies.bl_idname)
+    self.layout.operator(RefreshSkylandersIGZ.bl_idname)
+
+
+def register():
+    bpy.utils.register_class(SkylandersIGZModelItem)
+    bpy.utils.register_class(IGZ_UL_models)
+    bpy.utils.register_class(SelectSkylandersIGZModels)
+    bpy.utils.register_class(ImportSkylandersIGZ)
+    bpy.utils.register_class(RealizeSkylandersProxies)
+    bpy.utils.register_class(RefreshSkylandersIGZ)
+    bpy.types.TOPBAR_MT_file_import.append(menu_func_import)
+    bpy.types.VIEW3D_MT_object.append(menu_func_object)
+
+
+def unregister():
+    importer.sessionParseCache.clear()
+    bpy.types.VIEW3D_MT_object.remove(menu_func_object)
+    bpy.types.TOPBAR_MT_file_import.remove(menu_func_import)
+    bpy.utils.unregister_class(RefreshSkylandersIGZ)
+    bpy.utils.unregister_class(RealizeSkylandersProxies)
+    bpy.utils.unregister_class(ImportSkylandersIGZ)
+    bpy.utils.unregister_class(SelectSkylandersIGZModels)
+    bpy.utils.unregister_class(IGZ_UL_models)
+    bpy.utils.unregister_class(SkylandersIGZModelItem)
@@ -0,0 +1,290 @@
+"""
+Opt-in profiling of imports: time per metatype and memory per phase
+
+Enabling the metatype profiler swaps the parser's arkRegisteredTypes for a
+copy with timing wrappers and its input stream for one that counts bytes, a
+parser that was never enabled runs the unmodified handlers. The memory report
+only traces allocations between its start and stop.
+"""
+
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+import numpy
+from . import formats
+from . import utils
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class CountingBitStream(utils.NoeBitStream):
+    """NoeBitStream that counts the bytes its read methods consume"""
+    bytesRead: int
+
+    def __init__(self, stream: utils.NoeBitStream) -> None:
+        super().__init__(stream.data, stream.endian)
+        self.offset = stream.offset
+        self.bytesRead = 0
+
+
+def _countedRead(method: Callable) -> Callable:
+    def countedRead(self: CountingBitStream, *args: Any) -> Any:
+        start = self.offset
+        value = method(self, *args)
+        self.bytesRead += self.offset - start
+        return value
+    countedRead.__name__ = method.__name__
+    return countedRead
+
+
+for _name in ("readBytes", "readUInt", "readUInt64", "readInt", "readUShort", "readUByte",
+              "readString", "readFloat", "readDouble", "readShort", "readHalfFloat"):
+    setattr(CountingBitStream, _name, _countedRead(getattr(utils.NoeBitStream, _name)))
+
+
+class MetatypeStats:
+    calls: int
+    cumulativeTime: float
+    selfTime: float
+    bytesRead: int
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.cumulativeTime = 0.0
+        self.selfTime = 0.0
+        self.bytesRead = 0
+
+
+class MetatypeProfiler:
+    """
+    Call counts, cumulative and self time and bytes read per metatype
+
+    Self time and bytes exclude nested objects, which also gives the folded
+    stacks of the flame graph export.
+    """
+    stats: Dict[str, MetatypeStats]
+    foldedStacks: Dict[str, float]
+
+    def __init__(self) -> None:
+        self.stats = {}
+        self.foldedStacks = {}
+        # [metatype, start time, child time, start bytes, child bytes]
+        self.stack = []
+        self.stream = None
+
+    def enable(self, parser: Any) -> None:
+        """Instrument parser, call before loadHeader"""
+        self.stream = CountingBitStream(parser.inFile)
+        parser.inFile = self.stream
+        parser.arkRegisteredTypes = {metatype: self.wrap(metatype, handler)
+                                     for metatype, handler in parser.arkRegisteredTypes.items()}
+
+    def wrap(self, metatype: str, handler: Callable) -> Callable:
+        def profiledHandler(igz: Any, bs: Any, offset: int) -> Any:
+            self.enter(metatype)
+            try:
+                return handler(igz, bs, offset)
+            finally:
+                self.exit()
+        return profiledHandler
+
+    def enter(self, metatype: str) -> None:
+        self.stack.append([metatype, time.perf_counter(), 0.0, self.stream.bytesRead, 0])
+
+    def exit(self) -> None:
+        metatype, start, childTime, startBytes, childBytes = self.stack.pop()
+        elapsed = time.perf_counter() - start
+        bytesRead = self.stream.bytesRead - startBytes
+
+        stats = self.stats.get(metatype)
+        if stats is None:
+            stats = self.stats[metatype] = MetatypeStats()
+        stats.calls += 1
+        stats.selfTime += elapsed - childTime
+        stats.bytesRead += bytesRead - childBytes
+        # Recursive types only count their outermost call as cumulative time
+        if all(frame[0] != metatype for frame in self.stack):
+            stats.cumulativeTime += elapsed
+
+        key = ";".join([frame[0] for frame in self.stack] + [metatype])
+        self.foldedStacks[key] = self.foldedStacks.get(key, 0.0) + elapsed - childTime
+
+        if len(self.stack) > 0:
+            self.stack[-1][2] += elapsed
+            self.stack[-1][4] += bytesRead
+
+    def formatTable(self, sortBy: str = "selfTime", limit: Optional[int] = None) -> str:
+        rows = sorted(self.stats.items(),
+                      key=lambda item: getattr(item[1], sortBy), reverse=True)
+        if limit is not None:
+            rows = rows[:limit]
+        lines = [f"{'metatype':<32}{'calls':>8}{'cum ms':>12}{'self ms':>12}{'bytes':>12}"]
+        for metatype, stats in rows:
+            lines.append(f"{metatype:<32}{stats.calls:>8}{stats.cumulativeTime * 1000:>12.3f}"
+                         f"{stats.selfTime * 1000:>12.3f}{stats.bytesRead:>12}")
+        return "\n".join(lines)
+
+    def getFoldedStacks(self) -> List[str]:
+        """Lines of "a;b;c microseconds" as read by flamegraph.pl, speedscope and the like"""
+        return [f"{stack} {int(round(seconds * 1e6))}"
+                for stack, seconds in sorted(self.foldedStacks.items())]
+
+    def writeFoldedStacks(self, filepath: str) -> None:
+        with open(filepath, "w") as file:
+            file.write("\n".join(self.getFoldedStacks()) + "\n")
+
+
+# Categories the memory report splits the live import data into
+memoryCategories = ("file buffer", "thumbnails", "raw mesh buffers", "mesh attributes")
+
+
+def getObjectBytes(value: Any, seen: Optional[set] = None) -> int:
+    """Approximate bytes owned by value, views of other buffers own nothing"""
+    if value is None or isinstance(value, memoryview):
+        return 0
+    if seen is None:
+        seen = set()
+    # Decoded lists share float objects between their tuples
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, numpy.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(getObjectBytes(item, seen) for item in value)
+    return sys.getsizeof(value)
+
+
+def getRawMeshBytes(mesh: Any) -> int:
+    return (getObjectBytes(mesh.vertexBuffers) + getObjectBytes(mesh.indexBuffer)
+            + getObjectBytes(mesh.ps3Segments) + getObjectBytes(mesh.packData)
+            + getObjectBytes(mesh.platformData))
+
+
+def getAttributeBytes(mesh: Any) -> int:
+    return sum(getObjectBytes(getattr(mesh, name))
+               for name, dtype, components in formats.MeshObject.attributeLayouts)
+
+
+def getCategoryBytes(parser: Any) -> Dict[str, int]:
+    meshes = [mesh for model in parser.models for mesh in model.meshes]
+    return {
+        "file buffer": sys.getsizeof(parser.inFile.data),
+        "thumbnails": sum(getObjectBytes(thumbnail[2]) for thumbnail in parser.thumbnails),
+        "raw mesh buffers": sum(getRawMeshBytes(mesh) for mesh in meshes),
+        "mesh attributes": sum(getAttributeBytes(mesh) for mesh in meshes),
+    }
+
+
+def getPeakRss() -> Optional[int]:
+    """Peak resident set size of the process in bytes, None where it can't be read"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes everywhere but macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class PhaseMemory:
+    name: str
+    current: int
+    peak: int
+    rssGrowth: Optional[int]
+    categories: Dict[str, int]
+
+    def __init__(self, name: str, current: int, peak: int, rssGrowth: Optional[int], categories: Dict[str, int]) -> None:
+        self.name = name
+        self.current = current
+        self.peak = peak
+        self.rssGrowth = rssGrowth
+        self.categories = categories
+
+
+class MemoryReport:
+    """
+    Traced Python memory at the end of each import phase and its peak during it
+
+    Blender allocates its datablocks outside of Python's allocator, they only
+    show up in the growth of the peak resident set size.
+    """
+    phases: List[PhaseMemory]
+    meshes: List[tuple]
+
+    def __init__(self) -> None:
+        self.phases = []
+        # (model index, mesh name, vertex count, raw bytes, decoded bytes)
+        self.meshes = []
+        self.startedTracing = False
+        self.rss = None
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.startedTracing = True
+        tracemalloc.reset_peak()
+        self.rss = getPeakRss()
+
+    def stop(self) -> None:
+        if self.startedTracing:
+            tracemalloc.stop()
+            self.startedTracing = False
+
+    def phase(self, name: str, parser: Any) -> None:
+        """Close the phase that just ended"""
+        current, peak = tracemalloc.get_traced_memory()
+        rss = getPeakRss()
+        rssGrowth = rss - self.rss if rss is not None else None
+        self.phases.append(PhaseMemory(
+            name, current, peak, rssGrowth, getCategoryBytes(parser)))
+        # Measuring the categories allocates too, keep it out of the next phase
+        tracemalloc.reset_peak()
+        self.rss = getPeakRss()
+
+    def recordMeshes(self, parser: Any) -> None:
+        for index, model in enumerate(parser.models):
+            for mesh in model.meshes:
+                if mesh.vertexCount == 0:
+                    continue
+                self.meshes.append((index, mesh.name, mesh.vertexCount,
+                                    getRawMeshBytes(mesh), getAttributeBytes(mesh)))
+
+    def getPeakPhase(self) -> Optional[PhaseMemory]:
+        if len(self.phases) == 0:
+            return None
+        return max(self.phases, key=lambda phase: phase.peak)
+
+    def formatReport(self, meshLimit: Optional[int] = 20) -> str:
+        megabyte = 1024 * 1024
+        header = f"{'phase':<10}{'current MB':>12}{'peak MB':>12}{'rss +MB':>10}"
+        header += "".join(f"{category:>18}" for category in memoryCategories)
+        lines = [header]
+        for phase in self.phases:
+            rssGrowth = f"{phase.rssGrowth / megabyte:>10.1f}" if phase.rssGrowth is not None else f"{'-':>10}"
+            line = f"{phase.name:<10}{phase.current / megabyte:>12.2f}{phase.peak / megabyte:>12.2f}{rssGrowth}"
+            line += "".join(f"{phase.categories[category] / megabyte:>18.2f}"
+                            for category in memoryCategories)
+            lines.append(line)
+
+        peakPhase = self.getPeakPhase()
+        if peakPhase is not None:
+            known = sum(peakPhase.categories.values())
+            parts = [f"{category} {peakPhase.categories[category] / megabyte:.2f} MB"
+                     for category in memoryCategories]
+            parts.append(f"other {max(peakPhase.peak - known, 0) / megabyte:.2f} MB")
+            lines.append(f"peak {peakPhase.peak / megabyte:.2f} MB during {peakPhase.name}: "
+                         + ", ".join(parts))
+
+        if len(self.meshes) > 0:
+            lines.append("")
+            lines.append(f"{'model':>6}  {'mesh':<24}{'vertices':>10}{'raw B/vtx':>12}{'decoded B/vtx':>16}")
+            meshes = sorted(self.meshes, key=lambda mesh: mesh[4] / mesh[2], reverse=True)
+            if meshLimit is not None:
+                meshes = meshes[:meshLimit]
+            for index, name, vertexCount, rawBytes, decodedBytes in meshes:
+                lines.append(f"{index:>6}  {name[:23]:<24}{vertexCount:>10}"
+                             f"{rawBytes / vertexCount:>12.1f}{decodedBytes / vertexCount:>16.1f}")
+        return "\n".join(lines)
@@ -0,0 +1,99 @@
+"""
+Shared memory transport for arrays decoded by worker processes
+
+Only SharedArray descriptors are pickled between processes, the array data
+is written once by the worker and read in place by the importing process.
+"""
+
+import os
+from multiprocessing import shared_memory
+from typing import Any, Dict, List
+import numpy
+
+# Blocks this process created by export group. Windows frees a block as soon
+# as its last handle is closed, so they stay open until the importing process
+# holds a handle of its own
+_exportedBlocks: Dict[int, List[shared_memory.SharedMemory]] = {}
+_exportGroup: int = 0
+# Blocks this process attached to or holds, by name
+_attachedBlocks: Dict[str, shared_memory.SharedMemory] = {}
+
+
+class SharedArray:
+    """Picklable descriptor of an array living in a shared memory block"""
+    name: str
+    dtype: str
+    shape: tuple
+
+    def __init__(self, name: str, dtype: str, shape: tuple) -> None:
+        self.name = name
+        self.dtype = dtype
+        self.shape = shape
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+
+def share(values: Any, dtype: str) -> SharedArray:
+    """Copy values into a new shared memory block and return its descriptor"""
+    array = numpy.asarray(values, dtype=dtype)
+    block = shared_memory.SharedMemory(create=True, size=array.nbytes)
+    view = numpy.ndarray(array.shape, array.dtype, block.buf)
+    view[...] = array
+    del view
+
+    descriptor = SharedArray(block.name, array.dtype.str, array.shape)
+    if os.name == "nt":
+        _exportedBlocks.setdefault(_exportGroup, []).append(block)
+    else:
+        block.close()
+    return descriptor
+
+
+def beginExport(group: int) -> None:
+    """File the blocks share creates from now on under group"""
+    global _exportGroup
+    _exportGroup = group
+
+
+def getExportGroups() -> List[int]:
+    return list(_exportedBlocks)
+
+
+def closeExported(group: int) -> None:
+    """Close this process's handles of a group's blocks, once the importing process holds them"""
+    for block in _exportedBlocks.pop(group, []):
+        block.close()
+
+
+def hold(descriptor: SharedArray) -> None:
+    """
+    Open a handle of a block so it outlives the process that created it
+
+    Only Windows needs this, elsewhere a block lives until it is unlinked
+    and holding every block of a file would use up file descriptors.
+    """
+    if os.name != "nt" or descriptor.name in _attachedBlocks:
+        return
+    _attachedBlocks[descriptor.name] = shared_memory.SharedMemory(name=descriptor.name)
+
+
+def attach(descriptor: SharedArray) -> numpy.ndarray:
+    """Map a shared block into this process and view it as an array"""
+    block = _attachedBlocks.get(descriptor.name)
+    if block is None:
+        block = shared_memory.SharedMemory(name=descriptor.name)
+        _attachedBlocks[descriptor.name] = block
+    return numpy.ndarray(descriptor.shape, numpy.dtype(descriptor.dtype), block.buf)
+
+
+def release(descriptor: SharedArray) -> None:
+    """Unmap and free a block, the arrays returned by attach must be gone by now"""
+    block = _attachedBlocks.pop(descriptor.name, None)
+    if block is None:
+        try:
+            block = shared_memory.SharedMemory(name=descriptor.name)
+        except FileNotFoundError:
+            return
+    block.close()
+    block.unlink()
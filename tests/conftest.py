@@ -0,0 +1,19 @@
+"""
+Make the add-on importable as io_scene_igz from a checkout
+
+The repository root is the package itself, so it is loaded under its
+extension id the way Blender would. __init__ only registers operators when
+bpy exists, everything the tests use runs outside of Blender.
+"""
+import importlib.util
+import pathlib
+import sys
+
+root = pathlib.Path(__file__).resolve().parents[1]
+
+if "io_scene_igz" not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        "io_scene_igz", root / "__init__.py", submodule_search_locations=[str(root)])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["io_scene_igz"] = package
+    spec.loader.exec_module(package)
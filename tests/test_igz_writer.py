@@ -0,0 +1,81 @@
+"""Synthetic files from igz_writer parsed back by game_formats"""
+import contextlib
+import io
+
+import numpy
+import pytest
+
+from io_scene_igz import constants, game_formats, igz_writer
+
+# (version, platform), 0x09 also on a 64-bit platform
+fileFormats = [
+    (0x05, 1),
+    (0x06, 1),
+    (0x07, 1),
+    (0x08, 1),
+    (0x09, 1),
+    (0x09, 8),
+    pytest.param(0x0A, 1, marks=pytest.mark.xfail(
+        raises=NotImplementedError, strict=True, reason="there is no parser for version 0x0A yet")),
+]
+
+
+def parse(data):
+    parser = game_formats.createParser(data, constants.ImportOptions())
+    # The handlers print every object they read
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser.loadFile()
+        for model in parser.models:
+            model.decodeMeshes(parser)
+    return parser
+
+
+@pytest.mark.parametrize("endianness", ["LE", "BE"])
+@pytest.mark.parametrize("version, platform", fileFormats)
+def test_roundTrip(version, platform, endianness):
+    models = igz_writer.makeModels(modelCount=2, meshCount=2, vertexCount=50, boneCount=4, seed=7)
+    parser = parse(igz_writer.writeIgz(models, version, platform, endianness))
+
+    assert len(parser.models) == len(models)
+    for fixture, model in zip(models, parser.models):
+        assert len(model.boneList) == len(fixture.bones)
+        meshes = [mesh for mesh in model.meshes if len(mesh.vertices) > 0]
+        assert len(meshes) == len(fixture.meshes)
+        for fixtureMesh, mesh in zip(fixture.meshes, meshes):
+            numpy.testing.assert_allclose(mesh.vertices, fixtureMesh.positions, atol=1e-6)
+            numpy.testing.assert_allclose(mesh.uvs, fixtureMesh.uvs, atol=1e-6)
+            # Weights are stored as UBYTE4N
+            weights = numpy.asarray(mesh.weights, dtype=numpy.float64)
+            if numpy.asarray(mesh.weights).dtype == numpy.uint8:
+                weights /= 0xFF
+            numpy.testing.assert_allclose(weights, fixtureMesh.weights, atol=0.5 / 0xFF + 1e-6)
+            numpy.testing.assert_array_equal(mesh.faces, fixtureMesh.faces)
+
+
+@pytest.mark.parametrize("endianness", ["LE", "BE"])
+@pytest.mark.parametrize("version", [0x05, 0x06, 0x08])
+def test_placements(version, endianness):
+    models = igz_writer.makeModels(modelCount=2, meshCount=1, vertexCount=16, seed=7)
+    first = numpy.eye(4)
+    first[:3, 3] = (1.0, 2.0, 3.0)
+    second = numpy.eye(4)
+    second[:3, :3] = [[0.0, -1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]]
+    second[:3, 3] = (-4.0, 0.0, 5.0)
+    models[0].placements = [first, second, first]
+    data = igz_writer.writeIgz(models, version, endianness=endianness)
+
+    parser = game_formats.createParser(data, constants.ImportOptions(instanceModels=True))
+    with contextlib.redirect_stdout(io.StringIO()):
+        parser.loadFile()
+    assert len(parser.models) == 2
+    numpy.testing.assert_allclose(parser.models[0].transformation, first)
+    assert parser.models[1].transformation is None
+    # The repeated placement isn't another occurrence
+    assert len(parser.occurrences) == 1
+    assert parser.occurrences[0][0] == 0
+    numpy.testing.assert_allclose(parser.occurrences[0][1], second)
+
+    # Other imports don't read transforms yet
+    parser = parse(data)
+    assert all(model.transformation is None for model in parser.models)
+    assert parser.occurrences == []
@@ -0,0 +1,31 @@
+"""ImportJob's hand over of decoded models to the builder"""
+import threading
+
+from io_scene_igz import importer
+
+
+class ReleaseCounter:
+    """Stands in for a decoded model, counting releaseArrays calls"""
+
+    def __init__(self):
+        self.released = 0
+
+    def releaseArrays(self):
+        self.released += 1
+
+
+def test_cancelWhilePutReadyWaits():
+    job = importer.ImportJob(["level.igz"])
+    models = [ReleaseCounter() for i in range(job.readyLimit + 1)]
+    for index, model in enumerate(models[:-1]):
+        job.ready.put(("level.igz", None, index, model))
+
+    # The job's thread waits for room while the builder cancels and drains
+    thread = threading.Thread(target=job.putReady, args=(("level.igz", None, job.readyLimit, models[-1]),))
+    thread.start()
+    job.cancel()
+    job.discardReady()
+    thread.join()
+
+    assert job.ready.empty()
+    assert [model.released for model in models] == [1] * len(models)
@@ -0,0 +1,52 @@
+"""The array decode of igVertexElement.unpack against the per vertex unpack functions"""
+import contextlib
+import io
+import struct
+
+import numpy
+import pytest
+
+from io_scene_igz import formats
+
+stride = 24
+vertexCount = 64
+
+
+def makeElement(vertexType, offset, endarg, packExponent=None):
+    """Element of vertexType at offset, scaled by 1 / 2^packExponent through the pack data"""
+    packHint = 0 if packExponent is None else 2
+    data = bytes([vertexType, 0, 0, 1, 0, 0, 0, packHint]) + struct.pack(f"{endarg}HH", offset, 0)
+    return formats.igVertexElement(data, endarg)
+
+
+def unpackScalar(element, vertexBuffer, scale, endarg):
+    function = formats.sscvertexUnpackFunctions[element._type]
+    values = numpy.array([function(vertexBuffer[i * stride:(i + 1) * stride], element, endarg)
+                          for i in range(vertexCount)], dtype=numpy.float64)
+    values[:, :3] *= scale
+    return values.astype(numpy.float32)
+
+
+# Random float bits include NaNs and infinities
+@pytest.mark.filterwarnings("ignore::RuntimeWarning")
+@pytest.mark.parametrize("packExponent", [None, 3])
+@pytest.mark.parametrize("endarg", [">", "<"])
+@pytest.mark.parametrize("vertexType", range(len(formats.sscvertexUnpackFunctions)))
+def test_unpackMatchesScalar(vertexType, endarg, packExponent):
+    random = numpy.random.default_rng(vertexType)
+    vertexBuffer = random.integers(1, 0x100, vertexCount * stride, dtype=numpy.uint8).tobytes()
+    element = makeElement(vertexType, 4, endarg, packExponent)
+    packData = None if packExponent is None else struct.pack(f"{endarg}I", packExponent)
+    scale = 1 if packExponent is None else 1 / (1 << packExponent)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        unpacked = element.unpack(vertexBuffer, stride, packData, endarg)
+        expected = unpackScalar(element, vertexBuffer, scale, endarg)
+
+    values = numpy.frombuffer(unpacked, dtype=f"{endarg}f4").reshape(vertexCount, 4)
+    numpy.testing.assert_allclose(values, expected, rtol=1e-6, equal_nan=True)
+
+
+def test_everyArrayTypeHasAnUnpackFunction():
+    arrayTypes = set(formats.vertexFieldTypes) | set(formats.vertexPackedTypes)
+    assert arrayTypes <= set(range(len(formats.sscvertexUnpackFunctions)))
@@ -4,7 +4,6 @@ Utility classes and functions for the Skylanders importer
 
 import struct
 from . import constants
-import bpy
 from typing import Any
 
 
@@ -153,8 +152,42 @@ def decompressEdgeIndices(indexBuffer: bytes, indexCount: int) -> bytes:
     return bytes(result)
 
 
+def invertJointMatrices(data: Any, indices: Any, endian: str) -> tuple:
+    """
+    World matrices of the joints at indices in the inverse joint array data
+
+    Returns the (n, 4, 4) float64 matrices and the mask of the joints that had
+    a readable, invertible matrix, the others are left as identity.
+    """
+    # numpy instead of mathutils so skeletons can be parsed by worker
+    # processes that run outside of Blender
+    import numpy
+
+    endian = endian.value if hasattr(endian, 'value') else endian
+    indices = numpy.asarray(indices, dtype=numpy.int64)
+    matrices = numpy.tile(numpy.eye(4), (len(indices), 1, 1))
+    count = len(data) // 0x40
+    valid = (indices >= 0) & (indices < count)
+    if not valid.any():
+        return matrices, valid
+
+    # The file stores the matrices column major, transpose them into
+    # Blender's row major order
+    stored = numpy.frombuffer(data, dtype=f"{endian}f4", count=count * 16).reshape(count, 4, 4)
+    inverse = stored[indices[valid]].transpose(0, 2, 1).astype(numpy.float64)
+    invertible = numpy.isfinite(inverse).all(axis=(1, 2))
+    invertible[invertible] = numpy.linalg.det(inverse[invertible]) != 0.0
+    valid[valid] = invertible
+
+    # Matrices are stored inverted in the file, invert them all at once
+    matrices[valid] = numpy.linalg.inv(inverse[invertible])
+    return matrices, valid
+
+
 class Bone:
     """Helper class for bone data"""
+    __slots__ = ("index", "name", "parentIndex", "position", "matrix", "children",
+                 "size_multiplier")
     index: int
     name: str
     parentIndex: int
@@ -162,7 +195,6 @@ class Bone:
     matrix: Any
     children: list
     size_multiplier: float
-    blender_bone: Any
 
     def __init__(self, index: int, name: str, parentIndex: int, translation: Any, size_multiplier: float = 1.5) -> None:
         self.index = index
@@ -172,103 +204,51 @@ class Bone:
         self.matrix = None
         self.children = []
         self.size_multiplier = size_multiplier
-        self.blender_bone = None  # Store reference to created Blender bone
-
-    def setMatrix(self, matrix_data: bytes, endian: str) -> None:
-        """Parse matrix data from the file to create a bone matrix"""
-        from mathutils import Matrix
-
-        # Create a 4x4 matrix from the raw data - ensure correct ordering
-        mtx = []
-        for i in range(0, 64, 4):
-            value = struct.unpack(endian + 'f', matrix_data[i:i+4])[0]
-            mtx.append(value)
-
-        # Create matrix with correct column/row order for Blender
-        self.matrix = Matrix((
-            (mtx[0], mtx[4], mtx[8], mtx[12]),
-            (mtx[1], mtx[5], mtx[9], mtx[13]),
-            (mtx[2], mtx[6], mtx[10], mtx[14]),
-            (mtx[3], mtx[7], mtx[11], mtx[15])
-        ))
-
-        # Matrix is stored inverted in the file, invert it
-        self.matrix.invert()
-
-        # Extract position from matrix
-        self.position = self.matrix.to_translation()
 
     def getPosition(self) -> Any:
         """Get the bone position, either from translation or matrix"""
-        if self.matrix:
+        if self.matrix is not None:
             # Extract position from matrix
             return (self.matrix[0][3], self.matrix[1][3], self.matrix[2][3])
         else:
             # Use the translation directly
             return self.position
 
-    def create_in_blender(self, armature: Any, bone_map: dict = None) -> Any:
-        """Create this bone in a Blender armature"""
-        # Switch to edit mode to add bones
-        bpy.ops.object.mode_set(mode='EDIT')
 
-        # Create a new bone
-        edit_bone = armature.edit_bones.new(self.name)
+def getBoneHierarchy(bone_list: list) -> tuple:
+    """Row of the parent and of the first child of every bone in bone_list, -1 where there is none"""
+    import numpy
 
-        # Set bone position using head and tail
-        position = self.getPosition()
-        edit_bone.head = position
+    rows = {bone.index: row for row, bone in enumerate(bone_list)}
+    parents = numpy.array([rows.get(bone.parentIndex, -1)
+                           for bone in bone_list], dtype=numpy.int64)
+    parents[parents == numpy.arange(len(bone_list))] = -1
 
-        # Set a default tail position (offset in Z direction)
-        # This can be adjusted based on your skeletal structure
-        tail_offset = self.size_multiplier
-        edit_bone.tail = (position[0], position[1], position[2] + tail_offset)
+    children = numpy.full(len(bone_list), -1, dtype=numpy.int64)
+    childRows = numpy.nonzero(parents >= 0)[0]
+    parentRows, first = numpy.unique(parents[childRows], return_index=True)
+    children[parentRows] = childRows[first]
+    return parents, children
 
-        # Store reference to parent if available
-        if self.parentIndex >= 0:
-            parent_name = f"bone_{self.parentIndex}"
-            if bone_map and self.parentIndex in bone_map:
-                parent_name = bone_map[self.parentIndex].name
 
-            if parent_name in armature.edit_bones:
-                edit_bone.parent = armature.edit_bones[parent_name]
+def getBoneTails(heads: Any, children: Any, tail_length: float) -> Any:
+    """Tails pointing at the first child, or tail_length up Z for bones without one"""
+    import numpy
 
-                # Optionally connect bones if they're close enough
-                # edit_bone.use_connect = True
+    tails = heads + numpy.array((0.0, 0.0, tail_length))
+    hasChild = numpy.nonzero(children >= 0)[0]
+    childHeads = heads[children[hasChild]]
+    # Blender deletes zero length bones, keep the default for children on top of their parent
+    apart = numpy.linalg.norm(childHeads - heads[hasChild], axis=1) > 1e-4
+    tails[hasChild[apart]] = childHeads[apart]
+    return tails
 
-        # Keep reference to the created bone
-        self.blender_bone = edit_bone
-        return edit_bone
 
-    def apply_transform(self, armature_obj: Any) -> None:
-        """Apply the bone's transformation matrix in pose mode"""
-        if not self.matrix:
-            return
-
-        # Switch to pose mode
-        bpy.ops.object.mode_set(mode='POSE')
-
-        # Get the pose bone
-        if self.name in armature_obj.pose.bones:
-            pose_bone = armature_obj.pose.bones[self.name]
-
-            # Apply the matrix as a pose transformation
-            # Might need conversion from global to local space
-            from mathutils import Matrix
-
-            if self.matrix:
-                # Calculate local transformation
-                if pose_bone.parent:
-                    local_matrix = pose_bone.parent.matrix.inverted() @ self.matrix
-                else:
-                    local_matrix = self.matrix
-
-                pose_bone.matrix = local_matrix
-
-
-def create_armature_from_bones(bone_list: list, name: str = "Armature") -> Any:
-    """Create a Blender armature from a list of Bone objects"""
+def create_armature_from_bones(bone_list: list, name: str = "Armature", collection: Any = None,
+                               matrices: Any = None, tail_length: float = 5.0) -> Any:
+    """Create a Blender armature from a list of Bone objects, entering edit mode only once"""
     import bpy
+    import numpy
 
     # Create a new armature data object
     armature = bpy.data.armatures.new(name)
@@ -277,37 +257,41 @@ def create_armature_from_bones(bone_list: list, name: str = "Armature") -> Any:
     armature_obj = bpy.data.objects.new(name, armature)
 
     # Add the armature to the scene
-    bpy.context.collection.objects.link(armature_obj)
+    if collection is None:
+        collection = bpy.context.collection
+    collection.objects.link(armature_obj)
 
     # Select the armature object
     bpy.context.view_layer.objects.active = armature_obj
     armature_obj.select_set(True)
 
+    # Work out every head, tail and parent before touching Blender
+    if matrices is not None and len(matrices) == len(bone_list):
+        heads = numpy.asarray(matrices)[:, :3, 3]
+    else:
+        heads = numpy.array([bone.getPosition() for bone in bone_list],
+                            dtype=numpy.float64).reshape(-1, 3)
+    parents, children = getBoneHierarchy(bone_list)
+    tails = getBoneTails(heads, children, tail_length).tolist()
+    heads = heads.tolist()
+    parents = parents.tolist()
+
     # Enter edit mode
     bpy.ops.object.mode_set(mode='EDIT')
 
-    # Create map for parent lookup
-    bone_map = {bone.index: bone for bone in bone_list}
-
-    # First create all bones
-    for bone in bone_list:
-        edit_bone = armature.edit_bones.new(bone.name)
-
-        # Set position from translation or matrix
-        if bone.position:
-            edit_bone.head = bone.position
-            # Set a default length for the bone
-            edit_bone.tail = (
-                bone.position[0],
-                bone.position[1],
-                bone.position[2] + bone.size_multiplier
-            )
-
-        # Set parent if available
-        if bone.parentIndex >= 0 and bone.parentIndex in bone_map:
-            parent_name = bone_map[bone.parentIndex].name
-            if parent_name in armature.edit_bones:
-                edit_bone.parent = armature.edit_bones[parent_name]
+    # First create all bones, then link them so parents may come after their children
+    edit_bones = [armature.edit_bones.new(bone.name) for bone in bone_list]
+    for row, edit_bone in enumerate(edit_bones):
+        edit_bone.head = heads[row]
+        edit_bone.tail = tails[row]
+
+        # Roll the bone's Z axis onto the one of its matrix
+        matrix = bone_list[row].matrix
+        if matrix is not None:
+            edit_bone.align_roll(matrix[:3, 2].tolist())
+
+        if parents[row] >= 0:
+            edit_bone.parent = edit_bones[parents[row]]
 
     # Return to object mode
     bpy.ops.object.mode_set(mode='OBJECT')